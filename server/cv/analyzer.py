@@ -6,9 +6,31 @@ from typing import Dict, List, Any, Optional, Tuple
 import numpy as np
 import cv2
 
+from landmarks import (
+    JOINT_INDEX,
+    LANDMARK_INDEX,
+    joint_angles,
+    landmark_angles,
+    landmark_array,
+)
+
 logger = logging.getLogger(__name__)
 
 
+# Shared by the per-frame and batch paths so both give identical scores;
+# math.atan2 and ``x ** 2`` can differ from NumPy's in the last bit.
+def _back_angle(dx, dy):
+    """Torso lean in degrees from the shoulder->hip offset; scalars or arrays."""
+    return np.abs(90 - np.abs(np.degrees(np.arctan2(dx, dy))))
+
+
+def _center_distance(dx, dy):
+    return np.sqrt(dx * dx + dy * dy)
+
+
+VEHICLE_CLASSES = ["car", "truck", "bus"]
+
+
 class RidingAnalyzer:
     def __init__(self):
         self.scoring_weights = {
@@ -39,12 +61,16 @@ class RidingAnalyzer:
         detections: List[Dict],
         pose_keypoints: Dict,
         scene_analysis: Dict,
+        image_width: Optional[float] = None,
     ) -> Dict[str, Any]:
         try:
+            # Pixel thresholds assume source-frame boxes; ``image_width`` is
+            # the source width when ``image`` was downscaled while decoding
+            image_width = image_width or image.shape[1]
             motorcycle_det, rider_det = self._find_motorcycle_and_rider(detections)
             posture_score = self._analyze_posture(pose_keypoints, rider_det)
             lane_score = self._analyze_lane_position(
-                image, motorcycle_det, scene_analysis
+                image_width, motorcycle_det, scene_analysis
             )
             speed_score = self._analyze_speed_appropriateness(
                 detections, scene_analysis
@@ -86,6 +112,330 @@ class RidingAnalyzer:
                 "detailed_feedback": [],
             }
 
+    def analyze_batch(
+        self,
+        landmarks: np.ndarray,
+        motorcycle_boxes: np.ndarray,
+        image_widths: np.ndarray,
+        scene: Dict[str, np.ndarray],
+        vehicle_boxes: Optional[np.ndarray] = None,
+        vehicle_frames: Optional[np.ndarray] = None,
+    ) -> Dict[str, Any]:
+        """Score N frames at once from columnar inputs.
+
+        Args:
+            landmarks: (N, 33, 4) MediaPipe-order x, y, z, visibility; an
+                all-NaN frame means no pose result at all
+            motorcycle_boxes: (N, 4) x1, y1, x2, y2 of each frame's most
+                confident motorcycle, NaN where there is none
+            image_widths: (N,) frame widths in pixels
+            scene: per-frame arrays for ``weather_condition``,
+                ``road_condition``, ``traffic_density``, ``time_of_day`` and
+                ``lane_count``
+            vehicle_boxes: (M, 4) car/truck/bus boxes across all frames
+            vehicle_frames: (M,) frame index of each vehicle box
+
+        Returns:
+            The integer scores of ``analyze_riding_technique`` as (N,) arrays,
+            plus the unrounded component scores under ``components``. Scores
+            are identical to the per-frame path; feedback text is not built.
+        """
+        landmarks = np.asarray(landmarks, dtype=np.float64)
+        motorcycle_boxes = np.asarray(motorcycle_boxes, dtype=np.float64)
+        frames = len(landmarks)
+        image_widths = np.broadcast_to(
+            np.asarray(image_widths, dtype=np.float64), (frames,)
+        )
+        if vehicle_boxes is None:
+            vehicle_boxes = np.zeros((0, 4), np.float32)
+            vehicle_frames = np.zeros(0, np.int64)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            posture = self._posture_batch(landmarks)
+            lane = self._lane_position_batch(
+                motorcycle_boxes, image_widths, scene["lane_count"]
+            )
+            vehicle_counts = np.bincount(vehicle_frames, minlength=frames)
+            speed = self._speed_batch(scene, vehicle_counts)
+            safety = self._safety_margins_batch(
+                motorcycle_boxes, vehicle_boxes, vehicle_frames
+            )
+
+        overall = np.clip(
+            self.scoring_weights["posture"] * posture
+            + self.scoring_weights["lane_position"] * lane
+            + self.scoring_weights["speed"] * speed
+            + self.scoring_weights["safety_margin"] * safety,
+            0.0,
+            100.0,
+        )
+
+        return {
+            "overall_score": overall.astype(np.int64),
+            "posture_score": posture.astype(np.int64),
+            "lane_score": lane.astype(np.int64),
+            "speed_score": speed.astype(np.int64),
+            "safety_score": safety.astype(np.int64),
+            "components": {
+                "overall": overall,
+                "posture": posture,
+                "lane": lane,
+                "speed": speed,
+                "safety": safety,
+            },
+        }
+
+    def columnar_inputs(
+        self,
+        detections: List[List[Dict]],
+        poses: List[Dict],
+        scenes: List[Dict],
+        image_widths: List[int],
+    ) -> Dict[str, Any]:
+        """Convert per-frame analyzer inputs into ``analyze_batch`` arguments."""
+        frames = len(poses)
+        landmarks = np.zeros((frames, 33, 4), dtype=np.float64)
+        motorcycle_boxes = np.full((frames, 4), np.nan)
+        vehicle_boxes, vehicle_frames = [], []
+
+        for i, (frame_detections, pose) in enumerate(zip(detections, poses)):
+            if not pose or "landmarks" not in pose:
+                landmarks[i] = np.nan
+            else:
+                landmarks[i] = landmark_array(pose["landmarks"])
+
+            motorcycle_det, _ = self._find_motorcycle_and_rider(frame_detections)
+            if motorcycle_det is not None:
+                motorcycle_boxes[i] = motorcycle_det["bbox"]
+            for detection in frame_detections:
+                if detection["class_name"] in VEHICLE_CLASSES:
+                    vehicle_boxes.append(detection["bbox"])
+                    vehicle_frames.append(i)
+
+        defaults = {
+            "weather_condition": "clear",
+            "road_condition": "dry",
+            "traffic_density": "light",
+            "time_of_day": "day",
+            "lane_count": 2,
+        }
+        return {
+            "landmarks": landmarks,
+            "motorcycle_boxes": motorcycle_boxes,
+            "image_widths": np.asarray(image_widths),
+            "scene": {
+                key: np.array([scene.get(key, default) for scene in scenes])
+                for key, default in defaults.items()
+            },
+            "vehicle_boxes": np.array(vehicle_boxes, dtype=np.float32).reshape(-1, 4),
+            "vehicle_frames": np.array(vehicle_frames, dtype=np.int64),
+        }
+
+    def _posture_batch(self, landmarks: np.ndarray) -> np.ndarray:
+        def point(name: str) -> Tuple[np.ndarray, np.ndarray]:
+            index = LANDMARK_INDEX[name]
+            return landmarks[:, index, 0], landmarks[:, index, 1]
+
+        def visible(*names: str) -> np.ndarray:
+            indices = [LANDMARK_INDEX[name] for name in names]
+            return np.all(landmarks[:, indices, 3] > 0.5, axis=1)
+
+        left_shoulder, right_shoulder = point("left_shoulder"), point("right_shoulder")
+        left_hip, right_hip = point("left_hip"), point("right_hip")
+
+        shoulder_center_x = (left_shoulder[0] + right_shoulder[0]) / 2
+        shoulder_center_y = (left_shoulder[1] + right_shoulder[1]) / 2
+        hip_center_x = (left_hip[0] + right_hip[0]) / 2
+        hip_center_y = (left_hip[1] + right_hip[1]) / 2
+        back_angle = _back_angle(
+            hip_center_x - shoulder_center_x, hip_center_y - shoulder_center_y
+        )
+
+        angles = joint_angles(landmarks)
+        knee_angle = angles[:, JOINT_INDEX["left_knee"]]
+        knee_angle = np.where(np.isnan(knee_angle), 125.0, knee_angle)
+        elbow_angle = angles[:, JOINT_INDEX["left_elbow"]]
+        elbow_angle = np.where(np.isnan(elbow_angle), 110.0, elbow_angle)
+
+        nose = point("nose")
+        horizontal_offset = np.abs(nose[0] - shoulder_center_x)
+        vertical_position = np.where(
+            shoulder_center_y > 0, nose[1] / shoulder_center_y, 1.0
+        )
+        alignment_score = np.maximum(0, 100 - horizontal_offset * 500)
+        position_score = np.where(
+            (0.7 <= vertical_position) & (vertical_position <= 0.9), 100, 80
+        )
+        head_score = (alignment_score + position_score) / 2
+
+        score = np.full(len(landmarks), 100.0)
+        score = np.where(
+            visible("left_shoulder", "left_hip", "right_shoulder", "right_hip"),
+            score
+            * (
+                0.4
+                * (
+                    self._score_angle_batch(
+                        back_angle, self.ideal_posture["back_angle"]
+                    )
+                    / 100.0
+                )
+            ),
+            score,
+        )
+        score = np.where(
+            visible("left_knee", "left_hip", "left_ankle"),
+            score
+            + 0.3
+            * self._score_angle_batch(knee_angle, self.ideal_posture["knee_angle"]),
+            score,
+        )
+        score = np.where(
+            visible("left_shoulder", "left_elbow", "left_wrist"),
+            score
+            + 0.2
+            * self._score_angle_batch(elbow_angle, self.ideal_posture["elbow_angle"]),
+            score,
+        )
+        score = np.where(
+            visible("nose", "left_shoulder", "right_shoulder"),
+            score + 0.1 * head_score,
+            score,
+        )
+
+        # Frames without any pose result score like a missing landmarks dict
+        no_pose = np.all(np.isnan(landmarks), axis=(1, 2))
+        return np.where(no_pose, 60.0, np.clip(score, 0.0, 100.0))
+
+    def _score_angle_batch(
+        self, angles: np.ndarray, ideal_params: Dict[str, float]
+    ) -> np.ndarray:
+        ideal = ideal_params["ideal"]
+        min_acceptable = ideal_params["min"]
+        max_acceptable = ideal_params["max"]
+
+        max_deviation = max(ideal - min_acceptable, max_acceptable - ideal)
+        in_range = 100.0 - (np.abs(angles - ideal) / max_deviation) * 20.0
+        penalty = np.where(
+            angles < min_acceptable,
+            (min_acceptable - angles) / min_acceptable * 50.0,
+            (angles - max_acceptable) / max_acceptable * 50.0,
+        )
+
+        return np.where(
+            (min_acceptable <= angles) & (angles <= max_acceptable),
+            in_range,
+            np.maximum(0.0, 80.0 - penalty),
+        )
+
+    def _lane_position_batch(
+        self,
+        motorcycle_boxes: np.ndarray,
+        image_widths: np.ndarray,
+        lane_counts: np.ndarray,
+    ) -> np.ndarray:
+        acceptable = self.lane_analysis["acceptable_range"]
+        warning = self.lane_analysis["warning_range"]
+        lane_counts = np.asarray(lane_counts, dtype=np.float64)
+
+        bike_center_x = (motorcycle_boxes[:, 0] + motorcycle_boxes[:, 2]) / 2
+        normalized_position = bike_center_x / image_widths
+        current_lane = np.trunc(normalized_position * lane_counts)
+        lane_center = (current_lane + 0.5) / lane_counts
+        deviation = np.abs(normalized_position - lane_center)
+
+        score = np.where(
+            deviation <= acceptable,
+            100.0 - (deviation / acceptable) * 20.0,
+            np.where(
+                deviation <= warning,
+                80.0 - ((deviation - acceptable) / (warning - acceptable)) * 30.0,
+                50.0 - np.minimum(30.0, (deviation - warning) * 100.0),
+            ),
+        )
+
+        valid = (
+            ~np.isnan(motorcycle_boxes).any(axis=1)
+            & (image_widths != 0)
+            & (lane_counts != 0)
+        )
+        return np.where(valid, np.clip(score, 0.0, 100.0), 70.0)
+
+    def _speed_batch(
+        self, scene: Dict[str, np.ndarray], vehicle_counts: np.ndarray
+    ) -> np.ndarray:
+        base_score = np.full(len(vehicle_counts), 80.0)
+        base_score -= np.where(
+            np.isin(scene["weather_condition"], ["rain", "snow", "fog"]), 10.0, 0.0
+        )
+        base_score -= np.where(
+            np.isin(scene["road_condition"], ["wet", "icy"]), 15.0, 0.0
+        )
+
+        traffic_density = scene["traffic_density"]
+        base_score -= np.where(traffic_density == "heavy", 10.0, 0.0)
+        base_score -= np.where(traffic_density == "congested", 20.0, 0.0)
+
+        base_score -= np.where(
+            np.isin(scene["time_of_day"], ["dawn", "dusk", "night"]), 5.0, 0.0
+        )
+
+        base_score -= np.where(
+            vehicle_counts > 3, np.minimum(15.0, vehicle_counts * 2.0), 0.0
+        )
+        return np.clip(base_score, 20.0, 100.0)
+
+    def _safety_margins_batch(
+        self,
+        motorcycle_boxes: np.ndarray,
+        vehicle_boxes: np.ndarray,
+        vehicle_frames: np.ndarray,
+    ) -> np.ndarray:
+        frames = len(motorcycle_boxes)
+        has_motorcycle = ~np.isnan(motorcycle_boxes).any(axis=1)
+
+        # Areas the way DetectionResult computes them, in the boxes' dtype
+        vehicle_areas = (vehicle_boxes[:, 2] - vehicle_boxes[:, 0]) * (
+            vehicle_boxes[:, 3] - vehicle_boxes[:, 1]
+        )
+        vehicle_boxes = vehicle_boxes.astype(np.float64)
+        vehicle_areas = vehicle_areas.astype(np.float64)
+
+        bike = motorcycle_boxes[vehicle_frames]
+        bike_area = (bike[:, 2] - bike[:, 0]) * (bike[:, 3] - bike[:, 1])
+        offset_x = (bike[:, 0] + bike[:, 2]) / 2 - (
+            vehicle_boxes[:, 0] + vehicle_boxes[:, 2]
+        ) / 2
+        offset_y = (bike[:, 1] + bike[:, 3]) / 2 - (
+            vehicle_boxes[:, 1] + vehicle_boxes[:, 3]
+        ) / 2
+        distance = _center_distance(offset_x, offset_y)
+        size_ratio = np.where(bike_area > 0, vehicle_areas / bike_area, 0.0)
+
+        # Rank vehicles by distance within each frame; ties keep input order
+        order = np.lexsort((np.arange(len(distance)), distance, vehicle_frames))
+        sorted_frames = vehicle_frames[order]
+        first = np.searchsorted(sorted_frames, np.arange(frames))
+        rank = np.arange(len(order)) - first[sorted_frames]
+
+        min_safe_distance = 50.0 + (size_ratio[order] * 30.0)
+        sorted_distance = distance[order]
+        penalty = (1.0 - sorted_distance / min_safe_distance) * 40.0
+        penalties = np.zeros((frames, 3))
+        closest = (rank < 3) & (sorted_distance < min_safe_distance)
+        penalties[sorted_frames[closest], rank[closest]] = penalty[closest] / (
+            rank[closest] + 1
+        )
+
+        base_score = 100.0 - penalties[:, 0] - penalties[:, 1] - penalties[:, 2]
+
+        counts = np.bincount(vehicle_frames, minlength=frames)
+        nearest = np.full(frames, np.nan)
+        nearest[sorted_frames[rank == 0]] = sorted_distance[rank == 0]
+        base_score += np.where(counts == 0, 10.0, np.where(nearest > 100, 5.0, 0.0))
+
+        return np.where(has_motorcycle, np.clip(base_score, 0.0, 100.0), 70.0)
+
     def _find_motorcycle_and_rider(
         self, detections: List[Dict]
     ) -> Tuple[Optional[Dict], Optional[Dict]]:
@@ -115,6 +465,8 @@ class RidingAnalyzer:
         score = 100.0
 
         try:
+            angles = landmark_angles(landmarks)
+
             if self._has_keypoints(
                 landmarks, ["left_shoulder", "left_hip", "right_shoulder", "right_hip"]
             ):
@@ -125,7 +477,7 @@ class RidingAnalyzer:
                 score *= 0.4 * (back_score / 100.0)
 
             if self._has_keypoints(landmarks, ["left_knee", "left_hip", "left_ankle"]):
-                knee_angle = self._calculate_knee_angle(landmarks)
+                knee_angle = self._joint_angle(angles, "left_knee", 125.0)
                 knee_score = self._score_angle(
                     knee_angle, self.ideal_posture["knee_angle"]
                 )
@@ -134,7 +486,7 @@ class RidingAnalyzer:
             if self._has_keypoints(
                 landmarks, ["left_shoulder", "left_elbow", "left_wrist"]
             ):
-                elbow_angle = self._calculate_elbow_angle(landmarks)
+                elbow_angle = self._joint_angle(angles, "left_elbow", 110.0)
                 elbow_score = self._score_angle(
                     elbow_angle, self.ideal_posture["elbow_angle"]
                 )
@@ -153,7 +505,7 @@ class RidingAnalyzer:
         return max(0.0, min(100.0, score))
 
     def _analyze_lane_position(
-        self, image: np.ndarray, motorcycle_det: Optional[Dict], scene_analysis: Dict
+        self, image_width: float, motorcycle_det: Optional[Dict], scene_analysis: Dict
     ) -> float:
         if not motorcycle_det:
             logger.warning("No motorcycle detected for lane analysis")
@@ -162,8 +514,6 @@ class RidingAnalyzer:
         try:
             bbox = motorcycle_det["bbox"]
             bike_center_x = (bbox[0] + bbox[2]) / 2
-            image_width = image.shape[1]
-
             normalized_position = bike_center_x / image_width
 
             lane_count = scene_analysis.get("lane_count", 2)
@@ -401,65 +751,15 @@ class RidingAnalyzer:
 
             dx = hip_center[0] - shoulder_center[0]
             dy = hip_center[1] - shoulder_center[1]
-            angle = math.degrees(math.atan2(dx, dy))
-
-            return abs(90 - abs(angle))
+            return float(_back_angle(dx, dy))
 
         except Exception as e:
             logger.error(f"Back angle calculation error: {e}")
             return 80.0
 
-    def _calculate_knee_angle(self, landmarks: Dict) -> float:
-        try:
-            hip = landmarks["left_hip"]
-            knee = landmarks["left_knee"]
-            ankle = landmarks["left_ankle"]
-
-            v1 = [hip["x"] - knee["x"], hip["y"] - knee["y"]]
-            v2 = [ankle["x"] - knee["x"], ankle["y"] - knee["y"]]
-
-            dot_product = v1[0] * v2[0] + v1[1] * v2[1]
-            mag_v1 = math.sqrt(v1[0] ** 2 + v1[1] ** 2)
-            mag_v2 = math.sqrt(v2[0] ** 2 + v2[1] ** 2)
-
-            if mag_v1 * mag_v2 == 0:
-                return 125.0
-
-            cos_angle = dot_product / (mag_v1 * mag_v2)
-            cos_angle = max(-1.0, min(1.0, cos_angle))
-            angle = math.degrees(math.acos(cos_angle))
-
-            return angle
-
-        except Exception as e:
-            logger.error(f"Knee angle calculation error: {e}")
-            return 125.0
-
-    def _calculate_elbow_angle(self, landmarks: Dict) -> float:
-        try:
-            shoulder = landmarks["left_shoulder"]
-            elbow = landmarks["left_elbow"]
-            wrist = landmarks["left_wrist"]
-
-            v1 = [shoulder["x"] - elbow["x"], shoulder["y"] - elbow["y"]]
-            v2 = [wrist["x"] - elbow["x"], wrist["y"] - elbow["y"]]
-
-            dot_product = v1[0] * v2[0] + v1[1] * v2[1]
-            mag_v1 = math.sqrt(v1[0] ** 2 + v1[1] ** 2)
-            mag_v2 = math.sqrt(v2[0] ** 2 + v2[1] ** 2)
-
-            if mag_v1 * mag_v2 == 0:
-                return 110.0
-
-            cos_angle = dot_product / (mag_v1 * mag_v2)
-            cos_angle = max(-1.0, min(1.0, cos_angle))
-            angle = math.degrees(math.acos(cos_angle))
-
-            return angle
-
-        except Exception as e:
-            logger.error(f"Elbow angle calculation error: {e}")
-            return 110.0
+    def _joint_angle(self, angles: np.ndarray, joint: str, default: float) -> float:
+        angle = float(angles[JOINT_INDEX[joint]])
+        return default if math.isnan(angle) else angle
 
     def _analyze_head_position(self, landmarks: Dict) -> float:
         try:
@@ -507,6 +807,4 @@ class RidingAnalyzer:
         center1 = [(bbox1[0] + bbox1[2]) / 2, (bbox1[1] + bbox1[3]) / 2]
         center2 = [(bbox2[0] + bbox2[2]) / 2, (bbox2[1] + bbox2[3]) / 2]
 
-        return math.sqrt(
-            (center1[0] - center2[0]) ** 2 + (center1[1] - center2[1]) ** 2
-        )
+        return float(_center_distance(center1[0] - center2[0], center1[1] - center2[1]))
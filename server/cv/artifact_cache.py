@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from importlib import metadata
+from typing import Callable, Dict, Any, Iterator, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Libraries whose version changes what an exported or optimized model contains
+_RUNTIME_PACKAGES = ("torch", "ultralytics", "onnx", "onnxruntime")
+
+
+def runtime_versions() -> Dict[str, str]:
+    versions = {"python": platform.python_version(), "machine": platform.machine()}
+    for package in _RUNTIME_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            continue
+    return versions
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """On-disk cache of model weights and their exported/optimized forms.
+
+    Weights are kept under ``weights/`` so later starts never download them.
+    Derived artifacts (ONNX exports, quantized graphs, ...) live in one
+    directory per key, built from the weights hash, the runtime library
+    versions, the artifact kind and the input shape, with a ``meta.json``
+    describing how they were made. Builds are serialized with a file lock,
+    so worker processes starting together export only once.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(os.path.join(self.root, "weights"), exist_ok=True)
+        self.versions = runtime_versions()
+        self._hashes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "builds": 0, "weights_fetched": 0}
+
+    def weights(self, model_path: str) -> str:
+        """Local path of ``model_path``, fetching it into the cache once."""
+        if os.path.exists(model_path):
+            return model_path
+
+        cached = os.path.join(self.root, "weights", os.path.basename(model_path))
+        if os.path.exists(cached):
+            return cached
+
+        with self._file_lock(f"weights-{os.path.basename(model_path)}"):
+            if not os.path.exists(cached):
+                from ultralytics.utils.downloads import attempt_download_asset
+
+                downloaded = attempt_download_asset(model_path)
+                shutil.copy2(downloaded, cached + ".tmp")
+                os.replace(cached + ".tmp", cached)
+                self._count("weights_fetched")
+                logger.info(f"Cached weights {model_path} at {cached}")
+        return cached
+
+    def key(
+        self,
+        weights_path: str,
+        kind: str,
+        input_shape: Sequence[int],
+        options: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        description = json.dumps(
+            {
+                "weights_sha256": self._weights_hash(weights_path),
+                "kind": kind,
+                "input_shape": list(input_shape),
+                "options": options or {},
+                "versions": self.versions,
+            },
+            sort_keys=True,
+        )
+        return f"{kind}-{hashlib.sha256(description.encode()).hexdigest()[:16]}"
+
+    def artifact(
+        self,
+        weights_path: str,
+        kind: str,
+        input_shape: Sequence[int],
+        build: Callable[[str], str],
+        options: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Path of the cached artifact, running ``build`` only on a miss.
+
+        ``build`` gets a scratch directory, writes the artifact there and
+        returns its path; the file is moved into the cache.
+        """
+        key = self.key(weights_path, kind, input_shape, options)
+        directory = os.path.join(self.root, key)
+        meta_path = os.path.join(directory, "meta.json")
+
+        cached = self._read_artifact(directory, meta_path)
+        if cached is not None:
+            self._count("hits")
+            return cached
+
+        with self._file_lock(key):
+            cached = self._read_artifact(directory, meta_path)
+            if cached is not None:
+                self._count("hits")
+                return cached
+
+            start = time.time()
+            scratch = tempfile.mkdtemp(prefix=f".build-{key}-", dir=self.root)
+            try:
+                built = build(scratch)
+                os.makedirs(directory, exist_ok=True)
+                target = os.path.join(directory, os.path.basename(built))
+                shutil.move(built, target)
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+            meta = {
+                "file": os.path.basename(target),
+                "kind": kind,
+                "input_shape": list(input_shape),
+                "options": options or {},
+                "source": os.path.basename(weights_path),
+                "weights_sha256": self._weights_hash(weights_path),
+                "versions": self.versions,
+                "build_seconds": time.time() - start,
+                "created": time.time(),
+            }
+            # meta.json is written last and atomically; it marks the entry valid
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump(meta, f, indent=2)
+            os.replace(meta_path + ".tmp", meta_path)
+
+        self._count("builds")
+        logger.info(f"Built {kind} artifact {key} in {meta['build_seconds']:.1f}s")
+        return target
+
+    def metadata(self, artifact_path: str) -> Dict[str, Any]:
+        with open(os.path.join(os.path.dirname(artifact_path), "meta.json")) as f:
+            return json.load(f)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "root": self.root}
+
+    def _read_artifact(self, directory: str, meta_path: str) -> Optional[str]:
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            path = os.path.join(directory, json.load(f)["file"])
+        return path if os.path.exists(path) else None
+
+    def _weights_hash(self, weights_path: str) -> str:
+        stat = os.stat(weights_path)
+        memo_key = f"{os.path.abspath(weights_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        with self._lock:
+            if memo_key not in self._hashes:
+                self._hashes[memo_key] = file_sha256(weights_path)
+            return self._hashes[memo_key]
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    @contextmanager
+    def _file_lock(self, name: str) -> Iterator[None]:
+        with open(os.path.join(self.root, f".{name}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
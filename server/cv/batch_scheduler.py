@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from detector import DetectionResult, ObjectDetector
+
+logger = logging.getLogger(__name__)
+
+# (image, class-id allow-list, result future, enqueue time)
+_PendingFrame = Tuple[np.ndarray, Optional[Sequence[int]], Future, float]
+
+
+class DetectionBatcher:
+    """Coalesce concurrent detect_objects calls into batched YOLO passes.
+
+    Request threads call ``detect`` and block on a future; a single worker
+    thread waits up to ``window_ms`` after the first pending frame (or until
+    ``max_batch_size`` frames are queued) and runs one batched predict.
+    """
+
+    def __init__(
+        self,
+        detector: ObjectDetector,
+        max_batch_size: int = 8,
+        window_ms: float = 5.0,
+        max_queue_wait_ms: float = 1000.0,
+    ):
+        self.detector = detector
+        self.max_batch_size = max(1, max_batch_size)
+        self.window_ms = max(0.0, window_ms)
+        self.max_queue_wait_ms = max_queue_wait_ms
+
+        self._queue: "queue.Queue[_PendingFrame]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "total_batches": 0,
+            "total_frames": 0,
+            "last_batch_size": 0,
+            "average_batch_size": 0.0,
+            "average_queue_wait_ms": 0.0,
+            "observed_max_queue_wait_ms": 0.0,
+            "average_inference_ms": 0.0,
+            "timed_out_frames": 0,
+        }
+
+        self._running = True
+        self._worker = threading.Thread(
+            target=self._run, name="detection-batcher", daemon=True
+        )
+        self._worker.start()
+
+        logger.info(
+            f"DetectionBatcher started (max_batch_size={self.max_batch_size}, "
+            f"window_ms={self.window_ms})"
+        )
+
+    def detect(
+        self, image: np.ndarray, class_ids: Optional[Sequence[int]] = None
+    ) -> DetectionResult:
+        future: Future = Future()
+        self._queue.put((image, class_ids, future, time.perf_counter()))
+
+        timeout = (self.max_queue_wait_ms + self.window_ms) / 1000.0 + 30.0
+        return future.result(timeout=timeout)
+
+    def _run(self):
+        while self._running:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.perf_counter() + self.window_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._process_batch(batch)
+
+    def _process_batch(self, batch: List[_PendingFrame]):
+        dispatch_time = time.perf_counter()
+        live = []
+        for image, class_ids, future, enqueued_at in batch:
+            wait_ms = (dispatch_time - enqueued_at) * 1000
+            if wait_ms > self.max_queue_wait_ms:
+                # Caller has most likely given up; don't spend inference on it
+                future.set_exception(
+                    TimeoutError(f"Frame waited {wait_ms:.1f}ms in detection queue")
+                )
+                with self._stats_lock:
+                    self.stats["timed_out_frames"] += 1
+                continue
+            live.append((image, class_ids, future, wait_ms))
+
+        if not live:
+            return
+
+        try:
+            results = self.detector.detect_objects_batch(
+                [item[0] for item in live], [item[1] for item in live]
+            )
+        except Exception as e:
+            logger.error(f"Batched detection failed: {e}")
+            results = [self.detector.empty_result(item[0]) for item in live]
+
+        inference_ms = (time.perf_counter() - dispatch_time) * 1000
+
+        for (_, _, future, _), detections in zip(live, results):
+            future.set_result(detections)
+
+        self._update_stats(len(live), [item[3] for item in live], inference_ms)
+
+    def _update_stats(
+        self, batch_size: int, wait_times_ms: List[float], inference_ms: float
+    ):
+        alpha = 0.1
+        mean_wait = sum(wait_times_ms) / len(wait_times_ms)
+
+        with self._stats_lock:
+            stats = self.stats
+            first = stats["total_batches"] == 0
+            stats["total_batches"] += 1
+            stats["total_frames"] += batch_size
+            stats["last_batch_size"] = batch_size
+            stats["observed_max_queue_wait_ms"] = max(
+                stats["observed_max_queue_wait_ms"], max(wait_times_ms)
+            )
+            for key, value in (
+                ("average_batch_size", float(batch_size)),
+                ("average_queue_wait_ms", mean_wait),
+                ("average_inference_ms", inference_ms),
+            ):
+                stats[key] = (
+                    value if first else alpha * value + (1 - alpha) * stats[key]
+                )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update(
+            {
+                "max_batch_size": self.max_batch_size,
+                "window_ms": self.window_ms,
+                "max_queue_wait_ms": self.max_queue_wait_ms,
+                "queue_depth": self._queue.qsize(),
+            }
+        )
+        return stats
+
+    def shutdown(self):
+        self._running = False
+        self._worker.join(timeout=1.0)
+        logger.info("DetectionBatcher stopped")
@@ -0,0 +1,872 @@
+#!/usr/bin/env python3
+
+"""
+Micro-benchmarks for the ML service hot paths.
+
+Run from server/cv, e.g. ``python benchmark.py transport --image frame.jpg``.
+Each subcommand prints a small table; without ``--image`` a synthetic frame
+is generated so the numbers are comparable between hosts.
+"""
+
+import argparse
+import base64
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+
+def load_frame(path: Optional[str], width: int = 1280, height: int = 720) -> np.ndarray:
+    if path:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise SystemExit(f"Could not read image: {path}")
+        return image
+
+    # Smooth gradients plus noise compress roughly like real road footage
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noise = rng.normal(0, 12, size=base.shape)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def encode_jpeg(image: np.ndarray, quality: int = 80) -> bytes:
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise SystemExit("JPEG encoding failed")
+    return buffer.tobytes()
+
+
+def time_call(
+    fn: Callable[[], object], iterations: int, warmup: int = 3
+) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+
+    samples: List[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    return {
+        "mean_ms": sum(samples) / len(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def print_table(rows: List[Dict[str, object]]):
+    if not rows:
+        return
+    headers = list(rows[0].keys())
+    widths = {h: max(len(h), *(len(_fmt(r[h])) for r in rows)) for h in headers}
+    print("  ".join(h.ljust(widths[h]) for h in headers))
+    for row in rows:
+        print("  ".join(_fmt(row[h]).ljust(widths[h]) for h in headers))
+
+
+def _fmt(value: object) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+def bench_transport(args: argparse.Namespace):
+    """Compare base64-in-JSON against raw octet-stream payloads for /analyze."""
+    jpeg = encode_jpeg(load_frame(args.image))
+    config = {"client_id": "bench-client", "timestamp": 0}
+
+    json_body = json.dumps(
+        {"image_data": base64.b64encode(jpeg).decode("ascii"), "config": config}
+    ).encode("utf-8")
+    config_header = json.dumps(config)
+
+    def json_path():
+        data = json.loads(json_body)
+        raw = base64.b64decode(data["image_data"])
+        return cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+
+    def binary_path():
+        json.loads(config_header)
+        return cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+
+    def json_overhead():
+        base64.b64decode(json.loads(json_body)["image_data"])
+
+    def binary_overhead():
+        np.frombuffer(jpeg, np.uint8)
+
+    rows = []
+    for name, body_size, full, overhead in (
+        ("json+base64", len(json_body), json_path, json_overhead),
+        ("octet-stream", len(jpeg) + len(config_header), binary_path, binary_overhead),
+    ):
+        total = time_call(full, args.iterations)
+        parse = time_call(overhead, args.iterations)
+        rows.append(
+            {
+                "transport": name,
+                "bytes": body_size,
+                "parse_ms": parse["mean_ms"],
+                "parse+decode_ms": total["mean_ms"],
+                "p95_ms": total["p95_ms"],
+            }
+        )
+
+    print(f"JPEG payload: {len(jpeg)} bytes")
+    print_table(rows)
+    saved = rows[0]["bytes"] - rows[1]["bytes"]
+    print(f"Saved per frame: {saved} bytes ({saved / rows[0]['bytes']:.1%})")
+
+
+def _run_concurrent(
+    detect: Callable[[np.ndarray], object], frame: np.ndarray, clients: int, frames: int
+) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(lambda _: detect(frame), range(frames)))
+    return frames / (time.perf_counter() - start)
+
+
+def bench_batching(args: argparse.Namespace):
+    """Frames/sec of direct vs micro-batched detection under concurrent clients."""
+    from detector import ObjectDetector
+    from batch_scheduler import DetectionBatcher
+
+    frame = load_frame(args.image)
+    detector = ObjectDetector(device=args.device)
+    batcher = DetectionBatcher(
+        detector, max_batch_size=args.max_batch_size, window_ms=args.window_ms
+    )
+
+    rows = []
+    for clients in args.clients:
+        direct_fps = _run_concurrent(
+            detector.detect_objects, frame, clients, args.iterations
+        )
+        batched_fps = _run_concurrent(batcher.detect, frame, clients, args.iterations)
+        stats = batcher.get_stats()
+        rows.append(
+            {
+                "clients": clients,
+                "direct_fps": direct_fps,
+                "batched_fps": batched_fps,
+                "avg_batch": stats["average_batch_size"],
+                "avg_wait_ms": stats["average_queue_wait_ms"],
+            }
+        )
+
+    batcher.shutdown()
+    print_table(rows)
+
+
+def bench_stages(args: argparse.Namespace):
+    """Per-frame latency of sequential vs parallel detection/pose/scene stages."""
+    import os
+    from server import MLService
+
+    frame = load_frame(args.image)
+    rows = []
+    for parallel in (False, True):
+        os.environ["ML_PARALLEL_STAGES"] = str(parallel).lower()
+        service = MLService()
+        stage_totals: Dict[str, float] = {}
+
+        def run():
+            _, _, _, timings = service._run_stages(frame)
+            for name, elapsed in timings.items():
+                stage_totals[name] = stage_totals.get(name, 0.0) + elapsed
+
+        result = time_call(run, args.iterations)
+        calls = args.iterations + 3
+        row: Dict[str, object] = {"mode": "parallel" if parallel else "sequential"}
+        row.update({f"{k}_ms": v / calls for k, v in stage_totals.items()})
+        row.update({"frame_ms": result["mean_ms"], "p95_ms": result["p95_ms"]})
+        rows.append(row)
+
+    print_table(rows)
+
+
+def bench_workers(args: argparse.Namespace):
+    """End-to-end frames/sec of the multi-process worker pool for N workers."""
+    from worker_pool import WorkerPoolService
+
+    frame = load_frame(args.image)
+    rows = []
+    for num_workers in args.workers:
+        pool = WorkerPoolService(
+            num_workers, max_frame_pixels=frame.shape[0] * frame.shape[1]
+        )
+        pool.wait_until_ready()
+        _run_concurrent(pool.analyze_image, frame, num_workers, num_workers * 2)
+
+        clients = num_workers * 2
+        fps = _run_concurrent(pool.analyze_image, frame, clients, args.iterations)
+        rows.append(
+            {
+                "workers": num_workers,
+                "clients": clients,
+                "fps": fps,
+                "avg_latency_ms": pool.stats["average_processing_time"],
+            }
+        )
+        pool.shutdown()
+
+    print_table(rows)
+
+
+def bench_frame_context(args: argparse.Namespace):
+    """Colour-conversion cost per frame with and without a shared FrameContext."""
+    from frame_context import FrameContext
+
+    frame = load_frame(args.image, width=1920, height=1080)
+    road = frame[int(frame.shape[0] * 0.6) :, :]
+
+    def per_stage_conversions():
+        # What SceneAnalyzer and PoseEstimator each converted on their own
+        for _ in range(3):
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        cv2.cvtColor(road, cv2.COLOR_BGR2GRAY)
+        cv2.cvtColor(road, cv2.COLOR_BGR2HSV)
+        cv2.cvtColor(road, cv2.COLOR_BGR2GRAY)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def shared_context():
+        context = FrameContext(frame)
+        for _ in range(4):
+            context.gray
+        for _ in range(2):
+            context.hsv
+        context.gray[int(context.height * 0.6) :, :]
+        context.hsv[int(context.height * 0.6) :, :]
+        context.rgb
+
+    before = time_call(per_stage_conversions, args.iterations)
+    after = time_call(shared_context, args.iterations)
+    print(f"Frame: {frame.shape[1]}x{frame.shape[0]}")
+    print_table(
+        [
+            {"mode": "per-stage", **before},
+            {"mode": "FrameContext", **after},
+        ]
+    )
+    print(f"Saved per frame: {before['mean_ms'] - after['mean_ms']:.2f}ms")
+
+
+def bench_decode(args: argparse.Namespace):
+    """Full-resolution vs policy-driven reduced JPEG decode for 1080p and 4K."""
+    from frame_decoder import DecodePolicy, decode_frame
+
+    policy = DecodePolicy(target_long_side=args.target_size, max_pixels=args.max_pixels)
+    rows = []
+    for width, height in ((1920, 1080), (3840, 2160)):
+        jpeg = encode_jpeg(load_frame(args.image, width=width, height=height))
+        for name, active in (("full", None), ("policy", policy)):
+            image, _ = decode_frame(jpeg, active)
+            timing = time_call(lambda: decode_frame(jpeg, active), args.iterations)
+            rows.append(
+                {
+                    "source": f"{width}x{height}",
+                    "mode": name,
+                    "decoded": f"{image.shape[1]}x{image.shape[0]}",
+                    "frame_mb": image.nbytes / 1024 / 1024,
+                    "mean_ms": timing["mean_ms"],
+                    "p95_ms": timing["p95_ms"],
+                }
+            )
+
+    print_table(rows)
+
+
+def bench_pose(args: argparse.Namespace):
+    """CPU latency of the MediaPipe vs YOLOv8-pose backends, alone and with YOLO detection."""
+    from detector import ObjectDetector
+    from models.pose_estimator import PoseEstimator
+
+    frame = load_frame(args.image)
+    detector = ObjectDetector(device="cpu")
+    rows = []
+    for backend in ("mediapipe", "yolo"):
+        estimator = PoseEstimator(device="cpu", backend=backend)
+        pose = estimator.estimate_pose(frame)
+        pose_only = time_call(lambda: estimator.estimate_pose(frame), args.iterations)
+        with_detection = time_call(
+            lambda: (detector.detect_objects(frame), estimator.estimate_pose(frame)),
+            args.iterations,
+        )
+        rows.append(
+            {
+                "backend": backend,
+                "keypoints": pose.get("detected_keypoints", 0),
+                "pose_ms": pose_only["mean_ms"],
+                "pose_p95_ms": pose_only["p95_ms"],
+                "detect+pose_ms": with_detection["mean_ms"],
+            }
+        )
+        estimator.cleanup()
+
+    print(f"Frame: {frame.shape[1]}x{frame.shape[0]} on CPU")
+    print_table(rows)
+
+
+def _footage_frames(paths: List[str], stride: int) -> List[np.ndarray]:
+    frames: List[np.ndarray] = []
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is not None:
+            frames.append(image)
+            continue
+
+        capture = cv2.VideoCapture(path)
+        index = 0
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if index % stride == 0:
+                frames.append(frame)
+            index += 1
+        capture.release()
+        if index == 0:
+            raise SystemExit(f"Could not read image or video: {path}")
+    return frames
+
+
+def _synthetic_scenes() -> List[np.ndarray]:
+    # Day, dusk, night, washed-out and low-contrast variants of the same frame
+    base = load_frame(None, width=1920, height=1080).astype(np.float32)
+    mean = base.mean()
+    variants = [
+        base,
+        base * 0.55,
+        base * 0.25,
+        mean + (base - mean) * 0.3 + 60,
+        mean + (base - mean) * 0.15,
+    ]
+    return [np.clip(v, 0, 255).astype(np.uint8) for v in variants]
+
+
+def bench_scene_thumbnails(args: argparse.Namespace):
+    """Check thumbnail-mode scene classifications against full resolution."""
+    from models.scene_analyzer import SceneAnalyzer
+
+    frames = (
+        _footage_frames(args.footage, args.stride)
+        if args.footage
+        else _synthetic_scenes()
+    )
+    full = SceneAnalyzer()
+    thumbnail = SceneAnalyzer(
+        thumbnail_widths={
+            **SceneAnalyzer.DEFAULT_THUMBNAIL_WIDTHS,
+            **({"weather": args.width, "time": args.width} if args.width else {}),
+        }
+    )
+
+    fields = [
+        "weather_condition",
+        "road_condition",
+        "road_type",
+        "lane_count",
+        "time_of_day",
+        "visibility_category",
+    ]
+    matches = {field: 0 for field in fields}
+    timings = {"full": 0.0, "thumbnail": 0.0}
+    for frame in frames:
+        results = {}
+        for name, analyzer in (("full", full), ("thumbnail", thumbnail)):
+            start = time.perf_counter()
+            results[name] = analyzer.analyze_scene(frame)
+            timings[name] += (time.perf_counter() - start) * 1000
+        for field in fields:
+            matches[field] += results["full"][field] == results["thumbnail"][field]
+
+    print(f"Frames: {len(frames)}")
+    print_table(
+        [
+            {"field": field, "agreement": matches[field] / len(frames)}
+            for field in fields
+        ]
+    )
+    print_table(
+        [
+            {"mode": name, "mean_ms": total / len(frames)}
+            for name, total in timings.items()
+        ]
+    )
+
+
+def bench_detector_backends(args: argparse.Namespace):
+    """Latency and detection agreement of the ONNX Runtime backend vs torch."""
+    from detector import ObjectDetector, compare_detections
+
+    frames = (
+        _footage_frames(args.footage, args.stride)
+        if args.footage
+        else [load_frame(args.image)]
+    )
+    detectors = {
+        backend: ObjectDetector(device="cpu", backend=backend, threads=args.threads)
+        for backend in ("torch", "onnx")
+    }
+
+    rows = []
+    detections = {}
+    for backend, detector in detectors.items():
+        detections[backend] = [detector.detect_objects(frame) for frame in frames]
+        timing = time_call(
+            lambda: [detector.detect_objects(frame) for frame in frames],
+            args.iterations,
+        )
+        rows.append(
+            {
+                "backend": backend,
+                "mean_ms/frame": timing["mean_ms"] / len(frames),
+                "p95_ms/frame": timing["p95_ms"] / len(frames),
+                "detections": sum(len(result) for result in detections[backend]),
+            }
+        )
+
+    agreement = compare_detections(detections["torch"], detections["onnx"])
+    print(f"Frames: {len(frames)} on CPU")
+    print_table(rows)
+    print(
+        f"ONNX vs torch: recall={agreement['recall']:.3f} "
+        f"precision={agreement['precision']:.3f} "
+        f"mean_iou={agreement['mean_iou']:.3f}"
+    )
+    print_table(
+        [
+            {
+                "class": name,
+                "torch": stats["reference"],
+                "onnx": stats["candidate"],
+                "recall": stats["recall"],
+                "mean_iou": stats["mean_iou"],
+            }
+            for name, stats in agreement["per_class"].items()
+        ]
+    )
+
+
+def bench_detector_direct(args: argparse.Namespace):
+    """Per-call latency of the direct-forward torch path vs Ultralytics predict."""
+    import torch
+
+    from detector import ObjectDetector, compare_detections
+
+    frames = (
+        _footage_frames(args.footage, args.stride)
+        if args.footage
+        else [load_frame(args.image)]
+    )
+    torch.set_num_threads(args.threads or torch.get_num_threads())
+    detectors = {
+        backend: ObjectDetector(device="cpu", backend=backend)
+        for backend in ("torch", "torch-direct")
+    }
+
+    rows = []
+    detections = {}
+    for backend, detector in detectors.items():
+        detections[backend] = [detector.detect_objects(frame) for frame in frames]
+        single = time_call(
+            lambda: [detector.detect_objects(frame) for frame in frames],
+            args.iterations,
+        )
+        batched = time_call(
+            lambda: detector.detect_objects_batch(frames[: args.batch_size]),
+            args.iterations,
+        )
+        rows.append(
+            {
+                "backend": backend,
+                "mean_ms/frame": single["mean_ms"] / len(frames),
+                "p95_ms/frame": single["p95_ms"] / len(frames),
+                f"batch{args.batch_size}_ms/frame": batched["mean_ms"]
+                / len(frames[: args.batch_size]),
+                "detections": sum(len(result) for result in detections[backend]),
+            }
+        )
+
+    agreement = compare_detections(detections["torch"], detections["torch-direct"])
+    print(f"Frames: {len(frames)} on CPU, {torch.get_num_threads()} threads")
+    print_table(rows)
+    print(
+        f"direct vs predict: recall={agreement['recall']:.3f} "
+        f"precision={agreement['precision']:.3f} "
+        f"mean_iou={agreement['mean_iou']:.4f}"
+    )
+
+
+def bench_detector_rect(args: argparse.Namespace):
+    """Square vs aspect-ratio-sized ONNX detector inputs: latency and FLOPs.
+
+    The torch backends already pad .pt inputs to stride multiples, so only
+    the exported model changes with declared aspect ratios.
+    """
+    from detector import ObjectDetector, compare_detections
+
+    frames = (
+        _footage_frames(args.footage, args.stride)
+        if args.footage
+        else [load_frame(args.image)]
+    )
+    detectors = {
+        "square": ObjectDetector(device="cpu", backend="onnx"),
+        "rect": ObjectDetector(
+            device="cpu", backend="onnx", aspect_ratios=args.aspect_ratios
+        ),
+    }
+
+    rows = []
+    detections = {}
+    for mode, detector in detectors.items():
+        detections[mode] = [detector.detect_objects(frame) for frame in frames]
+        costs = [detector.inference_cost(result) for result in detections[mode]]
+        timing = time_call(
+            lambda: [detector.detect_objects(frame) for frame in frames],
+            args.iterations,
+        )
+        rows.append(
+            {
+                "mode": mode,
+                "input_shapes": sorted({tuple(cost["input_shape"]) for cost in costs}),
+                "flops_saved": sum(cost["flops_saved"] for cost in costs) / len(costs),
+                "mean_ms/frame": timing["mean_ms"] / len(frames),
+                "p95_ms/frame": timing["p95_ms"] / len(frames),
+            }
+        )
+
+    agreement = compare_detections(detections["square"], detections["rect"])
+    print(f"Frames: {len(frames)} on CPU, ONNX backend")
+    print_table(rows)
+    print(
+        f"rect vs square: recall={agreement['recall']:.3f} "
+        f"precision={agreement['precision']:.3f} "
+        f"mean_iou={agreement['mean_iou']:.3f}"
+    )
+
+
+def bench_detector_int8(args: argparse.Namespace):
+    """Build the INT8 detector, measure its drift from FP32 and store the report."""
+    from analyzer import RidingAnalyzer
+    from artifact_cache import ArtifactCache
+    from detector import ObjectDetector
+    from detector_quantization import (
+        drift_violations,
+        evaluate_drift,
+        load_frames,
+        write_report,
+    )
+    from models.pose_estimator import PoseEstimator
+    from models.scene_analyzer import SceneAnalyzer
+
+    logging.getLogger("analyzer").setLevel(logging.ERROR)
+    cache = ArtifactCache(args.cache_dir) if args.cache_dir else None
+    options = {"device": "cpu", "threads": args.threads, "artifact_cache": cache}
+    fp32 = ObjectDetector(backend="onnx", **options)
+    int8 = ObjectDetector(
+        backend="onnx-int8",
+        calibration_dir=args.calibration_dir,
+        calibration_frames=args.calibration_frames,
+        check_drift=False,
+        **options,
+    )
+    if not int8.quantization["enabled"]:
+        raise SystemExit(f"INT8 build failed: {int8.quantization['reasons']}")
+
+    if args.footage:
+        frames = _footage_frames(args.footage, args.stride)
+    else:
+        print("No evaluation footage given; evaluating on the calibration frames")
+        frames = load_frames(args.calibration_dir, args.calibration_frames)
+
+    rows = []
+    detections = {}
+    for name, detector in (("fp32", fp32), ("int8", int8)):
+        detections[name] = [detector.detect_objects(frame) for frame in frames]
+        timing = time_call(
+            lambda: [detector.detect_objects(frame) for frame in frames],
+            args.iterations,
+        )
+        rows.append(
+            {
+                "model": name,
+                "mean_ms/frame": timing["mean_ms"] / len(frames),
+                "p95_ms/frame": timing["p95_ms"] / len(frames),
+                "detections": sum(len(result) for result in detections[name]),
+            }
+        )
+
+    pose_estimator = PoseEstimator(device="cpu")
+    scene_analyzer = SceneAnalyzer()
+    poses = [pose_estimator.estimate_pose(frame) for frame in frames]
+    scenes = [scene_analyzer.analyze_scene(frame) for frame in frames]
+    pose_estimator.cleanup()
+
+    report = evaluate_drift(
+        detections["fp32"], detections["int8"], RidingAnalyzer(), poses, scenes
+    )
+    write_report(int8.artifact_path, report)
+
+    agreement = report["detections"]
+    print(f"Frames: {len(frames)} on CPU, INT8 model {int8.artifact_path}")
+    print_table(rows)
+    print(
+        f"INT8 vs FP32: recall={agreement['recall']:.3f} "
+        f"precision={agreement['precision']:.3f} "
+        f"mean_iou={agreement['mean_iou']:.3f}"
+    )
+    print_table(
+        [
+            {
+                "class": name,
+                "fp32": stats["reference"],
+                "int8": stats["candidate"],
+                "recall": stats["recall"],
+                "mean_iou": stats["mean_iou"],
+            }
+            for name, stats in agreement["per_class"].items()
+        ]
+    )
+    print_table(
+        [
+            {
+                "score": name,
+                "mean_abs_drift": drift["mean_abs"],
+                "max_abs_drift": drift["max_abs"],
+            }
+            for name, drift in report["scores"].items()
+        ]
+    )
+
+    violations = drift_violations(report)
+    if violations:
+        print("INT8 would be refused (default tolerance): " + "; ".join(violations))
+    else:
+        print("INT8 is within the default tolerance and will be enabled")
+
+
+def _synthetic_riding_frames(count: int, seed: int = 0) -> Dict[str, list]:
+    from landmarks import RIDING_KEYPOINTS
+
+    rng = np.random.default_rng(seed)
+    frames: Dict[str, list] = {"detections": [], "poses": [], "scenes": []}
+    classes = ["motorcycle", "person", "car", "truck", "bus"]
+    for _ in range(count):
+        detections = []
+        for _ in range(rng.integers(1, 8)):
+            x1, y1 = rng.uniform(0, 1100), rng.uniform(0, 600)
+            box = np.array(
+                [x1, y1, x1 + rng.uniform(20, 300), y1 + rng.uniform(20, 200)],
+                dtype=np.float32,
+            )
+            detections.append(
+                {
+                    "class_name": str(rng.choice(classes)),
+                    "confidence": float(rng.uniform(0.3, 1.0)),
+                    "bbox": box.tolist(),
+                    "area": float((box[2] - box[0]) * (box[3] - box[1])),
+                }
+            )
+
+        landmarks = {}
+        for name in RIDING_KEYPOINTS:
+            visibility = float(rng.uniform(0.3, 1.0))
+            landmarks[name] = {
+                "x": float(rng.uniform(0.2, 0.8)),
+                "y": float(rng.uniform(0.1, 0.9)),
+                "visibility": visibility,
+                "visible": visibility > 0.5,
+            }
+
+        frames["detections"].append(detections)
+        frames["poses"].append({"landmarks": landmarks})
+        frames["scenes"].append(
+            {
+                "weather_condition": str(rng.choice(["clear", "rain", "fog"])),
+                "road_condition": str(rng.choice(["dry", "wet"])),
+                "traffic_density": str(rng.choice(["light", "heavy", "congested"])),
+                "time_of_day": str(rng.choice(["day", "night"])),
+                "lane_count": int(rng.integers(1, 5)),
+            }
+        )
+    return frames
+
+
+def bench_riding_batch(args: argparse.Namespace):
+    """Per-frame RidingAnalyzer scoring vs analyze_batch for N=1 and N=1000."""
+    from analyzer import RidingAnalyzer
+
+    # The per-frame path warns on every frame without a motorcycle
+    logging.getLogger("analyzer").setLevel(logging.ERROR)
+    analyzer = RidingAnalyzer()
+    image = np.zeros((720, 1280, 3), dtype=np.uint8)
+    keys = [
+        "overall_score",
+        "posture_score",
+        "lane_score",
+        "speed_score",
+        "safety_score",
+    ]
+
+    rows = []
+    for count in args.frames:
+        frames = _synthetic_riding_frames(count)
+        inputs = analyzer.columnar_inputs(
+            frames["detections"], frames["poses"], frames["scenes"], [1280] * count
+        )
+
+        def per_frame():
+            return [
+                analyzer.analyze_riding_technique(image, *frame)
+                for frame in zip(
+                    frames["detections"], frames["poses"], frames["scenes"]
+                )
+            ]
+
+        expected = per_frame()
+        batch = analyzer.analyze_batch(**inputs)
+        mismatches = sum(
+            result[key] != batch[key][i]
+            for i, result in enumerate(expected)
+            for key in keys
+        )
+
+        loop = time_call(per_frame, args.iterations)
+        vectorized = time_call(
+            lambda: analyzer.analyze_batch(**inputs), args.iterations
+        )
+        rows.append(
+            {
+                "frames": count,
+                "per_frame_ms": loop["mean_ms"],
+                "batch_ms": vectorized["mean_ms"],
+                "per_frame_us/frame": loop["mean_ms"] * 1000 / count,
+                "batch_us/frame": vectorized["mean_ms"] * 1000 / count,
+                "mismatches": mismatches,
+            }
+        )
+
+    print_table(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ML service benchmarks")
+    parser.add_argument(
+        "--image", help="JPEG/PNG frame to use instead of a synthetic one"
+    )
+    parser.add_argument("--iterations", type=int, default=50)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("transport", help=bench_transport.__doc__).set_defaults(
+        func=bench_transport
+    )
+
+    batching = subparsers.add_parser("batching", help=bench_batching.__doc__)
+    batching.add_argument("--device", default="cpu")
+    batching.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8])
+    batching.add_argument("--max-batch-size", type=int, default=8)
+    batching.add_argument("--window-ms", type=float, default=5.0)
+    batching.set_defaults(func=bench_batching)
+
+    subparsers.add_parser("stages", help=bench_stages.__doc__).set_defaults(
+        func=bench_stages
+    )
+
+    workers = subparsers.add_parser("workers", help=bench_workers.__doc__)
+    workers.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    workers.set_defaults(func=bench_workers)
+
+    subparsers.add_parser(
+        "frame-context", help=bench_frame_context.__doc__
+    ).set_defaults(func=bench_frame_context)
+
+    decode = subparsers.add_parser("decode", help=bench_decode.__doc__)
+    decode.add_argument("--target-size", type=int, default=640)
+    decode.add_argument("--max-pixels", type=int, default=0)
+    decode.set_defaults(func=bench_decode)
+
+    subparsers.add_parser("pose", help=bench_pose.__doc__).set_defaults(func=bench_pose)
+
+    scene = subparsers.add_parser(
+        "scene-thumbnails", help=bench_scene_thumbnails.__doc__
+    )
+    scene.add_argument(
+        "footage", nargs="*", help="Images or videos; synthetic scenes if omitted"
+    )
+    scene.add_argument("--stride", type=int, default=30, help="Video frame stride")
+    scene.add_argument(
+        "--width", type=int, default=0, help="Override weather/time thumbnail width"
+    )
+    scene.set_defaults(func=bench_scene_thumbnails)
+
+    backends = subparsers.add_parser(
+        "detector-backends", help=bench_detector_backends.__doc__
+    )
+    backends.add_argument(
+        "footage", nargs="*", help="Images or videos; synthetic frame if omitted"
+    )
+    backends.add_argument("--stride", type=int, default=30, help="Video frame stride")
+    backends.add_argument(
+        "--threads", type=int, default=0, help="ONNX Runtime threads, 0 = auto"
+    )
+    backends.set_defaults(func=bench_detector_backends)
+
+    direct = subparsers.add_parser(
+        "detector-direct", help=bench_detector_direct.__doc__
+    )
+    direct.add_argument(
+        "footage", nargs="*", help="Images or videos; synthetic frame if omitted"
+    )
+    direct.add_argument("--stride", type=int, default=30, help="Video frame stride")
+    direct.add_argument("--batch-size", type=int, default=4)
+    direct.add_argument(
+        "--threads", type=int, default=0, help="torch threads, 0 = auto"
+    )
+    direct.set_defaults(func=bench_detector_direct)
+
+    rect = subparsers.add_parser("detector-rect", help=bench_detector_rect.__doc__)
+    rect.add_argument(
+        "footage", nargs="*", help="Images or videos; synthetic frame if omitted"
+    )
+    rect.add_argument("--stride", type=int, default=30, help="Video frame stride")
+    rect.add_argument("--aspect-ratios", nargs="+", default=["16:9"])
+    rect.set_defaults(func=bench_detector_rect)
+
+    int8 = subparsers.add_parser("detector-int8", help=bench_detector_int8.__doc__)
+    int8.add_argument("calibration_dir", help="Folder of representative frames")
+    int8.add_argument(
+        "footage", nargs="*", help="Evaluation images or videos; calibration if omitted"
+    )
+    int8.add_argument("--calibration-frames", type=int, default=100)
+    int8.add_argument("--cache-dir", help="Artifact cache the service uses, if any")
+    int8.add_argument("--stride", type=int, default=30, help="Video frame stride")
+    int8.add_argument(
+        "--threads", type=int, default=0, help="ONNX Runtime threads, 0 = auto"
+    )
+    int8.set_defaults(func=bench_detector_int8)
+
+    riding = subparsers.add_parser("riding-batch", help=bench_riding_batch.__doc__)
+    riding.add_argument("--frames", type=int, nargs="+", default=[1, 1000])
+    riding.set_defaults(func=bench_riding_batch)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
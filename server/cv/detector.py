@@ -1,14 +1,288 @@
 #!/usr/bin/env python3
 
 import logging
-from typing import Dict, List, Any, Optional, Tuple
+import os
+import threading
+from collections.abc import Sequence
+from typing import Callable, Dict, Iterable, List, Any, Optional, Tuple, Union
 import numpy as np
 import cv2
 import torch
 from ultralytics import YOLO
 
+from artifact_cache import ArtifactCache
+from detector_backends import (
+    MAX_STRIDE,
+    DetectionRows,
+    OnnxBackend,
+    TorchBackend,
+    aspect_ratio_shape,
+    export_onnx,
+    padded_shape,
+)
+from detector_quantization import (
+    calibration_digest,
+    drift_violations,
+    load_frames,
+    quantize_detector,
+    read_report,
+    summarize_report,
+)
+from frame_context import FrameContext
+
 logger = logging.getLogger(__name__)
 
+# Anything the detector helpers can derive detections from
+DetectionSource = Union[np.ndarray, FrameContext, "DetectionResult"]
+
+VEHICLE_CLASSES = ("car", "truck", "bus", "motorcycle", "bicycle")
+
+
+class DetectionResult(Sequence):
+    """Columnar detections for one frame, sorted by descending confidence.
+
+    Boxes, scores, class ids, areas and centers live in NumPy arrays; the
+    legacy per-detection dicts are only built (once) when the result is
+    iterated or indexed, e.g. by RidingAnalyzer or at the JSON boundary.
+    """
+
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        scores: np.ndarray,
+        class_ids: np.ndarray,
+        class_names: Optional[np.ndarray] = None,
+        image_shape: Optional[Tuple[int, int]] = None,
+        input_shape: Optional[Tuple[int, int]] = None,
+    ):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        self.class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+        self._class_names = (
+            class_names if class_names is not None else np.array([], dtype=object)
+        )
+        # (height, width) of the frame the boxes refer to, and of the
+        # letterboxed network input it was run at, when known
+        self.image_shape = image_shape
+        self.input_shape = input_shape
+
+        x1, y1, x2, y2 = self.boxes.T
+        self.areas = (x2 - x1) * (y2 - y1)
+        self.centers = np.stack([(x1 + x2) / 2, (y1 + y2) / 2], axis=1)
+        self._dicts: Optional[List[Dict[str, Any]]] = None
+
+    @classmethod
+    def from_dicts(
+        cls, detections: List[Dict], class_names: Optional[np.ndarray] = None
+    ) -> "DetectionResult":
+        return cls(
+            [d["bbox"] for d in detections],
+            [d["confidence"] for d in detections],
+            [d["class_id"] for d in detections],
+            class_names,
+        )
+
+    @classmethod
+    def empty(
+        cls,
+        class_names: Optional[np.ndarray] = None,
+        image_shape: Optional[Tuple[int, int]] = None,
+        input_shape: Optional[Tuple[int, int]] = None,
+    ) -> "DetectionResult":
+        return cls(
+            np.zeros((0, 4), np.float32),
+            np.zeros(0, np.float32),
+            np.zeros(0, np.int64),
+            class_names,
+            image_shape,
+            input_shape,
+        )
+
+    @property
+    def class_names(self) -> np.ndarray:
+        known = self.class_ids < len(self._class_names)
+        names = np.empty(len(self.class_ids), dtype=object)
+        names[known] = self._class_names[self.class_ids[known]]
+        names[~known] = [f"class_{i}" for i in self.class_ids[~known]]
+        return names
+
+    def select(self, mask: np.ndarray) -> "DetectionResult":
+        return DetectionResult(
+            self.boxes[mask],
+            self.scores[mask],
+            self.class_ids[mask],
+            self._class_names,
+            self.image_shape,
+            self.input_shape,
+        )
+
+    def scaled(self, scale: float) -> "DetectionResult":
+        """Boxes multiplied by ``scale``, e.g. from decoded to source pixels."""
+        if scale == 1.0:
+            return self
+        image_shape = None
+        if self.image_shape is not None:
+            image_shape = tuple(int(round(side * scale)) for side in self.image_shape)
+        return DetectionResult(
+            self.boxes.astype(np.float64) * scale,
+            self.scores,
+            self.class_ids,
+            self._class_names,
+            image_shape,
+            self.input_shape,
+        )
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        if self._dicts is None:
+            self._dicts = [
+                {
+                    "bbox": bbox,
+                    "confidence": confidence,
+                    "class_id": class_id,
+                    "class_name": class_name,
+                    "area": area,
+                    "center": center,
+                }
+                for bbox, confidence, class_id, class_name, area, center in zip(
+                    self.boxes.tolist(),
+                    self.scores.tolist(),
+                    self.class_ids.tolist(),
+                    self.class_names.tolist(),
+                    self.areas.tolist(),
+                    self.centers.tolist(),
+                )
+            ]
+        return self._dicts
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def __getitem__(self, index):
+        return self.to_dicts()[index]
+
+    def __iter__(self):
+        return iter(self.to_dicts())
+
+
+def summarize_traffic(
+    detections: DetectionResult,
+    image_area: float,
+    exclude_rider_motorcycle: bool = False,
+) -> Dict[str, Any]:
+    """Vehicle counts, box-area ratio, density level and nearest-vehicle distance.
+
+    With ``exclude_rider_motorcycle`` the most confident motorcycle, the one
+    the rider is matched to, is the rider's own and not surrounding traffic.
+    """
+    is_vehicle = np.isin(detections.class_names, VEHICLE_CLASSES)
+    if exclude_rider_motorcycle:
+        motorcycles = np.flatnonzero(detections.class_names == "motorcycle")
+        if len(motorcycles):
+            is_vehicle[motorcycles[0]] = False
+    vehicles = detections.select(is_vehicle)
+    total_vehicles = len(vehicles)
+
+    names, counts = np.unique(vehicles.class_names.astype(str), return_counts=True)
+    density_ratio = (
+        float(vehicles.areas.sum(dtype=np.float64)) / image_area
+        if image_area > 0
+        else 0
+    )
+
+    if total_vehicles == 0:
+        density_level = "no_traffic"
+    elif total_vehicles <= 2 and density_ratio < 0.1:
+        density_level = "light"
+    elif total_vehicles <= 5 and density_ratio < 0.25:
+        density_level = "moderate"
+    elif total_vehicles <= 10 and density_ratio < 0.4:
+        density_level = "heavy"
+    else:
+        density_level = "congested"
+
+    if total_vehicles == 0:
+        nearest_distance = float("inf")
+    else:
+        # Rough approximation from the largest box, capped at 200 meters
+        largest_area = max(float(vehicles.areas.max()), 1e-6)
+        nearest_distance = min(max(10.0, 100.0 / (largest_area / 10000.0)), 200.0)
+
+    return {
+        "total_vehicles": total_vehicles,
+        "vehicle_distribution": dict(zip(names.tolist(), counts.tolist())),
+        "density_level": density_level,
+        "density_ratio": density_ratio,
+        "nearest_vehicle_distance": nearest_distance,
+    }
+
+
+def compare_detections(
+    reference: List[DetectionResult],
+    candidate: List[DetectionResult],
+    iou_threshold: float = 0.5,
+) -> Dict[str, Any]:
+    """Match ``candidate`` detections against ``reference`` frame by frame.
+
+    Boxes are matched greedily within each class, most confident reference
+    first, to the unmatched candidate box of highest IoU at or above
+    ``iou_threshold``. Returns overall and per-class recall, precision and
+    mean IoU of the matches.
+    """
+    per_class: Dict[str, Dict[str, Any]] = {}
+    for ref, cand in zip(reference, candidate):
+        ref_names, cand_names = ref.class_names, cand.class_names
+        for name in set(ref_names.tolist()) | set(cand_names.tolist()):
+            ref_boxes = ref.boxes[ref_names == name]
+            cand_boxes = cand.boxes[cand_names == name]
+            stats = per_class.setdefault(
+                name, {"reference": 0, "candidate": 0, "matched": 0, "iou_sum": 0.0}
+            )
+            stats["reference"] += len(ref_boxes)
+            stats["candidate"] += len(cand_boxes)
+            if len(ref_boxes) == 0 or len(cand_boxes) == 0:
+                continue
+
+            iou = _box_iou(ref_boxes, cand_boxes)
+            taken = np.zeros(len(cand_boxes), dtype=bool)
+            for row in iou:
+                row = np.where(taken, -1.0, row)
+                best = int(np.argmax(row))
+                if row[best] >= iou_threshold:
+                    taken[best] = True
+                    stats["matched"] += 1
+                    stats["iou_sum"] += float(row[best])
+
+    def summary(stats: Dict[str, Any]) -> Dict[str, Any]:
+        matched = stats["matched"]
+        return {
+            "reference": stats["reference"],
+            "candidate": stats["candidate"],
+            "matched": matched,
+            "recall": matched / stats["reference"] if stats["reference"] else 1.0,
+            "precision": matched / stats["candidate"] if stats["candidate"] else 1.0,
+            "mean_iou": stats["iou_sum"] / matched if matched else 0.0,
+        }
+
+    totals = {
+        key: sum(stats[key] for stats in per_class.values())
+        for key in ("reference", "candidate", "matched", "iou_sum")
+    }
+    return {
+        **summary(totals),
+        "per_class": {
+            name: summary(stats) for name, stats in sorted(per_class.items())
+        },
+    }
+
+
+def _box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-7)
+
 
 class ObjectDetector:
 
@@ -17,43 +291,204 @@ class ObjectDetector:
         model_path: str = "yolov8n.pt",
         device: str = "cpu",
         confidence_threshold: float = 0.5,
+        target_classes: Optional[Iterable[str]] = None,
+        backend: str = "torch",
+        threads: int = 0,
+        artifact_cache: Optional[ArtifactCache] = None,
+        calibration_dir: Optional[str] = None,
+        calibration_frames: int = 100,
+        drift_tolerance: Optional[Dict[str, float]] = None,
+        check_drift: bool = True,
+        aspect_ratios: Optional[Iterable[str]] = None,
     ):
+        if backend not in ("torch", "torch-direct", "onnx", "onnx-int8"):
+            raise ValueError(f"Unknown detector backend: {backend}")
+
         self.device = device
         self.confidence_threshold = confidence_threshold
+        self.backend = backend
+        self.threads = threads
+        self.artifact_cache = artifact_cache
+        self.artifact_path: Optional[str] = None
+        # INT8 mode: calibration input and the accuracy guardrail
+        self.calibration_dir = calibration_dir
+        self.calibration_frames = calibration_frames
+        self.drift_tolerance = drift_tolerance
+        self.check_drift = check_drift
+        self.quantization: Optional[Dict[str, Any]] = None
+        # Declared frame aspect ratios ("16:9"): each gets a warm-up at its
+        # stride-multiple input, and ONNX switches to a dynamic-shape export
+        self.imgsz = 640
+        self.aspect_ratios = list(aspect_ratios or [])
+        self.warmup_shapes = list(
+            dict.fromkeys(
+                [(self.imgsz, self.imgsz)]
+                + [
+                    aspect_ratio_shape(ratio, self.imgsz)
+                    for ratio in self.aspect_ratios
+                ]
+            )
+        )
+        self.square_gflops: Optional[float] = None
         self.model = None
         self.class_mapping = self._get_class_mapping()
 
-        self.target_classes = {
-            "motorcycle",
-            "bicycle",
-            "car",
-            "truck",
-            "bus",
-            "person",
-            "traffic light",
-            "stop sign",
-            "speed limit",
-            "crosswalk",
-        }
+        self.target_classes = set(
+            target_classes
+            or {
+                "motorcycle",
+                "bicycle",
+                "car",
+                "truck",
+                "bus",
+                "person",
+                "traffic light",
+                "stop sign",
+                "speed limit",
+                "crosswalk",
+            }
+        )
+
+        self._class_names = np.array(
+            [self.class_mapping[i] for i in range(len(self.class_mapping))],
+            dtype=object,
+        )
+        # Passed to the model so NMS never considers other classes. Default
+        # targets that are not COCO classes (speed limit, crosswalk) simply
+        # never match; configured ones must exist so typos fail at startup.
+        self.allowed_class_ids = self.resolve_class_ids(
+            self.target_classes, strict=target_classes is not None
+        )
+        # Last bare frame seen by each request thread, see _resolve_detections
+        self._thread_frames = threading.local()
 
         self._load_model(model_path)
-        logger.info(f"ObjectDetector initialized with {model_path} on {device}")
+        logger.info(
+            f"ObjectDetector initialized with {model_path} on {device} "
+            f"({backend} backend)"
+        )
 
     def _load_model(self, model_path: str):
         try:
-            self.model = YOLO(model_path)
-            if torch.cuda.is_available() and self.device == "cuda":
-                self.model.to(self.device)
-
-            dummy_input = np.zeros((640, 640, 3), dtype=np.uint8)
-            _ = self.model.predict(dummy_input, verbose=False)
-
-            logger.info("YOLOv8 model loaded and warmed up successfully")
+            if self.artifact_cache is not None:
+                model_path = self.artifact_cache.weights(model_path)
+
+            if self.backend.startswith("onnx"):
+                self.artifact_path = self._onnx_artifact(model_path, self.imgsz)
+                if self.backend == "onnx-int8":
+                    self.artifact_path = self._int8_artifact(self.artifact_path)
+                self.model = OnnxBackend(
+                    self.artifact_path, self.imgsz, threads=self.threads
+                )
+            else:
+                self.model = YOLO(model_path)
+                if torch.cuda.is_available() and self.device == "cuda":
+                    self.model.to(self.device)
+                if self.backend == "torch-direct":
+                    self.model = TorchBackend(self.model, self.device, self.imgsz)
+                self.square_gflops = self._measure_gflops()
+
+            for height, width in self.warmup_shapes:
+                dummy_input = np.zeros((height, width, 3), dtype=np.uint8)
+                if self.backend == "torch":
+                    _ = self.model.predict(dummy_input, verbose=False)
+                else:
+                    self.model.predict([dummy_input], self.confidence_threshold)
+
+            logger.info(
+                f"YOLOv8 model loaded and warmed up at {self.warmup_shapes} "
+                "successfully"
+            )
 
         except Exception as e:
             logger.error(f"Failed to load YOLOv8 model: {e}")
             raise
 
+    def _onnx_artifact(self, model_path: str, imgsz: int = 640) -> str:
+        if not model_path.endswith(".pt"):
+            return model_path
+        dynamic = bool(self.aspect_ratios)
+        if self.artifact_cache is None:
+            return export_onnx(model_path, imgsz, dynamic=dynamic)
+        return self.artifact_cache.artifact(
+            model_path,
+            "onnx",
+            (imgsz, imgsz),
+            lambda scratch: export_onnx(model_path, imgsz, scratch, dynamic),
+            options={"dynamic": True} if dynamic else None,
+        )
+
+    def _measure_gflops(self) -> Optional[float]:
+        """GFLOPs of one square forward pass, if Ultralytics can profile it."""
+        try:
+            from ultralytics.utils.torch_utils import get_flops
+
+            network = (
+                self.model.network
+                if self.backend == "torch-direct"
+                else self.model.model
+            )
+            return get_flops(network, self.imgsz) or None
+        except Exception as e:
+            logger.warning(f"Could not measure detector FLOPs: {e}")
+            return None
+
+    def _int8_artifact(self, onnx_path: str) -> str:
+        """INT8 model path, or ``onnx_path`` when the guardrail refuses it.
+
+        The INT8 model is only enabled when its evaluation report (written by
+        ``benchmark.py detector-int8``) stays within ``drift_tolerance``;
+        otherwise the detector falls back to the FP32 ONNX model.
+        """
+        self.quantization = {"enabled": False, "artifact": None, "reasons": []}
+        try:
+            int8_path = self._build_int8(onnx_path)
+        except Exception as e:
+            logger.error(f"INT8 detector unavailable, using FP32: {e}")
+            self.quantization["reasons"] = [str(e)]
+            self.backend = "onnx"
+            return onnx_path
+
+        report = read_report(int8_path)
+        violations = drift_violations(report, self.drift_tolerance)
+        self.quantization.update(
+            artifact=int8_path, report=summarize_report(report), reasons=violations
+        )
+        if violations and self.check_drift:
+            logger.error(
+                f"Refusing INT8 detector {int8_path}, using FP32: "
+                + "; ".join(violations)
+            )
+            self.backend = "onnx"
+            return onnx_path
+
+        self.quantization["enabled"] = True
+        return int8_path
+
+    def _build_int8(self, onnx_path: str) -> str:
+        int8_path = os.path.splitext(onnx_path)[0] + ".int8.onnx"
+        if self.artifact_cache is None and os.path.exists(int8_path):
+            return int8_path
+        if not self.calibration_dir:
+            raise ValueError("INT8 mode needs a calibration frame directory")
+
+        def build(output_dir: Optional[str] = None) -> str:
+            frames = load_frames(self.calibration_dir, self.calibration_frames)
+            return quantize_detector(onnx_path, frames, output_dir, self.imgsz)
+
+        if self.artifact_cache is None:
+            return build()
+        return self.artifact_cache.artifact(
+            onnx_path,
+            "onnx-int8",
+            (self.imgsz, self.imgsz),
+            build,
+            options={
+                "calibration": calibration_digest(self.calibration_dir),
+                "frames": self.calibration_frames,
+            },
+        )
+
     def _get_class_mapping(self) -> Dict[int, str]:
         return {
             0: "person",
@@ -86,126 +521,315 @@ class ObjectDetector:
             27: "tie",
             28: "suitcase",
             29: "frisbee",
+            30: "skis",
+            31: "snowboard",
+            32: "sports ball",
+            33: "kite",
+            34: "baseball bat",
+            35: "baseball glove",
+            36: "skateboard",
+            37: "surfboard",
+            38: "tennis racket",
+            39: "bottle",
+            40: "wine glass",
+            41: "cup",
+            42: "fork",
+            43: "knife",
+            44: "spoon",
+            45: "bowl",
+            46: "banana",
+            47: "apple",
+            48: "sandwich",
+            49: "orange",
+            50: "broccoli",
+            51: "carrot",
+            52: "hot dog",
+            53: "pizza",
+            54: "donut",
+            55: "cake",
+            56: "chair",
+            57: "couch",
+            58: "potted plant",
+            59: "bed",
+            60: "dining table",
+            61: "toilet",
+            62: "tv",
+            63: "laptop",
+            64: "mouse",
+            65: "remote",
+            66: "keyboard",
+            67: "cell phone",
+            68: "microwave",
+            69: "oven",
+            70: "toaster",
+            71: "sink",
+            72: "refrigerator",
+            73: "book",
+            74: "clock",
+            75: "vase",
+            76: "scissors",
+            77: "teddy bear",
+            78: "hair drier",
+            79: "toothbrush",
         }
 
-    def detect_objects(self, image: np.ndarray) -> List[Dict[str, Any]]:
+    def resolve_class_ids(
+        self, class_names: Iterable[str], strict: bool = True
+    ) -> List[int]:
+        name_to_id = {name: class_id for class_id, name in self.class_mapping.items()}
+        unknown = [name for name in class_names if name not in name_to_id]
+        if unknown and strict:
+            raise ValueError(f"Unknown detection classes: {', '.join(unknown)}")
+        return sorted(name_to_id[name] for name in class_names if name in name_to_id)
+
+    def _class_lookup(self, class_ids: Sequence) -> np.ndarray:
+        lookup = np.zeros(len(self._class_names), dtype=bool)
+        lookup[list(class_ids)] = True
+        return lookup
+
+    def empty_result(self, image: np.ndarray) -> DetectionResult:
+        """No detections for ``image``, e.g. when detection fails."""
+        return DetectionResult.empty(self._class_names, image.shape[:2])
+
+    def detect_objects(
+        self, image: np.ndarray, class_ids: Optional[Sequence[int]] = None
+    ) -> DetectionResult:
         if self.model is None:
             logger.error("Model not loaded")
-            return []
+            return self.empty_result(image)
+
+        class_ids = self.allowed_class_ids if class_ids is None else class_ids
+        if len(class_ids) == 0:
+            return self.empty_result(image)
 
         try:
-            results = self.model.predict(
-                image, conf=self.confidence_threshold, verbose=False, device=self.device
+            rows = self._predict([image], class_ids)
+            detections = self._parse_result(
+                rows[0], class_ids, image.shape[:2], self._input_shapes([image])[0]
             )
 
-            detections = []
-            if results and len(results) > 0:
-                result = results[0]
-
-                if result.boxes is not None:
-                    boxes = result.boxes.cpu().numpy()
-
-                    for i, box in enumerate(boxes.data):
-                        x1, y1, x2, y2, conf, class_id = box
-                        class_id = int(class_id)
-                        class_name = self.class_mapping.get(
-                            class_id, f"class_{class_id}"
-                        )
-
-                        if class_name in self.target_classes or any(
-                            target in class_name.lower()
-                            for target in self.target_classes
-                        ):
-                            detection = {
-                                "bbox": [float(x1), float(y1), float(x2), float(y2)],
-                                "confidence": float(conf),
-                                "class_id": class_id,
-                                "class_name": class_name,
-                                "area": float((x2 - x1) * (y2 - y1)),
-                                "center": [float((x1 + x2) / 2), float((y1 + y2) / 2)],
-                            }
-                            detections.append(detection)
-
-            detections.sort(key=lambda x: x["confidence"], reverse=True)
-
             logger.debug(f"Detected {len(detections)} relevant objects")
             return detections
 
         except Exception as e:
             logger.error(f"Object detection failed: {e}")
-            return []
+            return self.empty_result(image)
 
-    def detect_motorcycle_and_rider(
-        self, image: np.ndarray
-    ) -> Tuple[Optional[Dict], Optional[Dict]]:
-        all_detections = self.detect_objects(image)
+    def detect_objects_batch(
+        self,
+        images: List[np.ndarray],
+        class_ids: Optional[List[Optional[Sequence[int]]]] = None,
+    ) -> List[DetectionResult]:
+        if self.model is None:
+            logger.error("Model not loaded")
+            return [self.empty_result(image) for image in images]
+
+        per_image = [
+            self.allowed_class_ids if ids is None else ids
+            for ids in (class_ids or [None] * len(images))
+        ]
+        # One forward pass for the whole batch, so NMS gets the union of the
+        # allow-lists and each frame is narrowed to its own list afterwards
+        union = sorted(set().union(*per_image))
+        if not union:
+            return [self.empty_result(image) for image in images]
 
-        motorcycle_detection = None
-        rider_detection = None
+        try:
+            rows = self._predict(list(images), union)
+            return [
+                self._parse_result(data, ids, image.shape[:2], input_shape)
+                for data, ids, image, input_shape in zip(
+                    rows, per_image, images, self._input_shapes(list(images))
+                )
+            ]
 
-        for detection in all_detections:
-            if detection["class_name"] == "motorcycle" and motorcycle_detection is None:
-                motorcycle_detection = detection
-            elif detection["class_name"] == "person" and rider_detection is None:
-                rider_detection = detection
+        except Exception as e:
+            logger.error(f"Batched object detection failed: {e}")
+            return [self.empty_result(image) for image in images]
+
+    def _predict(
+        self, images: List[np.ndarray], class_ids: Sequence[int]
+    ) -> List[DetectionRows]:
+        """(x1, y1, x2, y2, confidence, class_id) rows per image, any backend."""
+        if self.backend != "torch":
+            # ONNX Runtime and direct-forward backends share this interface
+            return self.model.predict(images, self.confidence_threshold, class_ids)
+
+        results = self.model.predict(
+            images,
+            conf=self.confidence_threshold,
+            classes=list(class_ids),
+            verbose=False,
+            device=self.device,
+        )
+        return [
+            (
+                result.boxes.data.cpu().numpy()
+                if result.boxes is not None
+                else np.zeros((0, 6), dtype=np.float32)
+            )
+            for result in results
+        ]
+
+    def _input_shapes(self, images: List[np.ndarray]) -> List[Tuple[int, int]]:
+        """(h, w) network input each image is letterboxed to."""
+        if self.backend != "torch":
+            return self.model.input_shapes(images)
+        # Ultralytics' predictor pads .pt inputs to stride multiples when
+        # every image in the call has the same shape
+        stride = MAX_STRIDE if len({image.shape for image in images}) == 1 else 0
+        square = (self.imgsz, self.imgsz)
+        return [padded_shape(image.shape, square, stride) for image in images]
+
+    def inference_cost(self, detections: DetectionResult) -> Optional[Dict[str, Any]]:
+        """Network input size of ``detections`` and its compute relative to square."""
+        if detections.input_shape is None:
+            return None
+        height, width = detections.input_shape
+        # The network is fully convolutional, so FLOPs scale with input pixels
+        relative = height * width / (self.imgsz * self.imgsz)
+        return {
+            "input_shape": [height, width],
+            "relative_flops": relative,
+            "flops_saved": 1.0 - relative,
+            "gflops": self.square_gflops * relative if self.square_gflops else None,
+        }
 
-            if motorcycle_detection and rider_detection:
-                break
+    def _parse_result(
+        self,
+        data: DetectionRows,
+        class_ids: Sequence[int],
+        image_shape: Optional[Tuple[int, int]] = None,
+        input_shape: Optional[Tuple[int, int]] = None,
+    ) -> DetectionResult:
+        if len(data) == 0:
+            return DetectionResult.empty(self._class_names, image_shape, input_shape)
+
+        box_class_ids = data[:, 5].astype(np.int64)
+
+        lookup = self._class_lookup(class_ids)
+        keep = np.zeros(len(box_class_ids), dtype=bool)
+        in_table = box_class_ids < len(lookup)
+        keep[in_table] = lookup[box_class_ids[in_table]]
+
+        # Stable sort keeps the model's order among equal confidences
+        order = np.argsort(-data[keep, 4], kind="stable")
+        kept = data[keep][order]
+        return DetectionResult(
+            kept[:, :4],
+            kept[:, 4],
+            box_class_ids[keep][order],
+            self._class_names,
+            image_shape,
+            input_shape,
+        )
+
+    def detect_frame(
+        self,
+        frame: FrameContext,
+        class_ids: Optional[Sequence[int]] = None,
+        runner: Optional[Callable[..., DetectionResult]] = None,
+    ) -> DetectionResult:
+        """Detections for ``frame``, running inference at most once per allow-list.
+
+        ``runner`` replaces ``detect_objects`` (e.g. the batcher) for the
+        single call that populates the cache.
+        """
+        class_ids = self.allowed_class_ids if class_ids is None else list(class_ids)
+        runner = runner or self.detect_objects
+        return frame.memo(
+            ("detections", tuple(class_ids)), lambda: runner(frame.image, class_ids)
+        )
+
+    def _resolve_detections(self, source: DetectionSource) -> DetectionResult:
+        if isinstance(source, DetectionResult):
+            return source
+        if isinstance(source, FrameContext):
+            return self.detect_frame(source)
+
+        # Bare arrays are keyed by identity per thread, so one request passing
+        # the same array to several helpers runs YOLO once while concurrent
+        # requests never see each other's frames. Frames must not be modified
+        # in place between calls.
+        frame = getattr(self._thread_frames, "frame", None)
+        if frame is None or frame.image is not source:
+            frame = FrameContext(source)
+            self._thread_frames.frame = frame
+        return self.detect_frame(frame)
 
-        return motorcycle_detection, rider_detection
+    def detect_motorcycle_and_rider(
+        self, source: DetectionSource
+    ) -> Tuple[Optional[Dict], Optional[Dict]]:
+        all_detections = self._resolve_detections(source)
+        class_names = all_detections.class_names
 
-    def analyze_traffic_density(self, detections: List[Dict]) -> Dict[str, Any]:
-        vehicle_classes = {"car", "truck", "bus", "motorcycle", "bicycle"}
-        vehicles = [d for d in detections if d["class_name"] in vehicle_classes]
+        # Rows are sorted by confidence, so the first match is the best one
+        motorcycle_rows = np.flatnonzero(class_names == "motorcycle")
+        rider_rows = np.flatnonzero(class_names == "person")
 
-        total_vehicles = len(vehicles)
-        vehicle_distribution = {}
+        motorcycle_detection = (
+            all_detections[int(motorcycle_rows[0])] if len(motorcycle_rows) else None
+        )
+        rider_detection = (
+            all_detections[int(rider_rows[0])] if len(rider_rows) else None
+        )
 
-        for vehicle in vehicles:
-            class_name = vehicle["class_name"]
-            vehicle_distribution[class_name] = (
-                vehicle_distribution.get(class_name, 0) + 1
-            )
+        return motorcycle_detection, rider_detection
 
-        image_area = 640 * 640
-        vehicle_areas = sum(d["area"] for d in vehicles)
-        density_ratio = vehicle_areas / image_area if image_area > 0 else 0
-
-        if total_vehicles == 0:
-            density_level = "no_traffic"
-        elif total_vehicles <= 2 and density_ratio < 0.1:
-            density_level = "light"
-        elif total_vehicles <= 5 and density_ratio < 0.25:
-            density_level = "moderate"
-        elif total_vehicles <= 10 and density_ratio < 0.4:
-            density_level = "heavy"
+    def find_rider_box(self, source: DetectionSource) -> Optional[np.ndarray]:
+        """Box (x1, y1, x2, y2) of the person riding the most confident motorcycle.
+
+        People are scored by how much of their width sits over the motorcycle
+        and whether they vertically touch it, weighted by confidence. Without a
+        motorcycle the most confident person is used; with one but no
+        overlapping person, None is returned so callers fall back to the full
+        frame rather than lock onto a pedestrian.
+        """
+        detections = self._resolve_detections(source)
+        class_names = detections.class_names
+
+        people = np.flatnonzero(class_names == "person")
+        if len(people) == 0:
+            return None
+
+        motorcycles = np.flatnonzero(class_names == "motorcycle")
+        if len(motorcycles) == 0:
+            return detections.boxes[people[0]]
+
+        motorcycle = detections.boxes[motorcycles[0]]
+        boxes = detections.boxes[people]
+
+        overlap = np.minimum(boxes[:, 2], motorcycle[2]) - np.maximum(
+            boxes[:, 0], motorcycle[0]
+        )
+        widths = np.maximum(boxes[:, 2] - boxes[:, 0], 1e-6)
+        touches = (boxes[:, 3] >= motorcycle[1]) & (boxes[:, 1] <= motorcycle[3])
+        scores = np.clip(overlap / widths, 0.0, 1.0) * touches
+        scores = scores * detections.scores[people]
+
+        best = int(np.argmax(scores))
+        if scores[best] <= 0:
+            return None
+        return boxes[best]
+
+    def analyze_traffic_density(
+        self,
+        detections: Union[DetectionSource, List[Dict]],
+        image_size: Optional[Tuple[int, int]] = None,
+    ) -> Dict[str, Any]:
+        """Traffic summary; ``image_size`` is (height, width) if not known otherwise."""
+        if isinstance(detections, list):
+            detections = DetectionResult.from_dicts(detections, self._class_names)
         else:
-            density_level = "congested"
-
-        return {
-            "total_vehicles": total_vehicles,
-            "vehicle_distribution": vehicle_distribution,
-            "density_level": density_level,
-            "density_ratio": density_ratio,
-            "nearest_vehicle_distance": self._estimate_nearest_vehicle_distance(
-                vehicles
-            ),
-        }
-
-    def _estimate_nearest_vehicle_distance(self, vehicles: List[Dict]) -> float:
-        if not vehicles:
-            return float("inf")
-
-        largest_area = max(vehicle["area"] for vehicle in vehicles)
-
-        estimated_distance = max(
-            10.0, 100.0 / (largest_area / 10000.0)
-        )  # Rough approximation
+            detections = self._resolve_detections(detections)
 
-        return min(estimated_distance, 200.0)  # Cap at 200 meters
+        height, width = image_size or detections.image_shape or (640, 640)
+        return summarize_traffic(detections, float(height * width))
 
-    def detect_road_infrastructure(self, image: np.ndarray) -> Dict[str, List[Dict]]:
-        detections = self.detect_objects(image)
+    def detect_road_infrastructure(
+        self, source: DetectionSource
+    ) -> Dict[str, List[Dict]]:
+        detections = self._resolve_detections(source)
 
         infrastructure = {
             "traffic_lights": [],
@@ -248,8 +872,15 @@ class ObjectDetector:
     def get_model_info(self) -> Dict[str, Any]:
         return {
             "model_type": "YOLOv8",
+            "backend": self.backend,
+            "artifact": self.artifact_path,
+            "quantization": self.quantization,
+            "aspect_ratios": self.aspect_ratios,
+            "warmup_shapes": self.warmup_shapes,
+            "square_gflops": self.square_gflops,
             "device": self.device,
             "confidence_threshold": self.confidence_threshold,
             "target_classes": list(self.target_classes),
+            "allowed_class_ids": list(self.allowed_class_ids),
             "total_classes": len(self.class_mapping),
         }
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import shutil
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Detection rows are (x1, y1, x2, y2, confidence, class_id) in source pixels
+DetectionRows = np.ndarray
+
+LETTERBOX_COLOR = (114, 114, 114)
+
+# Largest YOLOv8 feature-map stride; rectangular inputs are multiples of it
+MAX_STRIDE = 32
+
+
+def letterbox_geometry(
+    image_shape: Tuple[int, int], new_shape: Tuple[int, int], stride: int = 0
+) -> Tuple[float, Tuple[int, int], Tuple[int, int, int, int]]:
+    """Gain, resized (w, h) and (top, bottom, left, right) borders of a letterbox.
+
+    With ``stride`` the padding is only taken up to the next stride multiple,
+    like Ultralytics' ``auto=True``, so a 16:9 frame becomes e.g. 640x384
+    instead of 640x640.
+    """
+    height, width = image_shape[:2]
+    gain = min(new_shape[0] / height, new_shape[1] / width)
+    resized_width, resized_height = int(round(width * gain)), int(round(height * gain))
+    pad_x = new_shape[1] - resized_width
+    pad_y = new_shape[0] - resized_height
+    if stride:
+        pad_x, pad_y = pad_x % stride, pad_y % stride
+    pad_x, pad_y = pad_x / 2, pad_y / 2
+
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    return gain, (resized_width, resized_height), (top, bottom, left, right)
+
+
+def letterbox(
+    image: np.ndarray, new_shape: Tuple[int, int], stride: int = 0
+) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """Resize ``image`` into ``new_shape`` (h, w) keeping its aspect ratio.
+
+    Mirrors Ultralytics' LetterBox: the resized frame is centred and the
+    rest padded with grey (see ``letterbox_geometry`` for ``stride``).
+    Returns the padded BGR image, the resize gain and the (x, y) padding
+    applied on the left/top.
+    """
+    gain, size, (top, bottom, left, right) = letterbox_geometry(
+        image.shape, new_shape, stride
+    )
+    if image.shape[1::-1] != size:
+        image = cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+
+    padded = cv2.copyMakeBorder(
+        image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR
+    )
+    return padded, gain, (left, top)
+
+
+def padded_shape(
+    image_shape: Tuple[int, int], new_shape: Tuple[int, int], stride: int = 0
+) -> Tuple[int, int]:
+    """(h, w) of the network input ``letterbox`` produces for ``image_shape``."""
+    _, (width, height), (top, bottom, left, right) = letterbox_geometry(
+        image_shape, new_shape, stride
+    )
+    return height + top + bottom, width + left + right
+
+
+def aspect_ratio_shape(
+    ratio: str, imgsz: int = 640, stride: int = MAX_STRIDE
+) -> Tuple[int, int]:
+    """Rectangular network input (h, w) for frames of ``ratio``, e.g. ``"16:9"``."""
+    width, _, height = ratio.partition(":")
+    width, height = float(width), float(height or width)
+    # Any frame of that ratio maps to the same input; use a 1920-px long side
+    scale = 1920 / max(width, height)
+    frame_shape = (int(round(height * scale)), int(round(width * scale)))
+    return padded_shape(frame_shape, (imgsz, imgsz), stride)
+
+
+def to_input_tensor(padded: np.ndarray) -> np.ndarray:
+    """BGR HWC uint8 -> RGB NCHW float32 in [0, 1]."""
+    tensor = padded[:, :, ::-1].transpose(2, 0, 1)[None]
+    return np.ascontiguousarray(tensor, dtype=np.float32) / 255.0
+
+
+def non_max_suppression(
+    prediction: np.ndarray,
+    conf_threshold: float,
+    iou_threshold: float = 0.7,
+    classes: Optional[Sequence[int]] = None,
+    max_det: int = 300,
+    max_nms: int = 30000,
+) -> DetectionRows:
+    """Decode one raw YOLOv8 head output (4 + C, anchors) into detection rows.
+
+    Follows Ultralytics' single-label NMS: each anchor takes its best class,
+    is dropped below ``conf_threshold`` or outside ``classes``, and boxes are
+    suppressed per class. Rows come back sorted by descending confidence.
+    """
+    prediction = prediction.T
+    class_scores = prediction[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(class_ids)), class_ids]
+
+    keep = scores > conf_threshold
+    if classes is not None:
+        keep &= np.isin(class_ids, classes)
+    if not keep.any():
+        return np.zeros((0, 6), dtype=np.float32)
+
+    boxes = _xywh_to_xyxy(prediction[keep, :4])
+    scores, class_ids = scores[keep], class_ids[keep]
+
+    order = np.argsort(-scores, kind="stable")[:max_nms]
+    boxes, scores, class_ids = boxes[order], scores[order], class_ids[order]
+
+    selected = _greedy_nms(boxes, class_ids, iou_threshold)[:max_det]
+    return np.concatenate(
+        [boxes[selected], scores[selected, None], class_ids[selected, None]], axis=1
+    ).astype(np.float32)
+
+
+def _xywh_to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    half = boxes[:, 2:4] / 2
+    return np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+
+
+def _greedy_nms(
+    boxes: np.ndarray, class_ids: np.ndarray, iou_threshold: float
+) -> np.ndarray:
+    """Indices kept by greedy NMS over score-sorted ``boxes``, per class."""
+    # Offsetting by class keeps boxes of different classes from overlapping
+    shifted = boxes + (class_ids * 7680.0)[:, None]
+    x1, y1, x2, y2 = shifted.T
+    areas = (x2 - x1) * (y2 - y1)
+
+    selected = []
+    remaining = np.arange(len(boxes))
+    while len(remaining):
+        best, rest = remaining[0], remaining[1:]
+        selected.append(best)
+
+        inter_w = np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest])
+        inter_h = np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest])
+        intersection = np.maximum(inter_w, 0) * np.maximum(inter_h, 0)
+        iou = intersection / (areas[best] + areas[rest] - intersection + 1e-7)
+        remaining = rest[iou <= iou_threshold]
+    return np.array(selected, dtype=np.int64)
+
+
+def scale_boxes(
+    rows: DetectionRows,
+    gain: float,
+    pad: Tuple[int, int],
+    image_shape: Tuple[int, int],
+) -> DetectionRows:
+    """Map letterboxed boxes back onto the (h, w) source image, clipped."""
+    rows = rows.copy()
+    rows[:, [0, 2]] = np.clip((rows[:, [0, 2]] - pad[0]) / gain, 0, image_shape[1])
+    rows[:, [1, 3]] = np.clip((rows[:, [1, 3]] - pad[1]) / gain, 0, image_shape[0])
+    return rows
+
+
+class OnnxBackend:
+    """YOLOv8 exported to ONNX and run on ONNX Runtime's CPU provider.
+
+    Letterboxing, NMS and box rescaling happen in NumPy, so a request never
+    touches torch. ``threads`` sets ORT's intra-op pool; 0 lets ORT use one
+    thread per physical core.
+    """
+
+    def __init__(self, model_path: str, imgsz: int = 640, threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        height, width = model_input.shape[2:4]
+        # Dynamic exports take any stride-multiple rectangle
+        self.dynamic = not (isinstance(height, int) and isinstance(width, int))
+        self.input_shape = (imgsz, imgsz) if self.dynamic else (height, width)
+        self.stride = MAX_STRIDE if self.dynamic else 0
+        self.model_path = model_path
+        logger.info(
+            f"ONNX Runtime detector loaded from {model_path} "
+            f"(input={'dynamic' if self.dynamic else self.input_shape}, "
+            f"threads={threads or 'auto'})"
+        )
+
+    def input_shapes(self, images: List[np.ndarray]) -> List[Tuple[int, int]]:
+        return [
+            padded_shape(image.shape, self.input_shape, self.stride) for image in images
+        ]
+
+    def predict(
+        self,
+        images: List[np.ndarray],
+        conf_threshold: float,
+        classes: Optional[Sequence[int]] = None,
+    ) -> List[DetectionRows]:
+        detections = []
+        for image in images:
+            padded, gain, pad = letterbox(image, self.input_shape, self.stride)
+            outputs = self.session.run(None, {self.input_name: to_input_tensor(padded)})
+            rows = non_max_suppression(outputs[0][0], conf_threshold, classes=classes)
+            detections.append(scale_boxes(rows, gain, pad, image.shape[:2]))
+        return detections
+
+
+class TorchBackend:
+    """YOLOv8 network called directly, bypassing Ultralytics' predictor.
+
+    ``predict`` redoes argument merging, source sniffing and pipeline setup
+    and builds Results objects on every call. Here frames are letterboxed
+    into reusable per-shape buffers (the same geometry the predictor uses
+    for .pt models), the fused network runs under ``torch.inference_mode``
+    and decoding uses the NumPy NMS shared with the ONNX backend, so rows
+    match ``predict``'s ``boxes.data``. Calls are serialized because the
+    buffers are shared.
+    """
+
+    def __init__(self, yolo: Any, device: str = "cpu", imgsz: int = 640):
+        import torch
+
+        self.torch = torch
+        self.device = torch.device(device)
+        self.network = yolo.model.to(self.device).fuse(verbose=False).float().eval()
+        self.stride = max(int(self.network.stride.max()), 32)
+        self.input_shape = (imgsz, imgsz)
+
+        # Letterbox canvases (RGB, HWC uint8) and input batches, per shape
+        self._canvases: Dict[Tuple[int, int], List[Any]] = {}
+        self._inputs: Dict[Tuple[int, int], Any] = {}
+        self._lock = threading.Lock()
+
+    def predict(
+        self,
+        images: List[np.ndarray],
+        conf_threshold: float,
+        classes: Optional[Sequence[int]] = None,
+    ) -> List[DetectionRows]:
+        stride = self._batch_stride(images)
+        geometries = [
+            letterbox_geometry(image.shape, self.input_shape, stride)
+            for image in images
+        ]
+
+        with self._lock:
+            batch = self._fill_inputs(images, geometries)
+            with self.torch.inference_mode():
+                output = self.network(batch)
+            if isinstance(output, (list, tuple)):
+                output = output[0]
+            prediction = output.float().cpu().numpy()
+
+        detections = []
+        for image, raw, (gain, _, (top, _, left, _)) in zip(
+            images, prediction, geometries
+        ):
+            rows = non_max_suppression(raw, conf_threshold, classes=classes)
+            detections.append(scale_boxes(rows, gain, (left, top), image.shape[:2]))
+        return detections
+
+    def input_shapes(self, images: List[np.ndarray]) -> List[Tuple[int, int]]:
+        stride = self._batch_stride(images)
+        return [padded_shape(image.shape, self.input_shape, stride) for image in images]
+
+    def _batch_stride(self, images: List[np.ndarray]) -> int:
+        # Like the predictor: minimal rectangles only when all shapes match
+        return self.stride if len({image.shape for image in images}) == 1 else 0
+
+    def _fill_inputs(self, images: List[np.ndarray], geometries: List[Tuple]) -> Any:
+        _, (width, height), (top, bottom, left, right) = geometries[0]
+        shape = (height + top + bottom, width + left + right)
+
+        inputs = self._inputs.get(shape)
+        if inputs is None or len(inputs) < len(images):
+            inputs = self.torch.empty(
+                (len(images), 3, *shape), dtype=self.torch.float32, device=self.device
+            )
+            self._inputs[shape] = inputs
+
+        for index, (image, geometry) in enumerate(zip(images, geometries)):
+            canvas = self._canvas(shape, geometry)
+            _, size, (top, _, left, _) = geometry
+            if image.shape[1::-1] != size:
+                image = cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+            canvas[top : top + size[1], left : left + size[0]] = image[..., ::-1]
+            inputs[index].copy_(self.torch.from_numpy(canvas).permute(2, 0, 1))
+
+        batch = inputs[: len(images)]
+        return batch.div_(255.0)
+
+    def _canvas(self, shape: Tuple[int, int], geometry: Tuple) -> np.ndarray:
+        # Borders only need repainting when the placement inside them changes
+        entry = self._canvases.get(shape)
+        if entry is None:
+            entry = [np.empty((*shape, 3), dtype=np.uint8), None]
+            self._canvases[shape] = entry
+        if entry[1] != geometry[1:]:
+            entry[0][:] = LETTERBOX_COLOR
+            entry[1] = geometry[1:]
+        return entry[0]
+
+
+def export_onnx(
+    weights_path: str,
+    imgsz: int = 640,
+    output_dir: Optional[str] = None,
+    dynamic: bool = False,
+) -> str:
+    """Export Ultralytics weights to ONNX.
+
+    Without ``output_dir`` the export lands next to the weights and is
+    reused on later calls; its name records ``imgsz`` and ``dynamic`` so a
+    different configuration never picks up a stale export. With
+    ``output_dir``, a fresh export is written there. ``dynamic`` exports
+    with free input height/width for rectangular inference.
+    """
+    suffix = f"-{imgsz}" + ("-dynamic" if dynamic else "") + ".onnx"
+    if output_dir is None:
+        onnx_path = os.path.splitext(weights_path)[0] + suffix
+        if os.path.exists(onnx_path):
+            return onnx_path
+    else:
+        # Ultralytics writes next to the weights, so export from a copy
+        weights_path = shutil.copy2(weights_path, output_dir)
+
+    from ultralytics import YOLO
+
+    logger.info(
+        f"Exporting {weights_path} to ONNX at {imgsz}px"
+        + (" with dynamic input shape" if dynamic else "")
+    )
+    exported = YOLO(weights_path).export(format="onnx", imgsz=imgsz, dynamic=dynamic)
+    onnx_path = os.path.splitext(weights_path)[0] + suffix
+    if exported != onnx_path:
+        os.replace(exported, onnx_path)
+    return onnx_path
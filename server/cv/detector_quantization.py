@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from artifact_cache import file_sha256
+from detector_backends import MAX_STRIDE, letterbox, to_input_tensor
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+
+# Drift the INT8 detector may show against FP32 and still be enabled.
+# Classes with fewer reference boxes than min_class_support are only
+# counted in the overall numbers.
+DEFAULT_DRIFT_TOLERANCE = {
+    "min_recall": 0.95,
+    "min_precision": 0.9,
+    "min_class_recall": 0.9,
+    "min_class_support": 10,
+    "min_mean_iou": 0.9,
+    "max_score_drift": 2.0,
+}
+
+
+def frame_files(folder: str) -> List[str]:
+    """Images and videos directly inside ``folder``, sorted by name."""
+    return [
+        os.path.join(folder, name)
+        for name in sorted(os.listdir(folder))
+        if name.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)
+    ]
+
+
+def load_frames(folder: str, limit: int = 100, stride: int = 30) -> List[np.ndarray]:
+    """Up to ``limit`` BGR frames: every image, and every ``stride``-th video frame."""
+    frames: List[np.ndarray] = []
+    for path in frame_files(folder):
+        if len(frames) >= limit:
+            break
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                logger.warning(f"Skipping unreadable calibration image {path}")
+            else:
+                frames.append(image)
+            continue
+
+        capture = cv2.VideoCapture(path)
+        index = 0
+        while len(frames) < limit:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if index % stride == 0:
+                frames.append(frame)
+            index += 1
+        capture.release()
+    return frames
+
+
+def calibration_digest(folder: str) -> str:
+    """Content hash of the calibration folder, for artifact cache keys."""
+    digest = hashlib.sha256()
+    for path in frame_files(folder):
+        digest.update(f"{os.path.basename(path)}:{file_sha256(path)}\n".encode())
+    return digest.hexdigest()
+
+
+def quantize_detector(
+    onnx_path: str,
+    frames: List[np.ndarray],
+    output_dir: Optional[str] = None,
+    imgsz: int = 640,
+) -> str:
+    """Statically quantize an exported YOLOv8 ONNX model to INT8.
+
+    Activation ranges are calibrated (min/max) on ``frames``, letterboxed
+    exactly as at inference time. Weights are per-channel INT8 and
+    activations UINT8 in QDQ format, which ORT fuses into integer kernels
+    on CPU. The box/score decoding at the end of the detect head stays in
+    FP32: it mixes pixel coordinates with [0, 1] scores in one tensor, and
+    quantizing it would cost far more accuracy than it saves time.
+    """
+    import onnx
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    if not frames:
+        raise ValueError("INT8 calibration needs at least one frame")
+
+    model = onnx.load(onnx_path)
+    model_input = model.graph.input[0]
+    dims = [dim.dim_value for dim in model_input.type.tensor_type.shape.dim[2:4]]
+    # Dynamic exports are calibrated on the rectangles they will run at
+    stride = 0 if all(dims) else MAX_STRIDE
+    input_shape = tuple(dims) if all(dims) else (imgsz, imgsz)
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.frames = iter(frames)
+
+        def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+            frame = next(self.frames, None)
+            if frame is None:
+                return None
+            padded, _, _ = letterbox(frame, input_shape, stride)
+            return {model_input.name: to_input_tensor(padded)}
+
+    output_dir = output_dir or os.path.dirname(os.path.abspath(onnx_path))
+    stem = os.path.splitext(os.path.basename(onnx_path))[0]
+    prepared = os.path.join(output_dir, f"{stem}.prep.onnx")
+    output = os.path.join(output_dir, f"{stem}.int8.onnx")
+
+    logger.info(f"Calibrating INT8 detector on {len(frames)} frames")
+    quant_pre_process(onnx_path, prepared)
+    try:
+        quantize_static(
+            prepared,
+            output,
+            FrameReader(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            calibrate_method=CalibrationMethod.MinMax,
+            nodes_to_exclude=_decode_nodes(onnx.load(prepared)),
+        )
+    finally:
+        os.remove(prepared)
+    return output
+
+
+def _decode_nodes(model) -> List[str]:
+    """Non-conv nodes of the last ``/model.N/`` block (the detect head)."""
+    blocks = {}
+    for node in model.graph.node:
+        match = re.match(r"/model\.(\d+)/", node.name)
+        if match:
+            blocks.setdefault(int(match.group(1)), []).append(node)
+    if not blocks:
+        return []
+    return [node.name for node in blocks[max(blocks)] if node.op_type != "Conv"]
+
+
+def evaluate_drift(
+    reference: List[Any],
+    candidate: List[Any],
+    analyzer: Optional[Any] = None,
+    poses: Optional[List[Dict]] = None,
+    scenes: Optional[List[Dict]] = None,
+) -> Dict[str, Any]:
+    """Drift of ``candidate`` (INT8) detections from ``reference`` (FP32).
+
+    Detections are matched with ``compare_detections``. With a
+    RidingAnalyzer plus per-frame poses and scenes, both detection sets
+    are also scored and the change in unrounded component scores (0-100
+    points) is summarized.
+    """
+    from detector import compare_detections
+
+    report: Dict[str, Any] = {
+        "frames": len(reference),
+        "detections": compare_detections(reference, candidate),
+        "scores": None,
+    }
+    if analyzer is None or poses is None or scenes is None:
+        return report
+
+    widths = [
+        result.image_shape[1] if result.image_shape else 640 for result in reference
+    ]
+    components = []
+    for detections in (reference, candidate):
+        inputs = analyzer.columnar_inputs(detections, poses, scenes, widths)
+        components.append(analyzer.analyze_batch(**inputs)["components"])
+
+    report["scores"] = {
+        name: {
+            "mean_abs": float(np.mean(np.abs(components[1][name] - values))),
+            "max_abs": float(np.max(np.abs(components[1][name] - values))),
+        }
+        for name, values in components[0].items()
+    }
+    return report
+
+
+def drift_violations(
+    report: Optional[Dict[str, Any]], tolerance: Optional[Dict[str, float]] = None
+) -> List[str]:
+    """Reasons the INT8 detector must not be enabled; empty when it may be."""
+    if report is None:
+        return ["no evaluation report for this INT8 model"]
+
+    limits = {**DEFAULT_DRIFT_TOLERANCE, **(tolerance or {})}
+    detections = report["detections"]
+    violations = []
+
+    for name, key in (
+        ("recall", "min_recall"),
+        ("precision", "min_precision"),
+        ("mean_iou", "min_mean_iou"),
+    ):
+        # Mean IoU is undefined (reported as 0) when nothing matched
+        if name == "mean_iou" and detections["matched"] == 0:
+            continue
+        if detections[name] < limits[key]:
+            violations.append(f"{name} {detections[name]:.3f} < {limits[key]}")
+
+    for name, stats in detections["per_class"].items():
+        if (
+            stats["reference"] >= limits["min_class_support"]
+            and stats["recall"] < limits["min_class_recall"]
+        ):
+            violations.append(
+                f"{name} recall {stats['recall']:.3f} < {limits['min_class_recall']}"
+            )
+
+    if report["scores"] is None:
+        violations.append("no RidingAnalyzer score comparison")
+    elif report["scores"]["overall"]["mean_abs"] > limits["max_score_drift"]:
+        violations.append(
+            f"overall score drift {report['scores']['overall']['mean_abs']:.2f} "
+            f"> {limits['max_score_drift']}"
+        )
+    return violations
+
+
+def report_path(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + ".eval.json"
+
+
+def write_report(model_path: str, report: Dict[str, Any]):
+    """Store ``report`` next to the INT8 model it describes."""
+    path = report_path(model_path)
+    with open(path + ".tmp", "w") as f:
+        json.dump({**report, "model_sha256": file_sha256(model_path)}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def read_report(model_path: str) -> Optional[Dict[str, Any]]:
+    """Evaluation report of ``model_path``; None if missing or for another build."""
+    path = report_path(model_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        report = json.load(f)
+    if report.get("model_sha256") != file_sha256(model_path):
+        logger.warning(f"Ignoring {path}: it was written for a different model")
+        return None
+    return report
+
+
+def summarize_report(report: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if report is None:
+        return None
+    detections = report["detections"]
+    return {
+        "frames": report["frames"],
+        "recall": detections["recall"],
+        "precision": detections["precision"],
+        "mean_iou": detections["mean_iou"],
+        "overall_score_drift": (
+            report["scores"]["overall"]["mean_abs"] if report["scores"] else None
+        ),
+    }
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+import cv2
+import numpy as np
+
+
+class FrameContext:
+    """Per-frame cache of derived image views shared by all analysis stages.
+
+    Views are built lazily on first access and memoized, so a colour
+    conversion happens at most once per frame even when several stages (or
+    stage threads) ask for it. Returned arrays are shared and must be treated
+    as read-only. Stages can cache their own per-frame results (e.g.
+    detections) through ``memo``. ``source_scale`` maps ``image`` pixels to
+    the uploaded frame's (``source = image * source_scale``) when it was
+    downscaled while decoding.
+    """
+
+    def __init__(self, image: np.ndarray, source_scale: float = 1.0):
+        self.image = image
+        self.source_scale = source_scale
+        self.height, self.width = image.shape[:2]
+        self._views: Dict[Hashable, Any] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def memo(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """Return the value cached under ``key``, building it on first use."""
+        if key in self._views:
+            return self._views[key]
+
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if key not in self._views:
+                self._views[key] = build()
+            return self._views[key]
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self.memo("gray", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def hsv(self) -> np.ndarray:
+        return self.memo("hsv", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2HSV))
+
+    @property
+    def rgb(self) -> np.ndarray:
+        return self.memo("rgb", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB))
+
+    def resized(self, width: int) -> np.ndarray:
+        """BGR view scaled to ``width`` pixels wide, keeping the aspect ratio."""
+        if width >= self.width:
+            return self.image
+        size = self._scaled_size(width)
+        return self.memo(
+            ("resized", size),
+            lambda: cv2.resize(self.image, size, interpolation=cv2.INTER_AREA),
+        )
+
+    def scaled(self, width: int) -> "FrameContext":
+        """Context for the ``resized(width)`` view, with its own memoized views."""
+        if width >= self.width:
+            return self
+        return self.memo(
+            ("scaled", self._scaled_size(width)),
+            lambda: FrameContext(self.resized(width)),
+        )
+
+    def _scaled_size(self, width: int) -> Tuple[int, int]:
+        height = max(1, int(round(self.height * width / self.width)))
+        return width, height
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import io
+import base64
+import logging
+from typing import Dict, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# SOF0-SOF15 carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) do not
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class DecodePolicy:
+    """Choose how far to downscale a frame while it is being decoded.
+
+    ``stage_targets`` maps each analysis stage to the long side it needs
+    (YOLO letterboxes to 640, scene statistics are coarser). All stages share
+    one decoded frame, so it is decoded just large enough for the most
+    demanding one, and a stage at 0 needs full resolution. An explicit
+    ``target_long_side`` takes precedence. ``max_pixels`` is a hard
+    per-request budget. Zero disables either limit.
+    """
+
+    def __init__(
+        self,
+        target_long_side: int = 0,
+        max_pixels: int = 0,
+        stage_targets: Optional[Dict[str, int]] = None,
+    ):
+        self.stage_targets = dict(stage_targets or {})
+        if not target_long_side and self.stage_targets:
+            targets = self.stage_targets.values()
+            target_long_side = 0 if min(targets) <= 0 else max(targets)
+        self.target_long_side = target_long_side
+        self.max_pixels = max_pixels
+
+    @property
+    def enabled(self) -> bool:
+        return self.target_long_side > 0 or self.max_pixels > 0
+
+    def reduction_for(self, width: int, height: int) -> int:
+        reduction = 1
+        for factor in (2, 4, 8):
+            if self._fits_target(width, height, factor):
+                reduction = factor
+
+        while (
+            self.max_pixels > 0
+            and reduction < 8
+            and (width // reduction) * (height // reduction) > self.max_pixels
+        ):
+            reduction *= 2
+
+        return reduction
+
+    def _fits_target(self, width: int, height: int, factor: int) -> bool:
+        if self.target_long_side <= 0:
+            return False
+        return max(width, height) // factor >= self.target_long_side
+
+    def with_overrides(self, config: Optional[dict]) -> "DecodePolicy":
+        if not config:
+            return self
+        return DecodePolicy(
+            target_long_side=int(
+                config.get("decode_target_size", self.target_long_side)
+            ),
+            max_pixels=int(config.get("max_pixels", self.max_pixels)),
+            stage_targets=self.stage_targets,
+        )
+
+
+def read_jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Return (width, height) from the JPEG SOF header without decoding."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+
+        if marker in _JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[i + 5 : i + 7], "big")
+            width = int.from_bytes(data[i + 7 : i + 9], "big")
+            return width, height
+
+        segment_length = int.from_bytes(data[i + 2 : i + 4], "big")
+        i += 2 + segment_length
+
+    return None
+
+
+def decode_frame(
+    image_data: Union[bytes, str], policy: Optional[DecodePolicy] = None
+) -> Tuple[Optional[np.ndarray], float]:
+    """Decode an uploaded frame, honouring ``policy``.
+
+    Returns the BGR image and the scale from decoded to source pixels
+    (``source = decoded * scale``), so callers can map boxes back.
+    """
+    try:
+        if isinstance(image_data, str):
+            image_data = base64.b64decode(image_data)
+
+        nparr = np.frombuffer(image_data, np.uint8)
+
+        source_size = None
+        reduction = 1
+        if policy is not None and policy.enabled:
+            source_size = read_jpeg_size(image_data)
+            if source_size is not None:
+                reduction = policy.reduction_for(*source_size)
+
+        image = cv2.imdecode(nparr, _REDUCED_FLAGS[reduction])
+
+        if image is None:
+            pil_image = Image.open(io.BytesIO(image_data))
+            image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+            source_size = None
+
+        if source_size is None:
+            source_size = (image.shape[1], image.shape[0])
+
+        if policy is not None and policy.max_pixels > 0:
+            image = fit_pixel_budget(image, policy.max_pixels)
+
+        return image, source_size[0] / image.shape[1]
+
+    except Exception as e:
+        logger.error(f"Image decoding failed: {e}")
+        return None, 1.0
+
+
+def fit_pixel_budget(image: np.ndarray, max_pixels: int) -> np.ndarray:
+    """``image`` area-downscaled to at most ``max_pixels``, keeping its aspect ratio."""
+    height, width = image.shape[:2]
+    if width * height <= max_pixels:
+        return image
+
+    factor = (max_pixels / float(width * height)) ** 0.5
+    size = (max(1, int(width * factor)), max(1, int(height * factor)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+from collections.abc import Mapping
+from typing import Dict, Iterable, List, Any, Iterator, Optional, Tuple
+
+import numpy as np
+
+# MediaPipe Pose landmark order; every backend is stored in these slots
+LANDMARK_NAMES = (
+    "nose",
+    "left_eye_inner",
+    "left_eye",
+    "left_eye_outer",
+    "right_eye_inner",
+    "right_eye",
+    "right_eye_outer",
+    "left_ear",
+    "right_ear",
+    "mouth_left",
+    "mouth_right",
+    "left_shoulder",
+    "right_shoulder",
+    "left_elbow",
+    "right_elbow",
+    "left_wrist",
+    "right_wrist",
+    "left_pinky",
+    "right_pinky",
+    "left_index",
+    "right_index",
+    "left_thumb",
+    "right_thumb",
+    "left_hip",
+    "right_hip",
+    "left_knee",
+    "right_knee",
+    "left_ankle",
+    "right_ankle",
+    "left_heel",
+    "right_heel",
+    "left_foot_index",
+    "right_foot_index",
+)
+
+LANDMARK_INDEX = {name: idx for idx, name in enumerate(LANDMARK_NAMES)}
+
+RIDING_KEYPOINTS = (
+    "nose",
+    "left_shoulder",
+    "right_shoulder",
+    "left_elbow",
+    "right_elbow",
+    "left_wrist",
+    "right_wrist",
+    "left_hip",
+    "right_hip",
+    "left_knee",
+    "right_knee",
+    "left_ankle",
+    "right_ankle",
+)
+
+# (a, b, c) landmark triplets; each angle is measured at b
+JOINT_TRIPLETS = {
+    "left_elbow": ("left_shoulder", "left_elbow", "left_wrist"),
+    "right_elbow": ("right_shoulder", "right_elbow", "right_wrist"),
+    "left_knee": ("left_hip", "left_knee", "left_ankle"),
+    "right_knee": ("right_hip", "right_knee", "right_ankle"),
+    "left_hip": ("left_shoulder", "left_hip", "left_knee"),
+    "right_hip": ("right_shoulder", "right_hip", "right_knee"),
+    "left_shoulder": ("left_hip", "left_shoulder", "left_elbow"),
+    "right_shoulder": ("right_hip", "right_shoulder", "right_elbow"),
+}
+
+JOINT_INDEX = {name: idx for idx, name in enumerate(JOINT_TRIPLETS)}
+
+_TRIPLET_ROWS = np.array(
+    [[LANDMARK_INDEX[name] for name in triplet] for triplet in JOINT_TRIPLETS.values()]
+)
+
+
+def joint_angles(points: np.ndarray) -> np.ndarray:
+    """Angles in degrees for every ``JOINT_TRIPLETS`` entry.
+
+    ``points`` is a (33, >=2) landmark array or a (N, 33, >=2) batch; the
+    result is (J,) or (N, J) in ``JOINT_INDEX`` order. Joints with a
+    zero-length limb come back as NaN.
+    """
+    xy = np.asarray(points, dtype=np.float64)[..., :2]
+    triplets = xy[..., _TRIPLET_ROWS, :]
+    # (..., J, 2, 2): the b->a and b->c limb vectors
+    limbs = triplets[..., ::2, :] - triplets[..., 1:2, :]
+
+    squared = limbs * limbs
+    lengths = np.sqrt(squared[..., 0] + squared[..., 1])
+    norms = lengths[..., 0] * lengths[..., 1]
+    dot = limbs[..., 0, 0] * limbs[..., 1, 0] + limbs[..., 0, 1] * limbs[..., 1, 1]
+
+    degenerate = norms == 0
+    cos_angle = np.minimum(
+        np.maximum(dot / np.where(degenerate, 1.0, norms), -1.0), 1.0
+    )
+    return np.where(degenerate, np.nan, np.degrees(np.arccos(cos_angle)))
+
+
+def landmark_array(landmarks: Mapping) -> np.ndarray:
+    """(33, 4) float64 x, y, z, visibility for PoseLandmarks or legacy dicts."""
+    if isinstance(landmarks, PoseLandmarks):
+        return landmarks.to_array()
+
+    points = np.zeros((len(LANDMARK_NAMES), 4), dtype=np.float64)
+    for name, point in landmarks.items():
+        if name in LANDMARK_INDEX:
+            points[LANDMARK_INDEX[name]] = (
+                point["x"],
+                point["y"],
+                point.get("z", 0.0),
+                point.get("visibility", float(point.get("visible", False))),
+            )
+    return points
+
+
+def landmark_angles(landmarks: Mapping) -> np.ndarray:
+    """``joint_angles`` for one frame, reusing PoseLandmarks' cached result."""
+    if isinstance(landmarks, PoseLandmarks):
+        return landmarks.angles
+    return joint_angles(landmark_array(landmarks))
+
+
+class PoseLandmarks(Mapping):
+    """Landmarks for one frame as a (33, 4) float32 array of x, y, z, visibility.
+
+    Coordinates are normalized to the full frame and rows follow
+    ``LANDMARK_NAMES``. ``present`` marks the rows the backend filled in and
+    ``selected`` the rows this view exposes, so subsets share one array. The
+    legacy per-landmark dicts are built on access only; the mapping itself
+    is read-only.
+    """
+
+    def __init__(
+        self,
+        points: np.ndarray,
+        present: Optional[np.ndarray] = None,
+        image_size: Tuple[int, int] = (0, 0),
+        selected: Optional[np.ndarray] = None,
+    ):
+        self.points = np.asarray(points, dtype=np.float32).reshape(
+            len(LANDMARK_NAMES), 4
+        )
+        self.present = (
+            np.ones(len(LANDMARK_NAMES), dtype=bool) if present is None else present
+        )
+        # (width, height) of the frame, for pixel coordinates
+        self.image_size = image_size
+        self.selected = self.present if selected is None else selected & self.present
+        self._angles: Optional[np.ndarray] = None
+
+    @classmethod
+    def empty(cls) -> "PoseLandmarks":
+        return cls(
+            np.zeros((len(LANDMARK_NAMES), 4), np.float32),
+            np.zeros(len(LANDMARK_NAMES), dtype=bool),
+        )
+
+    @property
+    def angles(self) -> np.ndarray:
+        """Joint angles in ``JOINT_INDEX`` order, computed once per frame."""
+        if self._angles is None:
+            self._angles = joint_angles(self.points)
+        return self._angles
+
+    @property
+    def visible(self) -> np.ndarray:
+        return self.selected & (self.points[:, 3] > 0.5)
+
+    def subset(self, names: Iterable[str]) -> "PoseLandmarks":
+        mask = np.zeros(len(LANDMARK_NAMES), dtype=bool)
+        mask[[LANDMARK_INDEX[name] for name in names]] = True
+        subset = PoseLandmarks(self.points, self.present, self.image_size, mask)
+        subset._angles = self._angles
+        return subset
+
+    def to_array(self) -> np.ndarray:
+        """(33, 4) float64 copy with rows outside this view zeroed."""
+        return np.where(self.selected[:, None], self.points, 0.0).astype(np.float64)
+
+    def to_keypoints(self) -> List[Dict[str, Any]]:
+        """Keypoint list for the JSON response."""
+        indices = np.flatnonzero(self.selected)
+        return [
+            {
+                "name": LANDMARK_NAMES[idx],
+                "x": x,
+                "y": y,
+                "confidence": visibility,
+                "visible": visibility > 0.5,
+            }
+            for idx, (x, y, _, visibility) in zip(
+                indices.tolist(), self.points[indices].tolist()
+            )
+        ]
+
+    def __getitem__(self, name: str) -> Dict[str, Any]:
+        idx = LANDMARK_INDEX.get(name)
+        if idx is None or not self.selected[idx]:
+            raise KeyError(name)
+
+        x, y, z, visibility = self.points[idx].tolist()
+        width, height = self.image_size
+        return {
+            "x": x,
+            "y": y,
+            "z": z,
+            "x_pixel": int(x * width),
+            "y_pixel": int(y * height),
+            "visibility": visibility,
+            "confidence": visibility,
+            "visible": visibility > 0.5,
+        }
+
+    def __contains__(self, name: object) -> bool:
+        idx = LANDMARK_INDEX.get(name)  # type: ignore[arg-type]
+        return idx is not None and bool(self.selected[idx])
+
+    def __iter__(self) -> Iterator[str]:
+        return (LANDMARK_NAMES[idx] for idx in np.flatnonzero(self.selected))
+
+    def __len__(self) -> int:
+        return int(self.selected.sum())
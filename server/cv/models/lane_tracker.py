@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from frame_context import FrameContext
+
+logger = logging.getLogger(__name__)
+
+
+class LaneTracker:
+    """Lane-line tracker for one video stream.
+
+    Lines are kept as ``x = slope * y + intercept`` in road-strip pixels of a
+    fixed-width view, so thresholds do not depend on the upload size. A full
+    Canny + HoughLinesP detection runs on a perspective-limited ROI only when
+    there is nothing to track, tracking confidence drops, or
+    ``redetect_interval`` frames have passed. In between, Canny only runs
+    around the tracked lines and each line is refit from the edge pixels in
+    a narrow band around its previous position.
+    """
+
+    PROCESS_WIDTH = 640
+    ROAD_TOP = 0.6
+    MAX_LINES = 6
+    # Row strips a tracked line's band is boxed into; more hug slanted lines
+    # closer at the cost of more (smaller) Canny calls
+    BAND_STRIPS = 4
+    # Context around each box so gradients and non-maximum suppression at
+    # its edges match a full-frame Canny
+    BAND_PADDING = 4
+    # Above this share of the road strip, boxing the bands saves nothing
+    MAX_BAND_COVERAGE = 0.35
+
+    def __init__(
+        self,
+        band_width: float = 0.04,
+        min_support: float = 0.15,
+        min_confidence: float = 0.75,
+        redetect_interval: int = 30,
+        count_hysteresis: int = 3,
+        smoothing: float = 0.5,
+    ):
+        self.band_width = band_width
+        self.min_support = min_support
+        self.min_confidence = min_confidence
+        self.redetect_interval = redetect_interval
+        self.count_hysteresis = count_hysteresis
+        self.smoothing = smoothing
+
+        self.lines: List[np.ndarray] = []
+        self.lane_count = 2
+        self.confidence = 0.0
+        self._shape: Optional[Tuple[int, int]] = None
+        self._roi_mask: Optional[np.ndarray] = None
+        self._frames_since_detect = 0
+        self._pending_count: Optional[int] = None
+        self._pending_frames = 0
+        self.lock = threading.Lock()
+
+    def update(self, frame: FrameContext) -> Dict[str, Any]:
+        view = frame.scaled(self.PROCESS_WIDTH)
+        gray_road = view.gray[int(view.height * self.ROAD_TOP) :, :]
+
+        if gray_road.shape != self._shape:
+            self._reset(gray_road.shape)
+
+        confidence = 0.0
+        tracked: List[np.ndarray] = []
+        if self.lines and self._frames_since_detect < self.redetect_interval:
+            tracked, confidence = self._track(self._band_edges(gray_road))
+
+        redetected = confidence < self.min_confidence
+        if redetected:
+            edges = cv2.bitwise_and(cv2.Canny(gray_road, 50, 150), self._roi_mask)
+            self.lines = self._detect(edges)
+            self._frames_since_detect = 0
+            confidence = 1.0 if self.lines else 0.0
+        else:
+            self.lines = tracked
+            self._frames_since_detect += 1
+
+        self.confidence = confidence
+        self._update_lane_count()
+
+        return {
+            "lane_count": self.lane_count,
+            "lines": len(self.lines),
+            "confidence": confidence,
+            "redetected": redetected,
+        }
+
+    def _reset(self, shape: Tuple[int, int]):
+        height, width = shape
+        self._shape = shape
+        self.lines = []
+        self._frames_since_detect = 0
+
+        # Road narrows towards the horizon; ignore the top corners
+        polygon = np.array(
+            [
+                (0, height - 1),
+                (int(width * 0.25), 0),
+                (int(width * 0.75), 0),
+                (width - 1, height - 1),
+            ],
+            dtype=np.int32,
+        )
+        self._roi_mask = np.zeros(shape, dtype=np.uint8)
+        cv2.fillConvexPoly(self._roi_mask, polygon, 255)
+
+    def _detect(self, edges: np.ndarray) -> List[np.ndarray]:
+        height, width = edges.shape
+        segments = cv2.HoughLinesP(
+            edges,
+            1,
+            np.pi / 180,
+            threshold=30,
+            minLineLength=max(10, height // 6),
+            maxLineGap=10,
+        )
+        if segments is None:
+            return []
+
+        segments = segments.reshape(-1, 4).astype(np.float64)
+        dx = segments[:, 2] - segments[:, 0]
+        dy = segments[:, 3] - segments[:, 1]
+
+        # Lane markings run towards the vanishing point; drop near-horizontal
+        # segments (shadows, crossings, vehicle edges)
+        steep = np.abs(dy) > np.abs(dx) * np.tan(np.radians(20))
+        segments, dx, dy = segments[steep], dx[steep], dy[steep]
+        if len(segments) == 0:
+            return []
+
+        slopes = dx / dy
+        intercepts = segments[:, 0] - slopes * segments[:, 1]
+        lengths = np.hypot(dx, dy)
+        bottoms = slopes * (height - 1) + intercepts
+
+        # Merge segments that meet the bottom edge close together
+        order = np.argsort(bottoms)
+        lines: List[np.ndarray] = []
+        group = [order[0]]
+        for index in order[1:]:
+            if bottoms[index] - bottoms[group[-1]] < width * 0.05:
+                group.append(index)
+                continue
+            lines.append(self._merge(group, slopes, intercepts, lengths))
+            group = [index]
+        lines.append(self._merge(group, slopes, intercepts, lengths))
+
+        supported = [line for line in lines if line[2] >= height * 0.25]
+        supported.sort(key=lambda line: -line[2])
+        return [line[:2] for line in supported[: self.MAX_LINES]]
+
+    def _merge(
+        self,
+        group: List[int],
+        slopes: np.ndarray,
+        intercepts: np.ndarray,
+        lengths: np.ndarray,
+    ) -> np.ndarray:
+        weights = lengths[group]
+        return np.array(
+            [
+                np.average(slopes[group], weights=weights),
+                np.average(intercepts[group], weights=weights),
+                weights.sum(),
+            ]
+        )
+
+    def _band_edges(self, gray_road: np.ndarray) -> np.ndarray:
+        """Canny edges inside the tracked lines' bands; zero elsewhere."""
+        height, width = gray_road.shape
+        boxes = self._band_boxes(height, width)
+        area = sum(
+            (bottom - top) * (right - left) for top, bottom, left, right in boxes
+        )
+        # Many or steep lines cover most of the strip; one call is cheaper
+        if area > height * width * self.MAX_BAND_COVERAGE:
+            return cv2.bitwise_and(cv2.Canny(gray_road, 50, 150), self._roi_mask)
+
+        pad = self.BAND_PADDING
+        edges = np.zeros_like(gray_road)
+        for top, bottom, left, right in boxes:
+            y0, x0 = max(0, top - pad), max(0, left - pad)
+            patch = cv2.Canny(gray_road[y0 : bottom + pad, x0 : right + pad], 50, 150)
+            edges[top:bottom, left:right] = patch[
+                top - y0 : bottom - y0, left - x0 : right - x0
+            ]
+        return cv2.bitwise_and(edges, self._roi_mask)
+
+    def _band_boxes(self, height: int, width: int) -> List[Tuple[int, int, int, int]]:
+        """(top, bottom, left, right) boxes covering every tracked line's band."""
+        band = width * self.band_width
+        rows = np.linspace(0, height, self.BAND_STRIPS + 1).astype(int).tolist()
+        boxes = []
+        for top, bottom in zip(rows[:-1], rows[1:]):
+            spans = []
+            for slope, intercept in self.lines:
+                ends = (slope * top + intercept, slope * (bottom - 1) + intercept)
+                left = max(0, int(np.floor(min(ends) - band)))
+                right = min(width, int(np.ceil(max(ends) + band)) + 1)
+                if left < right:
+                    spans.append([left, right])
+
+            # Overlapping bands share one box so no pixel is run twice
+            spans.sort()
+            merged: List[List[int]] = []
+            for span in spans:
+                if merged and span[0] <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], span[1])
+                else:
+                    merged.append(span)
+            boxes.extend((top, bottom, left, right) for left, right in merged)
+        return boxes
+
+    def _track(self, edges: np.ndarray) -> Tuple[List[np.ndarray], float]:
+        height, width = edges.shape
+        ys, xs = np.nonzero(edges)
+        band = width * self.band_width
+
+        tracked = []
+        for slope, intercept in self.lines:
+            in_band = np.abs(xs - (slope * ys + intercept)) < band
+            band_ys, band_xs = ys[in_band], xs[in_band]
+
+            # Dashed markings leave gaps, so support is the share of rows hit
+            if len(np.unique(band_ys)) < height * self.min_support:
+                continue
+
+            fit = np.polyfit(band_ys, band_xs, 1)
+            previous = np.array([slope, intercept])
+            tracked.append(self.smoothing * fit + (1 - self.smoothing) * previous)
+
+        return tracked, len(tracked) / len(self.lines)
+
+    def _update_lane_count(self):
+        # Boundary lines enclose one lane fewer; fewer than two says nothing
+        if len(self.lines) < 2:
+            observed = self.lane_count
+        else:
+            observed = int(np.clip(len(self.lines) - 1, 1, 4))
+
+        if observed == self.lane_count:
+            self._pending_count, self._pending_frames = None, 0
+            return
+
+        if observed == self._pending_count:
+            self._pending_frames += 1
+        else:
+            self._pending_count, self._pending_frames = observed, 1
+
+        if self._pending_frames >= self.count_hysteresis:
+            self.lane_count = observed
+            self._pending_count, self._pending_frames = None, 0
+
+
+class LaneTrackerPool:
+    """LRU pool of per-client lane trackers."""
+
+    def __init__(self, max_sessions: int = 32, **tracker_options: Any):
+        self.max_sessions = max(1, max_sessions)
+        self._tracker_options = tracker_options
+        self._trackers: "OrderedDict[str, LaneTracker]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"frames": 0, "redetections": 0, "evicted": 0}
+
+    def update(self, client_id: str, frame: FrameContext) -> Dict[str, Any]:
+        with self._lock:
+            tracker = self._trackers.get(client_id)
+            if tracker is None:
+                tracker = LaneTracker(**self._tracker_options)
+                self._trackers[client_id] = tracker
+                while len(self._trackers) > self.max_sessions:
+                    self._trackers.popitem(last=False)
+                    self.stats["evicted"] += 1
+            else:
+                self._trackers.move_to_end(client_id)
+
+        with tracker.lock:
+            result = tracker.update(frame)
+
+        with self._lock:
+            self.stats["frames"] += 1
+            self.stats["redetections"] += int(result["redetected"])
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "active_sessions": len(self._trackers),
+                "max_sessions": self.max_sessions,
+            }
@@ -1,104 +1,292 @@
 #!/usr/bin/env python3
 
 import logging
-from typing import Dict, List, Any, Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Any, Iterator, Optional, Tuple
 import numpy as np
 import cv2
 import mediapipe as mp
 
+from frame_context import FrameContext
+from landmarks import (
+    JOINT_INDEX,
+    LANDMARK_INDEX,
+    RIDING_KEYPOINTS,
+    PoseLandmarks,
+    landmark_angles,
+)
+
 logger = logging.getLogger(__name__)
 
 
+class PoseSessionPool:
+    """LRU pool of per-client MediaPipe Pose graphs.
+
+    Each rider stream keeps its own tracking state, so MediaPipe can stay on
+    its cheap tracking path instead of re-detecting on frames that belong to
+    another client. Graphs are guarded individually, letting different
+    sessions run in parallel while calls for the same session serialize.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        max_sessions: int = 32,
+        idle_timeout: float = 300.0,
+    ):
+        self._factory = factory
+        self.max_sessions = max(1, max_sessions)
+        self.idle_timeout = idle_timeout
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "reused": 0, "evicted_lru": 0, "evicted_idle": 0}
+
+    @contextmanager
+    def session(self, client_id: str) -> Iterator[Optional[Any]]:
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            evicted.extend(self._pop_idle(now))
+
+            entry = self._sessions.get(client_id)
+            if entry is None:
+                entry = {"pose": None, "lock": threading.Lock(), "closed": False}
+                self._sessions[client_id] = entry
+                self.stats["created"] += 1
+                while len(self._sessions) > self.max_sessions:
+                    _, lru_entry = self._sessions.popitem(last=False)
+                    evicted.append(lru_entry)
+                    self.stats["evicted_lru"] += 1
+            else:
+                self._sessions.move_to_end(client_id)
+                self.stats["reused"] += 1
+            entry["last_used"] = now
+
+        for old_entry in evicted:
+            self._close_entry(old_entry)
+
+        with entry["lock"]:
+            if entry["closed"]:
+                # Evicted while we were waiting; caller falls back to shared graph
+                yield None
+                return
+            if entry["pose"] is None:
+                entry["pose"] = self._factory()
+            yield entry["pose"]
+
+    def _pop_idle(self, now: float) -> List[Dict[str, Any]]:
+        idle = [
+            client_id
+            for client_id, entry in self._sessions.items()
+            if now - entry["last_used"] > self.idle_timeout
+        ]
+        self.stats["evicted_idle"] += len(idle)
+        return [self._sessions.pop(client_id) for client_id in idle]
+
+    def _close_entry(self, entry: Dict[str, Any]):
+        with entry["lock"]:
+            entry["closed"] = True
+            if entry["pose"] is not None:
+                entry["pose"].close()
+                entry["pose"] = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+            }
+
+    def close(self):
+        with self._lock:
+            entries = list(self._sessions.values())
+            self._sessions.clear()
+        for entry in entries:
+            self._close_entry(entry)
+
+
+class YoloPoseBackend:
+    """YOLOv8-pose: person boxes and COCO-17 keypoints from one forward pass.
+
+    ``estimate`` returns a (17, 4) array of x, y (normalized to the input
+    image), z (always 0) and keypoint confidence for the most confident
+    person, or None when nobody is found.
+    """
+
+    KEYPOINT_NAMES = [
+        "nose",
+        "left_eye",
+        "right_eye",
+        "left_ear",
+        "right_ear",
+        "left_shoulder",
+        "right_shoulder",
+        "left_elbow",
+        "right_elbow",
+        "left_wrist",
+        "right_wrist",
+        "left_hip",
+        "right_hip",
+        "left_knee",
+        "right_knee",
+        "left_ankle",
+        "right_ankle",
+    ]
+
+    def __init__(
+        self,
+        model_path: str = "yolov8n-pose.pt",
+        device: str = "cpu",
+        confidence_threshold: float = 0.5,
+    ):
+        from ultralytics import YOLO
+
+        self.device = device
+        self.confidence_threshold = confidence_threshold
+        self.keypoint_mapping = {
+            name: idx for idx, name in enumerate(self.KEYPOINT_NAMES)
+        }
+        self.model = YOLO(model_path)
+        self.model.to(device)
+        logger.info(f"YOLOv8-pose backend loaded from {model_path}")
+
+    def estimate(self, image: np.ndarray) -> Optional[np.ndarray]:
+        results = self.model.predict(
+            image, conf=self.confidence_threshold, verbose=False, device=self.device
+        )
+        if not results or results[0].keypoints is None:
+            return None
+
+        keypoints = results[0].keypoints.data.cpu().numpy()
+        if len(keypoints) == 0:
+            return None
+
+        # Predictions come sorted by box confidence; take the best person
+        best = keypoints[0]
+        height, width = image.shape[:2]
+        points = np.zeros((len(best), 4), dtype=np.float64)
+        points[:, 0] = best[:, 0] / width
+        points[:, 1] = best[:, 1] / height
+        points[:, 3] = best[:, 2] if best.shape[1] > 2 else 1.0
+        return points
+
+
 class PoseEstimator:
 
-    def __init__(self, device: str = "cpu"):
+    def __init__(
+        self,
+        device: str = "cpu",
+        max_sessions: int = 32,
+        session_idle_timeout: float = 300.0,
+        crop_mode: bool = False,
+        crop_size: int = 256,
+        crop_margin: float = 0.25,
+        backend: str = "mediapipe",
+        yolo_model_path: str = "yolov8n-pose.pt",
+    ):
+        if backend not in ("mediapipe", "yolo"):
+            raise ValueError(f"Unknown pose backend: {backend}")
+
         self.device = device
+        self.backend = backend
+        self.crop_mode = crop_mode
+        self.crop_size = crop_size
+        self.crop_margin = crop_margin
         self.mp_pose = mp.solutions.pose
         self.mp_drawing = mp.solutions.drawing_utils
 
-        self.pose = self.mp_pose.Pose(
-            static_image_mode=False,
+        self.yolo_backend = None
+        if backend == "yolo":
+            self.yolo_backend = YoloPoseBackend(yolo_model_path, device=device)
+        else:
+            self.pose = self._create_pose()
+            self._pose_lock = threading.Lock()
+            self.session_pool = PoseSessionPool(
+                self._create_pose,
+                max_sessions=max_sessions,
+                idle_timeout=session_idle_timeout,
+            )
+
+        self.keypoint_mapping = dict(LANDMARK_INDEX)
+        self.riding_keypoints = list(RIDING_KEYPOINTS)
+
+        logger.info(
+            f"PoseEstimator initialized with {backend} backend "
+            f"(crop_mode={crop_mode}, crop_size={crop_size})"
+        )
+
+    def _create_pose(self):
+        # Tracking assumes consecutive inputs share one coordinate frame;
+        # rider crops move and resize between frames, so detect every time
+        return self.mp_pose.Pose(
+            static_image_mode=self.crop_mode,
             model_complexity=1,
             enable_segmentation=False,
             min_detection_confidence=0.7,
             min_tracking_confidence=0.5,
         )
 
-        self.keypoint_mapping = {
-            "nose": 0,
-            "left_eye_inner": 1,
-            "left_eye": 2,
-            "left_eye_outer": 3,
-            "right_eye_inner": 4,
-            "right_eye": 5,
-            "right_eye_outer": 6,
-            "left_ear": 7,
-            "right_ear": 8,
-            "mouth_left": 9,
-            "mouth_right": 10,
-            "left_shoulder": 11,
-            "right_shoulder": 12,
-            "left_elbow": 13,
-            "right_elbow": 14,
-            "left_wrist": 15,
-            "right_wrist": 16,
-            "left_pinky": 17,
-            "right_pinky": 18,
-            "left_index": 19,
-            "right_index": 20,
-            "left_thumb": 21,
-            "right_thumb": 22,
-            "left_hip": 23,
-            "right_hip": 24,
-            "left_knee": 25,
-            "right_knee": 26,
-            "left_ankle": 27,
-            "right_ankle": 28,
-            "left_heel": 29,
-            "right_heel": 30,
-            "left_foot_index": 31,
-            "right_foot_index": 32,
-        }
-
-        self.riding_keypoints = [
-            "nose",
-            "left_shoulder",
-            "right_shoulder",
-            "left_elbow",
-            "right_elbow",
-            "left_wrist",
-            "right_wrist",
-            "left_hip",
-            "right_hip",
-            "left_knee",
-            "right_knee",
-            "left_ankle",
-            "right_ankle",
-        ]
-
-        logger.info("PoseEstimator initialized with MediaPipe")
-
-    def estimate_pose(self, image: np.ndarray) -> Dict[str, Any]:
+    def estimate_pose(
+        self,
+        image: np.ndarray,
+        client_id: Optional[str] = None,
+        frame: Optional[FrameContext] = None,
+        rider_box: Optional[np.ndarray] = None,
+    ) -> Dict[str, Any]:
+        """Estimate the rider's pose.
+
+        With ``crop_mode`` on and a ``rider_box`` given, MediaPipe runs on the
+        box crop at ``crop_size`` instead of the whole frame. Landmarks are
+        always returned in full-frame normalized coordinates.
+        """
         if image is None:
             logger.error("Input image is None")
             return {}
 
         try:
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            roi = None
+            if self.crop_mode and rider_box is not None:
+                roi = self._crop_region(rider_box, image.shape)
 
-            results = self.pose.process(rgb_image)
-
-            if results.pose_landmarks is None:
+            if self.yolo_backend is not None:
+                points = self.yolo_backend.estimate(
+                    self._crop(image, roi) if roi is not None else image
+                )
+                keypoint_mapping = self.yolo_backend.keypoint_mapping
+            else:
+                if roi is not None:
+                    rgb_image = cv2.cvtColor(self._crop(image, roi), cv2.COLOR_BGR2RGB)
+                elif frame is not None:
+                    rgb_image = frame.rgb
+                else:
+                    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+                results = self._process(rgb_image, client_id)
+                points = None
+                if results.pose_landmarks is not None:
+                    points = np.array(
+                        [
+                            [lm.x, lm.y, lm.z, lm.visibility]
+                            for lm in results.pose_landmarks.landmark
+                        ]
+                    )
+                keypoint_mapping = self.keypoint_mapping
+
+            if points is None:
                 logger.debug("No pose landmarks detected")
-                return {"landmarks": {}, "confidence": 0.0}
+                return {"landmarks": PoseLandmarks.empty(), "confidence": 0.0}
 
-            landmarks = self._extract_landmarks(results.pose_landmarks, image.shape)
+            landmarks = self._extract_landmarks(
+                points, image.shape, roi, keypoint_mapping
+            )
 
             pose_quality = self._assess_pose_quality(landmarks)
 
-            riding_landmarks = {
-                k: v for k, v in landmarks.items() if k in self.riding_keypoints
-            }
+            riding_landmarks = landmarks.subset(self.riding_keypoints)
 
             return {
                 "landmarks": riding_landmarks,
@@ -106,42 +294,90 @@ class PoseEstimator:
                 "confidence": pose_quality["overall_confidence"],
                 "visibility_score": pose_quality["visibility_score"],
                 "pose_quality": pose_quality,
-                "detected_keypoints": len(
-                    [k for k, v in riding_landmarks.items() if v["visible"]]
-                ),
+                "detected_keypoints": int(riding_landmarks.visible.sum()),
             }
 
         except Exception as e:
             logger.error(f"Pose estimation failed: {e}")
-            return {"landmarks": {}, "confidence": 0.0}
+            return {"landmarks": PoseLandmarks.empty(), "confidence": 0.0}
 
-    def _extract_landmarks(
-        self, pose_landmarks, image_shape: Tuple[int, int, int]
-    ) -> Dict[str, Dict]:
+    def _crop_region(
+        self, box: np.ndarray, image_shape: Tuple[int, int, int]
+    ) -> Optional[Tuple[int, int, int, int]]:
+        """Rider box grown by ``crop_margin`` on each side, clipped to the frame."""
         height, width = image_shape[:2]
-        landmarks = {}
+        x1, y1, x2, y2 = (float(v) for v in box[:4])
+        margin_x = (x2 - x1) * self.crop_margin
+        margin_y = (y2 - y1) * self.crop_margin
+
+        left = max(0, int(x1 - margin_x))
+        top = max(0, int(y1 - margin_y))
+        right = min(width, int(np.ceil(x2 + margin_x)))
+        bottom = min(height, int(np.ceil(y2 + margin_y)))
+
+        if right - left < 2 or bottom - top < 2:
+            return None
+        return left, top, right - left, bottom - top
+
+    def _crop(self, image: np.ndarray, roi: Tuple[int, int, int, int]) -> np.ndarray:
+        left, top, crop_width, crop_height = roi
+        crop = image[top : top + crop_height, left : left + crop_width]
+
+        # Fixed long side keeps pose cost independent of frame resolution
+        scale = self.crop_size / float(max(crop_width, crop_height))
+        size = (
+            max(1, int(round(crop_width * scale))),
+            max(1, int(round(crop_height * scale))),
+        )
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        return cv2.resize(crop, size, interpolation=interpolation)
 
-        for name, idx in self.keypoint_mapping.items():
-            if idx < len(pose_landmarks.landmark):
-                landmark = pose_landmarks.landmark[idx]
+    def _process(self, rgb_image: np.ndarray, client_id: Optional[str]):
+        if client_id:
+            with self.session_pool.session(client_id) as session_pose:
+                if session_pose is not None:
+                    return session_pose.process(rgb_image)
+
+        with self._pose_lock:
+            return self.pose.process(rgb_image)
+
+    def _extract_landmarks(
+        self,
+        points: np.ndarray,
+        image_shape: Tuple[int, int, int],
+        roi: Optional[Tuple[int, int, int, int]] = None,
+        keypoint_mapping: Optional[Dict[str, int]] = None,
+    ) -> PoseLandmarks:
+        """Map (N, 4) x, y, z, visibility rows into a full-frame PoseLandmarks."""
+        height, width = image_shape[:2]
 
-                x_pixel = int(landmark.x * width)
-                y_pixel = int(landmark.y * height)
+        # Crop-normalized -> frame-normalized: x = (left + x_crop * w) / W.
+        # MediaPipe's z shares the x scale, so it is rescaled the same way.
+        offset_x, offset_y, scale_x, scale_y = 0.0, 0.0, 1.0, 1.0
+        if roi is not None:
+            left, top, crop_width, crop_height = roi
+            offset_x, offset_y = left / width, top / height
+            scale_x, scale_y = crop_width / width, crop_height / height
+
+        pairs = [
+            (LANDMARK_INDEX[name], idx)
+            for name, idx in (keypoint_mapping or self.keypoint_mapping).items()
+            if idx < len(points)
+        ]
+        targets = np.array([target for target, _ in pairs], dtype=np.int64)
+        rows = np.asarray(points, dtype=np.float64)[[source for _, source in pairs]]
 
-                landmarks[name] = {
-                    "x": landmark.x,
-                    "y": landmark.y,
-                    "z": landmark.z,
-                    "x_pixel": x_pixel,
-                    "y_pixel": y_pixel,
-                    "visibility": landmark.visibility,
-                    "confidence": landmark.visibility,
-                    "visible": landmark.visibility > 0.5,
-                }
+        landmarks = np.zeros((len(LANDMARK_INDEX), 4), dtype=np.float32)
+        landmarks[targets, 0] = offset_x + rows[:, 0] * scale_x
+        landmarks[targets, 1] = offset_y + rows[:, 1] * scale_y
+        landmarks[targets, 2] = rows[:, 2] * scale_x
+        landmarks[targets, 3] = rows[:, 3]
 
-        return landmarks
+        present = np.zeros(len(LANDMARK_INDEX), dtype=bool)
+        present[targets] = True
+        return PoseLandmarks(landmarks, present, (width, height))
 
-    def _assess_pose_quality(self, landmarks: Dict[str, Dict]) -> Dict[str, float]:
+    def _assess_pose_quality(self, landmarks: PoseLandmarks) -> Dict[str, float]:
         if not landmarks:
             return {
                 "overall_confidence": 0.0,
@@ -150,17 +386,15 @@ class PoseEstimator:
                 "stability_score": 0.0,
             }
 
-        visible_landmarks = [lm for lm in landmarks.values() if lm["visible"]]
-        visibility_score = len(visible_landmarks) / len(landmarks) if landmarks else 0.0
+        visible = landmarks.visible
+        visible_count = int(visible.sum())
+        visibility_score = visible_count / len(landmarks)
 
-        confidences = [lm["confidence"] for lm in landmarks.values() if lm["visible"]]
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
-
-        riding_visible = sum(
-            1
-            for name in self.riding_keypoints
-            if name in landmarks and landmarks[name]["visible"]
+        avg_confidence = (
+            float(landmarks.points[visible, 3].mean()) if visible_count else 0.0
         )
+
+        riding_visible = int(landmarks.subset(self.riding_keypoints).visible.sum())
         completeness_score = riding_visible / len(self.riding_keypoints)
 
         overall_confidence = (
@@ -172,7 +406,7 @@ class PoseEstimator:
             "visibility_score": visibility_score,
             "completeness_score": completeness_score,
             "stability_score": avg_confidence,
-            "detected_keypoints": len(visible_landmarks),
+            "detected_keypoints": visible_count,
             "total_keypoints": len(landmarks),
         }
 
@@ -183,6 +417,8 @@ class PoseEstimator:
         analysis_results = {"posture_score": 100.0, "issues": [], "measurements": {}}
 
         try:
+            angles = landmark_angles(landmarks)
+
             back_analysis = self._analyze_back_posture(landmarks)
             analysis_results["measurements"]["back_angle"] = back_analysis["angle"]
             if back_analysis["score"] < 70:
@@ -197,13 +433,13 @@ class PoseEstimator:
                 analysis_results["issues"].append("Level your shoulders")
                 analysis_results["posture_score"] -= 10
 
-            arm_analysis = self._analyze_arm_position(landmarks)
+            arm_analysis = self._analyze_arm_position(landmarks, angles)
             analysis_results["measurements"]["elbow_angles"] = arm_analysis["angles"]
             if arm_analysis["score"] < 70:
                 analysis_results["issues"].append("Relax your arms and elbows")
                 analysis_results["posture_score"] -= 15
 
-            knee_analysis = self._analyze_knee_position(landmarks)
+            knee_analysis = self._analyze_knee_position(landmarks, angles)
             analysis_results["measurements"]["knee_angles"] = knee_analysis["angles"]
             if knee_analysis["score"] < 70:
                 analysis_results["issues"].append("Adjust knee position on tank")
@@ -284,18 +520,16 @@ class PoseEstimator:
             logger.error(f"Shoulder analysis error: {e}")
             return {"level_difference": 0.0, "score": 60.0}
 
-    def _analyze_arm_position(self, landmarks: Dict) -> Dict[str, Any]:
+    def _analyze_arm_position(
+        self, landmarks: Dict, angles: np.ndarray
+    ) -> Dict[str, Any]:
         arm_data = {"angles": {}, "score": 100.0}
 
         try:
             if all(
                 k in landmarks for k in ["left_shoulder", "left_elbow", "left_wrist"]
             ):
-                left_angle = self._calculate_elbow_angle(
-                    landmarks["left_shoulder"],
-                    landmarks["left_elbow"],
-                    landmarks["left_wrist"],
-                )
+                left_angle = float(angles[JOINT_INDEX["left_elbow"]])
                 arm_data["angles"]["left_elbow"] = left_angle
 
                 if 90 <= left_angle <= 120:
@@ -310,11 +544,7 @@ class PoseEstimator:
             if all(
                 k in landmarks for k in ["right_shoulder", "right_elbow", "right_wrist"]
             ):
-                right_angle = self._calculate_elbow_angle(
-                    landmarks["right_shoulder"],
-                    landmarks["right_elbow"],
-                    landmarks["right_wrist"],
-                )
+                right_angle = float(angles[JOINT_INDEX["right_elbow"]])
                 arm_data["angles"]["right_elbow"] = right_angle
 
                 if 90 <= right_angle <= 120:
@@ -332,16 +562,14 @@ class PoseEstimator:
 
         return arm_data
 
-    def _analyze_knee_position(self, landmarks: Dict) -> Dict[str, Any]:
+    def _analyze_knee_position(
+        self, landmarks: Dict, angles: np.ndarray
+    ) -> Dict[str, Any]:
         knee_data = {"angles": {}, "score": 100.0}
 
         try:
             if all(k in landmarks for k in ["left_hip", "left_knee", "left_ankle"]):
-                left_angle = self._calculate_knee_angle(
-                    landmarks["left_hip"],
-                    landmarks["left_knee"],
-                    landmarks["left_ankle"],
-                )
+                left_angle = float(angles[JOINT_INDEX["left_knee"]])
                 knee_data["angles"]["left_knee"] = left_angle
 
                 if 110 <= left_angle <= 140:
@@ -354,11 +582,7 @@ class PoseEstimator:
                 knee_data["score"] *= 0.5 + 0.5 * (left_score / 100.0)
 
             if all(k in landmarks for k in ["right_hip", "right_knee", "right_ankle"]):
-                right_angle = self._calculate_knee_angle(
-                    landmarks["right_hip"],
-                    landmarks["right_knee"],
-                    landmarks["right_ankle"],
-                )
+                right_angle = float(angles[JOINT_INDEX["right_knee"]])
                 knee_data["angles"]["right_knee"] = right_angle
 
                 if 110 <= right_angle <= 140:
@@ -376,36 +600,6 @@ class PoseEstimator:
 
         return knee_data
 
-    def _calculate_elbow_angle(self, shoulder: Dict, elbow: Dict, wrist: Dict) -> float:
-        try:
-            v1 = np.array([shoulder["x"] - elbow["x"], shoulder["y"] - elbow["y"]])
-            v2 = np.array([wrist["x"] - elbow["x"], wrist["y"] - elbow["y"]])
-
-            cos_angle = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
-            cos_angle = np.clip(cos_angle, -1.0, 1.0)
-            angle = np.degrees(np.arccos(cos_angle))
-
-            return angle
-
-        except Exception as e:
-            logger.error(f"Elbow angle calculation error: {e}")
-            return 105.0
-
-    def _calculate_knee_angle(self, hip: Dict, knee: Dict, ankle: Dict) -> float:
-        try:
-            v1 = np.array([hip["x"] - knee["x"], hip["y"] - knee["y"]])
-            v2 = np.array([ankle["x"] - knee["x"], ankle["y"] - knee["y"]])
-
-            cos_angle = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
-            cos_angle = np.clip(cos_angle, -1.0, 1.0)
-            angle = np.degrees(np.arccos(cos_angle))
-
-            return angle
-
-        except Exception as e:
-            logger.error(f"Knee angle calculation error: {e}")
-            return 125.0
-
     def get_pose_overlay(
         self, image: np.ndarray, landmarks: Dict[str, Dict]
     ) -> np.ndarray:
@@ -480,6 +674,8 @@ class PoseEstimator:
 
     def cleanup(self):
         """Clean up MediaPipe resources"""
+        if hasattr(self, "session_pool"):
+            self.session_pool.close()
         if hasattr(self, "pose"):
             self.pose.close()
         logger.info("PoseEstimator resources cleaned up")
@@ -1,20 +1,117 @@
 #!/usr/bin/env python3
 
 import logging
-from typing import Dict, List, Any, Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Any, Optional, Tuple, Union
 import numpy as np
 import cv2
 from sklearn.cluster import KMeans
 import torch
 import torch.nn.functional as F
 
+from detector import DetectionResult, summarize_traffic
+from frame_context import FrameContext
+from .lane_tracker import LaneTrackerPool
+
 logger = logging.getLogger(__name__)
 
 
+class SceneSessionCache:
+    """Last full scene analysis per client, reused while the view stays similar.
+
+    Weather, road condition, time of day and visibility change over minutes,
+    so an entry is reused until the frame signature (a tiny thumbnail)
+    drifts more than ``drift_threshold`` grey levels on average from the one
+    it was computed on, or it is older than ``max_age`` seconds.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 32,
+        max_age: float = 5.0,
+        drift_threshold: float = 8.0,
+    ):
+        self.max_sessions = max(1, max_sessions)
+        self.max_age = max_age
+        self.drift_threshold = drift_threshold
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "drifted": 0}
+
+    def lookup(self, client_id: str, signature: np.ndarray) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(client_id)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+
+            if time.monotonic() - entry["computed_at"] > self.max_age:
+                self.stats["expired"] += 1
+                return None
+
+            previous = entry["signature"]
+            if previous.shape != signature.shape or (
+                float(np.mean(np.abs(previous - signature))) > self.drift_threshold
+            ):
+                self.stats["drifted"] += 1
+                return None
+
+            self._entries.move_to_end(client_id)
+            self.stats["hits"] += 1
+            return entry["analyses"]
+
+    def store(self, client_id: str, signature: np.ndarray, analyses: Dict):
+        with self._lock:
+            self._entries[client_id] = {
+                "signature": signature,
+                "analyses": analyses,
+                "computed_at": time.monotonic(),
+            }
+            self._entries.move_to_end(client_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "active_sessions": len(self._entries),
+                "max_sessions": self.max_sessions,
+            }
+
+
 class SceneAnalyzer:
 
-    def __init__(self, device: str = "cpu"):
+    # Width of the thumbnail used as the scene-cache signature
+    SIGNATURE_WIDTH = 32
+
+    # Thumbnail widths used when thumbnail mode is on. Means, stds and
+    # ratios barely move with scale; gradient-based texture and Laplacian
+    # clarity do, so they get larger (or full-size) inputs. Lane detection
+    # always runs at full resolution since its Hough thresholds are in pixels.
+    DEFAULT_THUMBNAIL_WIDTHS = {
+        "weather": 160,
+        "time": 160,
+        "visibility": 160,
+        "clarity": 0,
+        "road": 320,
+        "texture": 640,
+    }
+
+    def __init__(
+        self,
+        device: str = "cpu",
+        session_cache: Optional[SceneSessionCache] = None,
+        thumbnail_widths: Optional[Dict[str, int]] = None,
+        lane_trackers: Optional[LaneTrackerPool] = None,
+    ):
         self.device = device
+        self.session_cache = session_cache
+        self.lane_trackers = lane_trackers
+        # Sub-analysis -> width it runs at; missing or 0 means full resolution
+        self.thumbnail_widths = dict(thumbnail_widths or {})
 
         # Color ranges for different weather/road conditions (HSV)
         self.condition_colors = {
@@ -24,6 +121,14 @@ class SceneAnalyzer:
             "fog": [(0, 0, 180), (30, 50, 230)],  # Gray/white hazy
         }
 
+        self.traffic_density_scores = {
+            "no_traffic": 0.0,
+            "light": 0.3,
+            "moderate": 0.6,
+            "heavy": 0.8,
+            "congested": 1.0,
+        }
+
         # Time of day classification thresholds
         self.time_thresholds = {
             "night": (0, 80),  # Very dark
@@ -33,12 +138,23 @@ class SceneAnalyzer:
 
         logger.info("SceneAnalyzer initialized")
 
-    def analyze_scene(self, image: np.ndarray) -> Dict[str, Any]:
+    def analyze_scene(
+        self,
+        image: np.ndarray,
+        frame: Optional[FrameContext] = None,
+        client_id: Optional[str] = None,
+        detections: Union[DetectionResult, Callable[[], DetectionResult], None] = None,
+    ) -> Dict[str, Any]:
         """
         Perform comprehensive scene analysis
 
         Args:
             image: Input video frame (BGR format)
+            frame: Shared per-frame views; built from ``image`` when omitted
+            client_id: Session whose cached slow-changing analyses may be reused
+            detections: The frame's detections, or a callable returning them
+                (resolved last, so pixel statistics overlap with detection).
+                Traffic falls back to an edge-density estimate without them.
 
         Returns:
             Dictionary with scene analysis results
@@ -48,12 +164,34 @@ class SceneAnalyzer:
             return self._get_default_scene_analysis()
 
         try:
+            frame = frame or FrameContext(image)
+
+            # Lanes move with the rider, so tracked lanes bypass the cache
+            lane_tracking = None
+            if self.lane_trackers is not None and client_id:
+                lane_tracking = self.lane_trackers.update(client_id, frame)
+
             # Analyze different aspects of the scene
-            weather_analysis = self._analyze_weather_conditions(image)
-            road_analysis = self._analyze_road_conditions(image)
-            traffic_analysis = self._analyze_traffic_context(image)
-            time_analysis = self._analyze_time_of_day(image)
-            visibility_analysis = self._analyze_visibility(image)
+            slow_analyses = self._slow_analyses(
+                frame, client_id, estimate_lanes=lane_tracking is None
+            )
+            weather_analysis = slow_analyses["weather"]
+            road_analysis = slow_analyses["road"]
+            if lane_tracking is not None:
+                lane_count = lane_tracking["lane_count"]
+                road_analysis = {
+                    **road_analysis,
+                    "estimated_lanes": lane_count,
+                    "type": self._classify_road_type(
+                        frame.image, lane_count, road_analysis["texture_score"]
+                    ),
+                }
+            time_analysis = slow_analyses["time"]
+            visibility_analysis = slow_analyses["visibility"]
+
+            if callable(detections):
+                detections = detections()
+            traffic_analysis = self._analyze_traffic_context(frame, detections)
 
             # Combine all analyses
             scene_data = {
@@ -65,6 +203,10 @@ class SceneAnalyzer:
                 "time_of_day": time_analysis["period"],
                 "brightness_level": time_analysis["brightness"],
                 "traffic_density": traffic_analysis["density"],
+                "vehicle_count": traffic_analysis["estimated_vehicles"],
+                "nearest_vehicle_distance": traffic_analysis[
+                    "nearest_vehicle_distance"
+                ],
                 "visibility": visibility_analysis["score"],
                 "visibility_category": visibility_analysis["category"],
                 "safety_factors": self._assess_safety_factors(
@@ -90,21 +232,82 @@ class SceneAnalyzer:
             logger.error(f"Scene analysis failed: {e}")
             return self._get_default_scene_analysis()
 
-    def _analyze_weather_conditions(self, image: np.ndarray) -> Dict[str, Any]:
+    def _slow_analyses(
+        self,
+        frame: FrameContext,
+        client_id: Optional[str],
+        estimate_lanes: bool = True,
+    ) -> Dict[str, Dict]:
+        """Weather, road, time-of-day and visibility, cached per session."""
+        if self.session_cache is None or not client_id:
+            return self._compute_slow_analyses(frame, estimate_lanes)
+
+        signature = frame.resized(self.SIGNATURE_WIDTH).astype(np.float32)
+        analyses = self.session_cache.lookup(client_id, signature)
+        if analyses is None:
+            analyses = self._compute_slow_analyses(frame, estimate_lanes)
+            self.session_cache.store(client_id, signature, analyses)
+        return analyses
+
+    def _compute_slow_analyses(
+        self, frame: FrameContext, estimate_lanes: bool = True
+    ) -> Dict[str, Dict]:
+        return {
+            "weather": self._analyze_weather_conditions(frame),
+            "road": self._analyze_road_conditions(frame, estimate_lanes),
+            "time": self._analyze_time_of_day(frame),
+            "visibility": self._analyze_visibility(frame),
+        }
+
+    def _view(self, frame: FrameContext, analysis: str) -> FrameContext:
+        width = self.thumbnail_widths.get(analysis, 0)
+        return frame.scaled(width) if width > 0 else frame
+
+    def _global_stats(self, frame: FrameContext) -> Dict[str, float]:
+        """Every whole-frame figure the sub-analyses need, computed once per view."""
+        return frame.memo("scene_stats", lambda: self._compute_global_stats(frame))
+
+    def _compute_global_stats(self, frame: FrameContext) -> Dict[str, float]:
+        pixels = float(frame.width * frame.height)
+        gray_mean, gray_std = cv2.meanStdDev(frame.gray)
+        hsv_mean, _ = cv2.meanStdDev(frame.hsv)
+
+        # 256-bin histograms turn threshold ratios into prefix sums
+        gray_hist = cv2.calcHist([frame.gray], [0], None, [256], [0, 256]).ravel()
+        sat_hist = cv2.calcHist([frame.hsv], [1], None, [256], [0, 256]).ravel()
+
+        return {
+            "brightness": float(gray_mean[0, 0]),
+            "contrast": float(gray_std[0, 0]),
+            "mean_hue": float(hsv_mean[0, 0]),
+            "mean_saturation": float(hsv_mean[1, 0]),
+            "dark_ratio": float(gray_hist[:80].sum() / pixels),
+            "low_saturation_ratio": float(sat_hist[:50].sum() / pixels),
+        }
+
+    def _road_stats(self, frame: FrameContext, road_top: int) -> Dict[str, Any]:
+        region = frame.image[road_top:, :]
+        gray_road = frame.gray[road_top:, :]
+        _, color_std = cv2.meanStdDev(region)
+        gray_mean, gray_std = cv2.meanStdDev(gray_road)
+        return {
+            "color_std": color_std.ravel(),
+            "brightness": float(gray_mean[0, 0]),
+            "contrast": float(gray_std[0, 0]),
+            "gray_hist": cv2.calcHist([gray_road], [0], None, [256], [0, 256]).ravel(),
+        }
+
+    def _road_gray(self, frame: FrameContext) -> np.ndarray:
+        return frame.gray[int(frame.height * 0.6) :, :]
+
+    def _analyze_weather_conditions(self, frame: FrameContext) -> Dict[str, Any]:
         """Analyze weather conditions from image characteristics"""
         try:
-            # Convert to HSV for better color analysis
-            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            stats = self._global_stats(self._view(frame, "weather"))
 
             # Analyze overall brightness and contrast
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            mean_brightness = np.mean(gray)
-            contrast = np.std(gray)
-
-            # Analyze color distribution
-            hist_h = cv2.calcHist([hsv], [0], None, [180], [0, 180])
-            hist_s = cv2.calcHist([hsv], [1], None, [256], [0, 256])
-            hist_v = cv2.calcHist([hsv], [2], None, [256], [0, 256])
+            mean_brightness = stats["brightness"]
+            contrast = stats["contrast"]
 
             # Check for weather indicators
             weather_scores = {
@@ -127,11 +330,11 @@ class SceneAnalyzer:
 
             # Rain indicators: dark areas, low contrast
             if contrast < 30 and mean_brightness < 120:
-                dark_ratio = np.sum(gray < 80) / gray.size
+                dark_ratio = stats["dark_ratio"]
                 weather_scores["rain"] = min(90.0, dark_ratio * 100 + (30 - contrast))
 
             # Fog indicators: low contrast, washed out colors
-            low_sat_ratio = np.sum(hsv[:, :, 1] < 50) / hsv.size
+            low_sat_ratio = stats["low_saturation_ratio"]
             if low_sat_ratio > 0.6 and contrast < 25:
                 weather_scores["fog"] = min(
                     95.0, low_sat_ratio * 80 + (25 - contrast) * 2
@@ -164,26 +367,39 @@ class SceneAnalyzer:
                 "contrast": 30,
             }
 
-    def _analyze_road_conditions(self, image: np.ndarray) -> Dict[str, Any]:
-        """Analyze road surface and infrastructure conditions"""
+    def _analyze_road_conditions(
+        self, frame: FrameContext, estimate_lanes: bool = True
+    ) -> Dict[str, Any]:
+        """Analyze road surface and infrastructure conditions
+
+        With ``estimate_lanes`` off the lane count is left at the default of
+        2 for the caller to fill in from a lane tracker.
+        """
         try:
             # Focus on lower portion of image where road typically is
-            height = image.shape[0]
-            road_region = image[int(height * 0.6) :, :]
+            view = self._view(frame, "road")
+            image = view.image
+            road_top = int(view.height * 0.6)
+            road_stats = self._road_stats(view, road_top)
 
-            # Convert to different color spaces for analysis
-            gray_road = cv2.cvtColor(road_region, cv2.COLOR_BGR2GRAY)
-            hsv_road = cv2.cvtColor(road_region, cv2.COLOR_BGR2HSV)
+            # Colour conversions are per-pixel, so slicing the shared views
+            # is equivalent to converting the road region on its own
+            hsv_road = view.hsv[road_top:, :]
 
             # Analyze road surface texture
-            texture_score = self._analyze_road_texture(gray_road)
+            texture_score = self._analyze_road_texture(
+                self._road_gray(self._view(frame, "texture"))
+            )
 
             # Analyze road color characteristics
-            mean_color = np.mean(road_region, axis=(0, 1))
-            color_std = np.std(road_region, axis=(0, 1))
+            color_std = road_stats["color_std"]
 
             # Detect lane markings to estimate lane count
-            lane_count = self._estimate_lane_count(gray_road)
+            lane_count = (
+                self._estimate_lane_count(self._road_gray(frame))
+                if estimate_lanes
+                else 2
+            )
 
             # Determine road condition
             road_scores = {"dry": 0.0, "wet": 0.0, "icy": 0.0, "construction": 0.0}
@@ -193,9 +409,9 @@ class SceneAnalyzer:
                 road_scores["dry"] = 80.0 + texture_score * 20
 
             # Wet road characteristics: reflective, darker, smoother
-            brightness = np.mean(gray_road)
+            brightness = road_stats["brightness"]
             if brightness < 100 and texture_score < 0.5:
-                reflective_areas = self._detect_reflective_surfaces(road_region)
+                reflective_areas = self._detect_reflective_surfaces(road_stats)
                 road_scores["wet"] = min(
                     90.0, (100 - brightness) * 0.5 + reflective_areas * 50
                 )
@@ -208,7 +424,7 @@ class SceneAnalyzer:
 
             # Construction: orange/yellow colors, irregular patterns
             orange_mask = cv2.inRange(hsv_road, (10, 100, 100), (25, 255, 255))
-            construction_ratio = np.sum(orange_mask > 0) / orange_mask.size
+            construction_ratio = cv2.countNonZero(orange_mask) / orange_mask.size
             if construction_ratio > 0.05:
                 road_scores["construction"] = min(80.0, construction_ratio * 400)
 
@@ -237,19 +453,47 @@ class SceneAnalyzer:
                 "surface_brightness": 128,
             }
 
-    def _analyze_traffic_context(self, image: np.ndarray) -> Dict[str, Any]:
-        """Analyze traffic density and flow patterns"""
+    def _analyze_traffic_context(
+        self, frame: FrameContext, detections: Optional[DetectionResult] = None
+    ) -> Dict[str, Any]:
+        """Analyze traffic density from the frame's detections"""
+        if detections is None:
+            return self._estimate_traffic_from_edges(frame)
+
         try:
-            # Simple traffic analysis based on image characteristics
-            # In production, this would integrate with object detection results
+            # Distances are estimated from box areas in source-frame pixels
+            scale = frame.source_scale
+            traffic = summarize_traffic(
+                detections.scaled(scale),
+                float(frame.width * frame.height) * scale * scale,
+                exclude_rider_motorcycle=True,
+            )
+            distance = traffic["nearest_vehicle_distance"]
+
+            return {
+                "density": traffic["density_level"],
+                "density_score": self.traffic_density_scores[traffic["density_level"]],
+                "density_ratio": traffic["density_ratio"],
+                "estimated_vehicles": traffic["total_vehicles"],
+                "vehicle_distribution": traffic["vehicle_distribution"],
+                # inf is not valid JSON
+                "nearest_vehicle_distance": None if np.isinf(distance) else distance,
+            }
 
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        except Exception as e:
+            logger.error(f"Traffic analysis error: {e}")
+            return self._estimate_traffic_from_edges(frame)
+
+    def _estimate_traffic_from_edges(self, frame: FrameContext) -> Dict[str, Any]:
+        """Edge-density traffic proxy for callers without detections"""
+        try:
+            gray = frame.gray
 
             # Detect potential vehicle shapes using edge detection
             edges = cv2.Canny(gray, 50, 150)
 
             # Look for rectangular shapes (vehicles) in upper portion of image
-            height = image.shape[0]
+            height = frame.height
             traffic_region = edges[0 : int(height * 0.7), :]
 
             # Count edge density as proxy for vehicle presence
@@ -277,6 +521,7 @@ class SceneAnalyzer:
                 "density_score": density_score,
                 "edge_density": edge_density,
                 "estimated_vehicles": int(edge_density * 20),  # Rough estimate
+                "nearest_vehicle_distance": None,
             }
 
         except Exception as e:
@@ -286,22 +531,19 @@ class SceneAnalyzer:
                 "density_score": 0.3,
                 "edge_density": 0.05,
                 "estimated_vehicles": 1,
+                "nearest_vehicle_distance": None,
             }
 
-    def _analyze_time_of_day(self, image: np.ndarray) -> Dict[str, Any]:
+    def _analyze_time_of_day(self, frame: FrameContext) -> Dict[str, Any]:
         """Determine time of day based on lighting conditions"""
         try:
-            # Convert to different color spaces
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            stats = self._global_stats(self._view(frame, "time"))
 
             # Analyze brightness characteristics
-            mean_brightness = np.mean(gray)
-            brightness_std = np.std(gray)
+            mean_brightness = stats["brightness"]
 
             # Analyze color temperature (warmth vs coolness)
-            mean_hue = np.mean(hsv[:, :, 0])
-            saturation_mean = np.mean(hsv[:, :, 1])
+            mean_hue = stats["mean_hue"]
 
             # Classify time period
             if mean_brightness < self.time_thresholds["night"][1]:
@@ -337,15 +579,15 @@ class SceneAnalyzer:
                 "color_temperature": 90,
             }
 
-    def _analyze_visibility(self, image: np.ndarray) -> Dict[str, Any]:
+    def _analyze_visibility(self, frame: FrameContext) -> Dict[str, Any]:
         """Assess overall visibility conditions"""
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            stats = self._global_stats(self._view(frame, "visibility"))
 
             # Calculate visibility metrics
-            contrast = np.std(gray)
-            clarity = self._calculate_image_clarity(gray)
-            brightness = np.mean(gray)
+            contrast = stats["contrast"]
+            clarity = self._calculate_image_clarity(self._view(frame, "clarity").gray)
+            brightness = stats["brightness"]
 
             # Combine metrics for overall visibility score
             visibility_score = (
@@ -435,16 +677,16 @@ class SceneAnalyzer:
         except Exception:
             return 2
 
-    def _detect_reflective_surfaces(self, road_region: np.ndarray) -> float:
+    def _detect_reflective_surfaces(self, road_stats: Dict[str, Any]) -> float:
         """Detect reflective surfaces that indicate wet conditions"""
         try:
-            gray = cv2.cvtColor(road_region, cv2.COLOR_BGR2GRAY)
-
-            # Look for bright spots that could be reflections
-            bright_threshold = np.mean(gray) + np.std(gray) * 2
-            bright_mask = gray > bright_threshold
+            # Look for bright spots that could be reflections; pixels are
+            # integers, so gray > threshold means bins above floor(threshold)
+            bright_threshold = road_stats["brightness"] + road_stats["contrast"] * 2
+            hist = road_stats["gray_hist"]
+            first_bright = min(len(hist), int(np.floor(bright_threshold)) + 1)
 
-            reflective_ratio = np.sum(bright_mask) / bright_mask.size
+            reflective_ratio = hist[first_bright:].sum() / hist.sum()
             return min(1.0, reflective_ratio * 10)  # Scale appropriately
 
         except Exception:
@@ -555,6 +797,8 @@ class SceneAnalyzer:
             "time_of_day": "day",
             "brightness_level": 128,
             "traffic_density": "light",
+            "vehicle_count": 0,
+            "nearest_vehicle_distance": None,
             "visibility": 70.0,
             "visibility_category": "good",
             "safety_factors": [],
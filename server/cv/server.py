@@ -1,25 +1,32 @@
 #!/usr/bin/env python3
 
+import atexit
 import os
-import io
-import base64
+import json
 import time
 import logging
 from typing import Dict, List, Any, Optional, Tuple
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import torch
 import cv2
 import numpy as np
-from PIL import Image
 import flask
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 
-from detector import ObjectDetector
+from artifact_cache import ArtifactCache
+from detector import DetectionResult, ObjectDetector
+from detector_quantization import DEFAULT_DRIFT_TOLERANCE
+from frame_context import FrameContext
+from frame_decoder import DecodePolicy, decode_frame
+from batch_scheduler import DetectionBatcher
+from worker_pool import WorkerPoolService
 from analyzer import RidingAnalyzer
 from models.pose_estimator import PoseEstimator
-from models.scene_analyzer import SceneAnalyzer
+from models.lane_tracker import LaneTrackerPool
+from models.scene_analyzer import SceneAnalyzer, SceneSessionCache
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,22 +36,140 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _env_bool(name: str, default: bool = False) -> bool:
+    return os.environ.get(name, str(default)).lower() == "true"
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _env_list(name: str) -> List[str]:
+    return [
+        item.strip() for item in os.environ.get(name, "").split(",") if item.strip()
+    ]
+
+
+def _detector_threads() -> int:
+    # Split the cores between worker processes so ORT pools don't oversubscribe
+    workers = max(1, _env_int("ML_WORKERS", 1))
+    return _env_int("ML_DETECTOR_THREADS", max(1, (os.cpu_count() or 1) // workers))
+
+
+def _int8_drift_tolerance() -> Dict[str, float]:
+    # e.g. ML_INT8_MIN_RECALL, ML_INT8_MAX_SCORE_DRIFT
+    return {
+        key: _env_float(f"ML_INT8_{key.upper()}", default)
+        for key, default in DEFAULT_DRIFT_TOLERANCE.items()
+    }
+
+
+def _scene_thumbnail_widths() -> Optional[Dict[str, int]]:
+    if not _env_bool("ML_SCENE_THUMBNAILS"):
+        return None
+    widths = dict(SceneAnalyzer.DEFAULT_THUMBNAIL_WIDTHS)
+    for item in _env_list("ML_SCENE_THUMBNAIL_WIDTHS"):
+        name, _, width = item.partition("=")
+        widths[name.strip()] = int(width)
+    return widths
+
+
+def _decode_policy() -> DecodePolicy:
+    stage_targets = {}
+    for item in _env_list("ML_DECODE_STAGE_TARGETS"):
+        name, _, size = item.partition("=")
+        stage_targets[name.strip()] = int(size)
+    return DecodePolicy(
+        target_long_side=_env_int("ML_DECODE_TARGET_SIZE", 0),
+        max_pixels=_env_int("ML_DECODE_MAX_PIXELS", 0),
+        stage_targets=stage_targets,
+    )
+
+
 class MLService:
 
     def __init__(self):
         self.device = self._get_optimal_device()
         logger.info(f"Using device: {self.device}")
 
-        self.object_detector = ObjectDetector(device=self.device)
-        self.pose_estimator = PoseEstimator(device=self.device)
-        self.scene_analyzer = SceneAnalyzer(device=self.device)
+        cache_dir = os.environ.get("ML_ARTIFACT_CACHE_DIR")
+        self.artifact_cache = ArtifactCache(cache_dir) if cache_dir else None
+
+        pose_backend = os.environ.get("ML_POSE_BACKEND", "mediapipe")
+        pose_model = os.environ.get("ML_POSE_YOLO_MODEL", "yolov8n-pose.pt")
+        if pose_backend == "yolo" and self.artifact_cache is not None:
+            pose_model = self.artifact_cache.weights(pose_model)
+
+        self.object_detector = ObjectDetector(
+            device=self.device,
+            target_classes=_env_list("ML_DETECTOR_CLASSES") or None,
+            backend=os.environ.get("ML_DETECTOR_BACKEND", "torch"),
+            threads=_detector_threads(),
+            artifact_cache=self.artifact_cache,
+            calibration_dir=os.environ.get("ML_DETECTOR_CALIBRATION_DIR"),
+            calibration_frames=_env_int("ML_DETECTOR_CALIBRATION_FRAMES", 100),
+            drift_tolerance=_int8_drift_tolerance(),
+            aspect_ratios=_env_list("ML_DETECTOR_ASPECT_RATIOS"),
+        )
+        self.pose_estimator = PoseEstimator(
+            device=self.device,
+            max_sessions=_env_int("ML_POSE_MAX_SESSIONS", 32),
+            session_idle_timeout=_env_float("ML_POSE_SESSION_IDLE_S", 300.0),
+            crop_mode=_env_bool("ML_POSE_CROP"),
+            crop_size=_env_int("ML_POSE_CROP_SIZE", 256),
+            crop_margin=_env_float("ML_POSE_CROP_MARGIN", 0.25),
+            backend=pose_backend,
+            yolo_model_path=pose_model,
+        )
+        self.scene_analyzer = SceneAnalyzer(
+            device=self.device,
+            session_cache=(
+                SceneSessionCache(
+                    max_sessions=_env_int("ML_SCENE_CACHE_MAX_SESSIONS", 32),
+                    max_age=_env_float("ML_SCENE_CACHE_MAX_AGE_S", 5.0),
+                    drift_threshold=_env_float("ML_SCENE_CACHE_DRIFT", 8.0),
+                )
+                if _env_bool("ML_SCENE_CACHE")
+                else None
+            ),
+            thumbnail_widths=_scene_thumbnail_widths(),
+            lane_trackers=(
+                LaneTrackerPool(max_sessions=_env_int("ML_LANE_MAX_SESSIONS", 32))
+                if _env_bool("ML_LANE_TRACKING")
+                else None
+            ),
+        )
         self.riding_analyzer = RidingAnalyzer()
 
+        self.decode_policy = _decode_policy()
+
+        self.detection_batcher = None
+        if _env_bool("ML_BATCHING"):
+            self.detection_batcher = DetectionBatcher(
+                self.object_detector,
+                max_batch_size=_env_int("ML_BATCH_MAX_SIZE", 8),
+                window_ms=_env_float("ML_BATCH_WINDOW_MS", 5.0),
+                max_queue_wait_ms=_env_float("ML_BATCH_MAX_QUEUE_WAIT_MS", 1000.0),
+            )
+
+        self.stage_executor = None
+        if _env_bool("ML_PARALLEL_STAGES"):
+            self.stage_executor = ThreadPoolExecutor(
+                max_workers=_env_int("ML_STAGE_WORKERS", 3),
+                thread_name_prefix="ml-stage",
+            )
+
         self.stats = {
             "total_requests": 0,
             "successful_analyses": 0,
             "failed_analyses": 0,
             "average_processing_time": 0.0,
+            "parallel_stages": self.stage_executor is not None,
+            "stage_timings": {"detection": 0.0, "pose": 0.0, "scene": 0.0},
             "model_versions": self._get_model_versions(),
         }
 
@@ -66,7 +191,12 @@ class MLService:
     def _get_model_versions(self) -> Dict[str, str]:
         return {
             "object_detector": "YOLOv8n-1.0",
-            "pose_estimator": "MediaPipe-0.10.3",
+            "detector_backend": self.object_detector.backend,
+            "pose_estimator": (
+                "YOLOv8n-pose-1.0"
+                if self.pose_estimator.backend == "yolo"
+                else "MediaPipe-0.10.3"
+            ),
             "scene_analyzer": "Custom-1.0",
             "torch_version": torch.__version__,
             "service_version": "1.0.0",
@@ -74,19 +204,46 @@ class MLService:
 
     def analyze_frame(self, image_data: bytes, config: Dict[str, Any] = None) -> Dict[str, Any]:  # type: ignore
         start_time = time.time()
+
+        image, source_scale = self._decode_image(image_data, config)
+        if image is None:
+            self.stats["total_requests"] += 1
+            self.stats["failed_analyses"] += 1
+            raise ValueError("Failed to decode image data")
+
+        return self.analyze_image(image, config, start_time, source_scale)
+
+    def analyze_image(
+        self,
+        image: np.ndarray,
+        config: Optional[Dict[str, Any]] = None,
+        start_time: Optional[float] = None,
+        source_scale: float = 1.0,
+    ) -> Dict[str, Any]:
+        start_time = start_time or time.time()
         self.stats["total_requests"] += 1
 
         try:
-            image = self._decode_image(image_data)
-            if image is None:
-                raise ValueError("Failed to decode image data")
-
-            detections = self.object_detector.detect_objects(image)
-            pose_keypoints = self.pose_estimator.estimate_pose(image)
-            scene_analysis = self.scene_analyzer.analyze_scene(image)
+            config = config or {}
+            client_id = config.get("client_id")
+            class_ids = None
+            if config.get("classes"):
+                class_ids = self.object_detector.resolve_class_ids(config["classes"])
+
+            detections, pose_keypoints, scene_analysis, stage_timings = (
+                self._run_stages(image, client_id, class_ids, source_scale)
+            )
 
+            # Boxes are in decoded-frame pixels; score and report them in
+            # source pixels so the analyzer's thresholds do not depend on
+            # how far the upload was downscaled
+            source_detections = detections.scaled(source_scale)
             analysis_results = self.riding_analyzer.analyze_riding_technique(
-                image, detections, pose_keypoints, scene_analysis
+                image,
+                source_detections,
+                pose_keypoints,
+                scene_analysis,
+                image.shape[1] * source_scale,
             )
 
             processing_time = (
@@ -99,10 +256,13 @@ class MLService:
                 "posture_score": analysis_results["posture_score"],
                 "lane_score": analysis_results["lane_score"],
                 "speed_score": analysis_results["speed_score"],
-                "detections": self._format_detections(detections),
+                "detections": self._format_detections(source_detections),
+                "detector_input": self.object_detector.inference_cost(detections),
                 "pose_keypoints": self._format_pose_keypoints(pose_keypoints),
                 "scene_analysis": scene_analysis,
                 "processing_time": processing_time,
+                "stage_timings": stage_timings,
+                "frame_scale": source_scale,
                 "model_version": self.stats["model_versions"]["service_version"],
             }
 
@@ -117,57 +277,107 @@ class MLService:
             logger.error(traceback.format_exc())
             raise
 
-    def _decode_image(self, image_data: bytes) -> Optional[np.ndarray]:
-        try:
-            if isinstance(image_data, str):
-                image_data = base64.b64decode(image_data)
-
-            nparr = np.frombuffer(image_data, np.uint8)
+    def _run_stages(
+        self,
+        image: np.ndarray,
+        client_id: Optional[str] = None,
+        class_ids: Optional[List[int]] = None,
+        source_scale: float = 1.0,
+    ) -> Tuple[DetectionResult, Dict, Dict, Dict[str, float]]:
+        frame = FrameContext(image, source_scale)
+
+        def detect() -> DetectionResult:
+            return self.object_detector.detect_frame(
+                frame, class_ids, runner=self._detect_objects
+            )
 
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        def estimate_pose() -> Dict:
+            rider_box = None
+            if self.pose_estimator.crop_mode:
+                # Shares the detection stage's memoized result; in parallel
+                # mode this waits for it instead of running YOLO again
+                rider_box = self.object_detector.find_rider_box(detect())
+            return self.pose_estimator.estimate_pose(image, client_id, frame, rider_box)
+
+        stages = {
+            "detection": detect,
+            "pose": estimate_pose,
+            "scene": lambda: self.scene_analyzer.analyze_scene(
+                image, frame, client_id, detect
+            ),
+        }
+        timings: Dict[str, float] = {}
 
-            if image is None:
-                pil_image = Image.open(io.BytesIO(image_data))
-                image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+        if self.stage_executor is None:
+            results = {
+                name: self._timed_stage(name, stage, timings)
+                for name, stage in stages.items()
+            }
+        else:
+            futures = {
+                name: self.stage_executor.submit(
+                    self._timed_stage, name, stage, timings
+                )
+                for name, stage in stages.items()
+            }
+            results = {name: future.result() for name, future in futures.items()}
 
-            return image
+        self._update_stage_stats(timings)
+        return results["detection"], results["pose"], results["scene"], timings
 
-        except Exception as e:
-            logger.error(f"Image decoding failed: {e}")
-            return None
+    def _timed_stage(self, name: str, stage, timings: Dict[str, float]) -> Any:
+        start = time.perf_counter()
+        try:
+            return stage()
+        finally:
+            timings[name] = (time.perf_counter() - start) * 1000
+
+    def _update_stage_stats(self, timings: Dict[str, float]):
+        alpha = 0.1
+        stage_stats = self.stats["stage_timings"]
+        for name, elapsed in timings.items():
+            previous = stage_stats.get(name, 0.0)
+            stage_stats[name] = (
+                elapsed if previous == 0 else alpha * elapsed + (1 - alpha) * previous
+            )
 
-    def _format_detections(self, detections: List[Dict]) -> List[Dict]:
-        formatted = []
-        for det in detections:
-            formatted.append(
-                {
-                    "class": det["class_name"],
-                    "confidence": float(det["confidence"]),
-                    "bounding_box": {
-                        "x": float(det["bbox"][0]),
-                        "y": float(det["bbox"][1]),
-                        "width": float(det["bbox"][2] - det["bbox"][0]),
-                        "height": float(det["bbox"][3] - det["bbox"][1]),
-                    },
-                    "track_id": det.get("track_id", -1),
-                }
+    def _detect_objects(
+        self, image: np.ndarray, class_ids: Optional[List[int]] = None
+    ) -> DetectionResult:
+        if self.detection_batcher is not None:
+            return self.detection_batcher.detect(image, class_ids)
+        return self.object_detector.detect_objects(image, class_ids)
+
+    def _decode_image(
+        self, image_data: bytes, config: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Optional[np.ndarray], float]:
+        return decode_frame(image_data, self.decode_policy.with_overrides(config))
+
+    def _format_detections(self, detections: DetectionResult) -> List[Dict]:
+        boxes = detections.boxes.astype(np.float64)
+        return [
+            {
+                "class": class_name,
+                "confidence": confidence,
+                "bounding_box": {
+                    "x": x1,
+                    "y": y1,
+                    "width": x2 - x1,
+                    "height": y2 - y1,
+                },
+                "track_id": -1,
+            }
+            for (x1, y1, x2, y2), confidence, class_name in zip(
+                boxes.tolist(),
+                detections.scores.tolist(),
+                detections.class_names.tolist(),
             )
-        return formatted
+        ]
 
     def _format_pose_keypoints(self, pose_results: Dict) -> List[Dict]:
-        keypoints = []
         if pose_results and "landmarks" in pose_results:
-            for landmark_name, landmark_data in pose_results["landmarks"].items():
-                keypoints.append(
-                    {
-                        "name": landmark_name,
-                        "x": float(landmark_data["x"]),
-                        "y": float(landmark_data["y"]),
-                        "confidence": float(landmark_data.get("confidence", 0.0)),
-                        "visible": landmark_data.get("visible", True),
-                    }
-                )
-        return keypoints
+            return pose_results["landmarks"].to_keypoints()
+        return []
 
     def _update_performance_stats(self, processing_time: float):
         if self.stats["average_processing_time"] == 0:
@@ -187,6 +397,28 @@ class MLService:
             "stats": dict(self.stats),
             "memory_usage": self._get_memory_usage(),
             "gpu_usage": self._get_gpu_usage() if self.device == "cuda" else None,
+            "pose_sessions": (
+                self.pose_estimator.session_pool.get_stats()
+                if self.pose_estimator.backend == "mediapipe"
+                else None
+            ),
+            "detection_batching": (
+                self.detection_batcher.get_stats() if self.detection_batcher else None
+            ),
+            "lane_tracking": (
+                self.scene_analyzer.lane_trackers.get_stats()
+                if self.scene_analyzer.lane_trackers
+                else None
+            ),
+            "scene_cache": (
+                self.scene_analyzer.session_cache.get_stats()
+                if self.scene_analyzer.session_cache
+                else None
+            ),
+            "artifact_cache": (
+                self.artifact_cache.get_stats() if self.artifact_cache else None
+            ),
+            "detector_quantization": self.object_detector.quantization,
         }
 
     def _get_memory_usage(self) -> Dict[str, float]:
@@ -232,7 +464,22 @@ ml_service = None
 def initialize_ml_service():
     global ml_service
     try:
-        ml_service = MLService()
+        num_workers = _env_int("ML_WORKERS", 0)
+        if num_workers > 0:
+            ml_service = WorkerPoolService(
+                num_workers,
+                max_frame_pixels=_env_int("ML_WORKER_MAX_FRAME_PIXELS", 1920 * 1080),
+                request_timeout=_env_float("ML_WORKER_TIMEOUT_S", 30.0),
+                decode_policy=_decode_policy(),
+                max_restarts=_env_int("ML_WORKER_MAX_RESTARTS", 3),
+            )
+            # Stops the workers and unlinks the shared-memory segments on exit
+            atexit.register(ml_service.shutdown)
+            ml_service.wait_until_ready(
+                _env_float("ML_WORKER_STARTUP_TIMEOUT_S", 300.0)
+            )
+        else:
+            ml_service = MLService()
         logger.info("ML Service ready for requests")
     except Exception as e:
         logger.error(f"Failed to initialize ML service: {e}")
@@ -257,19 +504,56 @@ def health_check():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+def _parse_analyze_request() -> Tuple[Optional[Any], Dict[str, Any]]:
+    """Extract image payload and config from any supported /analyze encoding.
+
+    Binary clients send the JPEG bytes as ``application/octet-stream`` with the
+    config in ``X-Analysis-Config`` (JSON) or ``X-Client-ID``/``X-Timestamp``
+    headers, or as multipart with an ``image`` file and a ``config`` JSON part.
+    Legacy clients keep sending ``{"image_data": "<base64>"}``.
+    """
+    if request.mimetype == "application/octet-stream":
+        config = _config_from_headers()
+        return request.get_data(cache=False), config
+
+    if request.mimetype == "multipart/form-data":
+        image_file = request.files.get("image")
+        config_part = request.form.get("config")
+        config = json.loads(config_part) if config_part else _config_from_headers()
+        return (image_file.read() if image_file else None), config
+
+    data = request.get_json(silent=True)
+    if not data or "image_data" not in data:
+        return None, {}
+
+    return data["image_data"], data.get("config", {})
+
+
+def _config_from_headers() -> Dict[str, Any]:
+    raw_config = request.headers.get("X-Analysis-Config")
+    config = json.loads(raw_config) if raw_config else {}
+
+    client_id = request.headers.get("X-Client-ID")
+    if client_id:
+        config.setdefault("client_id", client_id)
+
+    timestamp = request.headers.get("X-Timestamp")
+    if timestamp:
+        config.setdefault("timestamp", int(timestamp))
+
+    return config
+
+
 @app.route("/analyze", methods=["POST"])
 def analyze_frame():
     try:
         if ml_service is None:
             return jsonify({"error": "ML service not initialized"}), 503
 
-        data = request.get_json()
-        if not data or "image_data" not in data:
+        image_data, config = _parse_analyze_request()
+        if not image_data:
             return jsonify({"error": "Missing image_data in request"}), 400
 
-        image_data = data["image_data"]
-        config = data.get("config", {})
-
         result = ml_service.analyze_frame(image_data, config)
 
         return jsonify(result), 200
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+
+import numpy as np
+
+from frame_decoder import DecodePolicy, decode_frame, fit_pixel_budget
+
+logger = logging.getLogger(__name__)
+
+# Read by OpenMP/MKL/OpenBLAS when they load, which in a spawned worker is
+# while it re-imports the parent's main module, before _worker_main runs
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+_env_lock = threading.Lock()
+
+
+@contextmanager
+def _environ(overrides: Dict[str, str]) -> Iterator[None]:
+    """Temporarily set environment variables, e.g. for a child to inherit."""
+    with _env_lock:
+        previous = {name: os.environ.get(name) for name in overrides}
+        os.environ.update(overrides)
+        try:
+            yield
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+class SharedFrameSlots:
+    """Fixed set of shared-memory buffers that decoded frames are copied into.
+
+    The supervisor owns the segments; workers attach by name and read frames
+    as zero-copy ndarray views, so only the slot index and shape are pickled.
+    """
+
+    def __init__(self, slot_count: int, slot_bytes: int):
+        self.slot_bytes = slot_bytes
+        self.segments = [
+            shared_memory.SharedMemory(create=True, size=slot_bytes)
+            for _ in range(slot_count)
+        ]
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for index in range(slot_count):
+            self._free.put(index)
+
+    @property
+    def names(self) -> List[str]:
+        return [segment.name for segment in self.segments]
+
+    def acquire(self, timeout: float) -> int:
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No free shared-memory frame slot")
+
+    def release(self, index: int):
+        self._free.put(index)
+
+    def write(self, index: int, image: np.ndarray) -> Tuple[int, ...]:
+        if image.nbytes > self.slot_bytes:
+            raise ValueError(
+                f"Frame of {image.nbytes} bytes exceeds shared-memory slot "
+                f"size of {self.slot_bytes} bytes"
+            )
+        view = np.ndarray(image.shape, dtype=np.uint8, buffer=self.segments[index].buf)
+        view[...] = image
+        return image.shape
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+
+
+def _worker_main(
+    worker_id: int,
+    slot_names: List[str],
+    task_queue: "mp.Queue",
+    result_queue: "mp.Queue",
+    threads: int,
+):
+    # OpenMP/MKL got their share through the spawn environment; torch and
+    # OpenCV size their own pools, which can still be changed at runtime
+    import cv2
+    import torch
+
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+    # Each worker builds its own models; importing server here keeps the
+    # parent free of torch/mediapipe state that must not be forked.
+    from server import MLService
+
+    service = MLService()
+    segments = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    result_queue.put(
+        (
+            "ready",
+            worker_id,
+            {
+                "device": service.device,
+                "model_versions": service.stats["model_versions"],
+            },
+        )
+    )
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        request_id, slot, shape, config, source_scale, deadline = task
+        if time.time() > deadline:
+            # The caller already gave up; don't spend a model pass on it
+            result_queue.put(
+                (
+                    request_id,
+                    worker_id,
+                    {"error": "Request expired in queue", "error_type": "TimeoutError"},
+                )
+            )
+            continue
+
+        result_queue.put(("started", worker_id, request_id))
+        image = np.ndarray(shape, dtype=np.uint8, buffer=segments[slot].buf)
+        try:
+            result = service.analyze_image(image, config, source_scale=source_scale)
+            result["worker_id"] = worker_id
+            result_queue.put((request_id, worker_id, result))
+        except Exception as e:
+            result_queue.put(
+                (
+                    request_id,
+                    worker_id,
+                    {"error": str(e), "error_type": type(e).__name__},
+                )
+            )
+        finally:
+            del image
+
+    for segment in segments:
+        segment.close()
+
+
+class WorkerPoolService:
+    """Drop-in replacement for MLService that fans frames out to N processes."""
+
+    def __init__(
+        self,
+        num_workers: int,
+        max_frame_pixels: int = 1920 * 1080,
+        slots_per_worker: int = 2,
+        request_timeout: float = 30.0,
+        decode_policy: Optional[DecodePolicy] = None,
+        max_restarts: int = 3,
+    ):
+        self.num_workers = max(1, num_workers)
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.decode_policy = decode_policy or DecodePolicy()
+        self.request_timeout = request_timeout
+        self.max_restarts = max_restarts
+        self.device = "unknown"
+
+        self._ctx = mp.get_context("spawn")
+        self.slots = SharedFrameSlots(
+            self.num_workers * slots_per_worker, max_frame_pixels * 3
+        )
+        self._task_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        self._pending: Dict[int, Future] = {}
+        # Slots stay taken until a worker is done with the frame, even when
+        # the caller has timed out, so a stale task never reads a reused slot
+        self._slot_of: Dict[int, int] = {}
+        self._worker_task: Dict[int, int] = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._ready = threading.Event()
+        self._ready_workers: set = set()
+        # Consecutive exits of each worker without reaching "ready"
+        self._failed_starts = [0] * self.num_workers
+        self._startup_error: Optional[str] = None
+        self._running = True
+
+        self.stats = {
+            "total_requests": 0,
+            "successful_analyses": 0,
+            "failed_analyses": 0,
+            "average_processing_time": 0.0,
+            "worker_restarts": 0,
+            "frames_per_worker": {},
+            "model_versions": {},
+        }
+        self._stats_lock = threading.Lock()
+
+        self.workers: List[Optional[mp.Process]] = [None] * self.num_workers
+        for worker_id in range(self.num_workers):
+            self._start_worker(worker_id)
+
+        self._collector = threading.Thread(
+            target=self._collect_results, name="worker-results", daemon=True
+        )
+        self._collector.start()
+
+        logger.info(f"WorkerPoolService started with {self.num_workers} workers")
+
+    def _start_worker(self, worker_id: int):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                worker_id,
+                self.slots.names,
+                self._task_queue,
+                self._result_queue,
+                self.threads_per_worker,
+            ),
+            name=f"ml-worker-{worker_id}",
+            daemon=True,
+        )
+        threads = str(self.threads_per_worker)
+        with _environ({name: threads for name in _THREAD_ENV_VARS}):
+            process.start()
+        self.workers[worker_id] = process
+
+    def wait_until_ready(self, timeout: Optional[float] = None):
+        """Block until every worker has loaded its models.
+
+        Raises RuntimeError when a worker keeps failing to start and
+        TimeoutError when the pool is not ready within ``timeout`` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._ready.wait(0.5):
+            if self._startup_error is not None:
+                raise RuntimeError(self._startup_error)
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"ML workers not ready after {timeout}s "
+                    f"({len(self._ready_workers)}/{self.num_workers} ready)"
+                )
+
+    def analyze_frame(self, image_data: bytes, config: Dict[str, Any] = None) -> Dict[str, Any]:  # type: ignore
+        image, source_scale = decode_frame(
+            image_data, self.decode_policy.with_overrides(config)
+        )
+        if image is None:
+            with self._stats_lock:
+                self.stats["total_requests"] += 1
+            self._record_failure()
+            raise ValueError("Failed to decode image data")
+
+        return self.analyze_image(image, config, source_scale)
+
+    def analyze_image(
+        self,
+        image: np.ndarray,
+        config: Optional[Dict[str, Any]] = None,
+        source_scale: float = 1.0,
+    ) -> Dict[str, Any]:
+        start_time = time.time()
+        with self._stats_lock:
+            self.stats["total_requests"] += 1
+
+        # Uploads larger than a slot are downscaled rather than rejected
+        if image.nbytes > self.slots.slot_bytes:
+            pixels = image.shape[0] * image.shape[1]
+            fitted = fit_pixel_budget(
+                image, self.slots.slot_bytes // (image.nbytes // pixels)
+            )
+            source_scale *= image.shape[1] / fitted.shape[1]
+            image = fitted
+
+        slot = self.slots.acquire(timeout=self.request_timeout)
+        try:
+            shape = self.slots.write(slot, np.ascontiguousarray(image))
+        except ValueError:
+            self.slots.release(slot)
+            self._record_failure()
+            raise
+
+        request_id = next(self._request_ids)
+        future: Future = Future()
+        with self._pending_lock:
+            self._pending[request_id] = future
+            self._slot_of[request_id] = slot
+
+        deadline = time.time() + self.request_timeout
+        self._task_queue.put(
+            (request_id, slot, shape, config or {}, source_scale, deadline)
+        )
+        try:
+            result = future.result(timeout=self.request_timeout)
+        except FutureTimeoutError:
+            self._record_failure()
+            raise TimeoutError(
+                f"Worker analysis timed out after {self.request_timeout}s"
+            )
+        finally:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+
+        if "error" in result:
+            self._record_failure()
+            if result.get("error_type") == "ValueError":
+                raise ValueError(result["error"])
+            raise RuntimeError(f"Worker analysis failed: {result['error']}")
+
+        processing_time = (time.time() - start_time) * 1000
+        with self._stats_lock:
+            self.stats["successful_analyses"] += 1
+            self._update_performance_stats(processing_time)
+            per_worker = self.stats["frames_per_worker"]
+            per_worker[result["worker_id"]] = per_worker.get(result["worker_id"], 0) + 1
+
+        return result
+
+    def _record_failure(self):
+        with self._stats_lock:
+            self.stats["failed_analyses"] += 1
+
+    def _update_performance_stats(self, processing_time: float):
+        if self.stats["average_processing_time"] == 0:
+            self.stats["average_processing_time"] = processing_time
+        else:
+            alpha = 0.1
+            self.stats["average_processing_time"] = (
+                alpha * processing_time
+                + (1 - alpha) * self.stats["average_processing_time"]
+            )
+
+    def _collect_results(self):
+        while self._running:
+            try:
+                request_id, worker_id, payload = self._result_queue.get(timeout=1.0)
+            except queue.Empty:
+                self._restart_dead_workers()
+                continue
+            except (EOFError, OSError):
+                break
+
+            if request_id == "started":
+                with self._pending_lock:
+                    self._worker_task[worker_id] = payload
+                continue
+
+            if request_id == "ready":
+                self._ready_workers.add(worker_id)
+                self._failed_starts[worker_id] = 0
+                self.device = payload["device"]
+                self.stats["model_versions"] = payload["model_versions"]
+                logger.info(f"ML worker {worker_id} ready")
+                if len(self._ready_workers) == self.num_workers:
+                    self._ready.set()
+                continue
+
+            self._finish_task(request_id, worker_id, payload)
+
+    def _finish_task(
+        self, request_id: int, worker_id: Optional[int], payload: Dict[str, Any]
+    ):
+        with self._pending_lock:
+            future = self._pending.get(request_id)
+            slot = self._slot_of.pop(request_id, None)
+            if worker_id is not None and self._worker_task.get(worker_id) == request_id:
+                del self._worker_task[worker_id]
+        if slot is not None:
+            self.slots.release(slot)
+        if future is not None and not future.done():
+            future.set_result(payload)
+
+    def _restart_dead_workers(self):
+        for worker_id, process in enumerate(self.workers):
+            if not self._running or process is None or process.is_alive():
+                continue
+
+            if worker_id in self._ready_workers:
+                self._ready_workers.discard(worker_id)
+            else:
+                self._failed_starts[worker_id] += 1
+
+            # The task it was running will never report back
+            with self._pending_lock:
+                request_id = self._worker_task.pop(worker_id, None)
+            if request_id is not None:
+                self._finish_task(
+                    request_id,
+                    None,
+                    {"error": "Worker process died", "error_type": "RuntimeError"},
+                )
+
+            # A worker that cannot even load its models (missing weights, bad
+            # backend config) would otherwise be respawned forever
+            if self._failed_starts[worker_id] > self.max_restarts:
+                self._startup_error = (
+                    f"ML worker {worker_id} failed to start "
+                    f"{self._failed_starts[worker_id]} times in a row "
+                    f"(exit code {process.exitcode})"
+                )
+                logger.error(f"{self._startup_error}; not restarting it")
+                self.workers[worker_id] = None
+                continue
+
+            logger.error(
+                f"ML worker {worker_id} exited with code {process.exitcode}, "
+                "restarting"
+            )
+            with self._stats_lock:
+                self.stats["worker_restarts"] += 1
+            self._start_worker(worker_id)
+
+    def get_health_status(self) -> Dict[str, Any]:
+        alive = sum(1 for p in self.workers if p is not None and p.is_alive())
+        with self._pending_lock:
+            pending_requests = len(self._pending)
+        with self._stats_lock:
+            stats = dict(self.stats)
+            stats["frames_per_worker"] = dict(self.stats["frames_per_worker"])
+        return {
+            "status": "healthy" if alive == self.num_workers else "degraded",
+            "device": self.device,
+            "models_loaded": self._ready.is_set(),
+            "workers": {
+                "configured": self.num_workers,
+                "alive": alive,
+                "threads_per_worker": self.threads_per_worker,
+            },
+            "pending_requests": pending_requests,
+            "stats": stats,
+        }
+
+    def shutdown(self):
+        if not self._running:
+            return
+        self._running = False
+        for _ in self.workers:
+            self._task_queue.put(None)
+        for process in self.workers:
+            if process is not None:
+                process.join(timeout=5.0)
+                if process.is_alive():
+                    process.terminate()
+        self.slots.close()
+        logger.info("WorkerPoolService stopped")
@@ -6,6 +6,7 @@ import (
 	"fmt"
 	"io"
 	"net/http"
+	"strconv"
 	"time"
 
 	"github.com/san-kum/motorcycle-cv/server/models"
@@ -24,6 +25,9 @@ type ClientConfig struct {
 	MaxRetries          int
 	RetryDelay          time.Duration
 	HealthCheckInterval time.Duration
+	// BinaryTransport posts raw JPEG bytes as application/octet-stream
+	// instead of base64-encoding them inside a JSON body.
+	BinaryTransport bool
 }
 
 type AnalysisRequest struct {
@@ -83,6 +87,7 @@ func NewClient(baseURL string, logger *zap.Logger) (*Client, error) {
 		MaxRetries:          3,
 		RetryDelay:          1 * time.Second,
 		HealthCheckInterval: 30 * time.Second,
+		BinaryTransport:     true,
 	}
 
 	client := &Client{
@@ -138,18 +143,17 @@ func (c *Client) AnalyzeFrame(request *models.FrameRequest) (*models.AnalysisRes
 }
 
 func (c *Client) executeAnalysisRequest(request *AnalysisRequest) (*models.AnalysisResult, error) {
-	requestData, err := json.Marshal(request)
-	if err != nil {
-		return nil, fmt.Errorf("failed to marshal request: %w", err)
+	var httpRequest *http.Request
+	var err error
+	if c.config.BinaryTransport {
+		httpRequest, err = c.newBinaryAnalysisRequest(request)
+	} else {
+		httpRequest, err = c.newJSONAnalysisRequest(request)
 	}
-
-	url := fmt.Sprintf("%s/analyze", c.baseURL)
-	httpRequest, err := http.NewRequest("POST", url, bytes.NewBuffer(requestData))
 	if err != nil {
-		return nil, fmt.Errorf("failed to create request: %w", err)
+		return nil, err
 	}
 
-	httpRequest.Header.Set("Content-Type", "application/json")
 	httpRequest.Header.Set("User-Agent", "motorcycle-feedback-system/1.0")
 
 	response, err := c.httpClient.Do(httpRequest)
@@ -172,6 +176,43 @@ func (c *Client) executeAnalysisRequest(request *AnalysisRequest) (*models.Analy
 	return c.convertMLResponse(&mlResponse), nil
 }
 
+func (c *Client) newJSONAnalysisRequest(request *AnalysisRequest) (*http.Request, error) {
+	requestData, err := json.Marshal(request)
+	if err != nil {
+		return nil, fmt.Errorf("failed to marshal request: %w", err)
+	}
+
+	url := fmt.Sprintf("%s/analyze", c.baseURL)
+	httpRequest, err := http.NewRequest("POST", url, bytes.NewBuffer(requestData))
+	if err != nil {
+		return nil, fmt.Errorf("failed to create request: %w", err)
+	}
+
+	httpRequest.Header.Set("Content-Type", "application/json")
+	return httpRequest, nil
+}
+
+func (c *Client) newBinaryAnalysisRequest(request *AnalysisRequest) (*http.Request, error) {
+	url := fmt.Sprintf("%s/analyze", c.baseURL)
+	httpRequest, err := http.NewRequest("POST", url, bytes.NewReader(request.ImageData))
+	if err != nil {
+		return nil, fmt.Errorf("failed to create request: %w", err)
+	}
+
+	httpRequest.Header.Set("Content-Type", "application/octet-stream")
+	httpRequest.Header.Set("X-Timestamp", strconv.FormatInt(request.Timestamp, 10))
+
+	if len(request.Config) > 0 {
+		configData, err := json.Marshal(request.Config)
+		if err != nil {
+			return nil, fmt.Errorf("failed to marshal config: %w", err)
+		}
+		httpRequest.Header.Set("X-Analysis-Config", string(configData))
+	}
+
+	return httpRequest, nil
+}
+
 func (c *Client) convertMLResponse(mlResp *AnalysisResponse) *models.AnalysisResult {
 	result := &models.AnalysisResult{
 		OverallScore:   mlResp.OverallScore,